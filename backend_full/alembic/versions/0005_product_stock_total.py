@@ -0,0 +1,36 @@
+"""materialized per-product stock totals
+
+Revision ID: 0005_product_stock_total
+Revises: 5012f843c2f3
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005_product_stock_total"
+down_revision = "5012f843c2f3"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "product_stock_total",
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("product.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("quantity", sa.DECIMAL(18, 6), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(), nullable=False, server_default=sa.func.now()),
+        comment="ProductStockTotal table",
+    )
+    op.execute(
+        """
+        INSERT INTO product_stock_total (product_id, quantity, updated_at)
+        SELECT product_id, COALESCE(SUM(quantity), 0), now()
+        FROM stock
+        GROUP BY product_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_table("product_stock_total")
@@ -0,0 +1,21 @@
+"""index for the sale event reconcile queue
+
+Revision ID: 0006_sale_event_queue_index
+Revises: 0005_product_stock_total
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+
+revision = "0006_sale_event_queue_index"
+down_revision = "0005_product_stock_total"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_sale_event_status_location", "sale_event", ["status", "location_id", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_sale_event_status_location", table_name="sale_event")
@@ -0,0 +1,34 @@
+"""store recipe quantities in the component's unit
+
+Revision ID: 0007_component_base_units
+Revises: 0006_sale_event_queue_index
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+
+revision = "0007_component_base_units"
+down_revision = "0006_sale_event_queue_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The simple catalog saved recipes with the parent's unit while meaning the
+    # component's base unit; recipe units without a conversion now fail the sale
+    op.execute(
+        """
+        UPDATE composite_component
+        SET unit_id = (SELECT base_unit_id FROM product WHERE product.id = composite_component.component_product_id)
+        WHERE unit_id <> (SELECT base_unit_id FROM product WHERE product.id = composite_component.component_product_id)
+          AND NOT EXISTS (
+            SELECT 1 FROM product_unit
+            WHERE product_unit.product_id = composite_component.component_product_id
+              AND product_unit.unit_id = composite_component.unit_id
+          )
+        """
+    )
+
+
+def downgrade():
+    pass
@@ -0,0 +1,29 @@
+"""per-location error counters of the ingest worker
+
+Revision ID: 0008_ingest_location_error
+Revises: 0007_component_base_units
+Create Date: 2026-10-18
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_ingest_location_error"
+down_revision = "0007_component_base_units"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "ingest_location_error",
+        sa.Column("location_id", sa.Integer(), sa.ForeignKey("location.id"), primary_key=True),
+        sa.Column("errors", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("last_error_at", sa.DateTime(), nullable=True),
+        comment="IngestLocationError table",
+    )
+
+
+def downgrade():
+    op.drop_table("ingest_location_error")
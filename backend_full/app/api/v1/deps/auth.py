@@ -1,11 +1,15 @@
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional, Union
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from app.config import get_settings
-from app.infrastructure.db.session import SessionLocal
-from app.models.models import User, Role, Permission, UserRole, RolePermission
+from app.infrastructure.db.session import SessionLocal, get_async_read_sessionmaker, get_async_sessionmaker, read_router
+from app.models.models import User
+from app.security.permissions import PermissionSet, resolve_permissions
+from app.security.principals import Principal, get_principal
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/token")
 
@@ -18,7 +22,50 @@ def get_db() -> Session:
         db.close()
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+async def get_async_db() -> AsyncIterator[Union[AsyncSession, Session]]:
+    """Session for ``async def`` routes, to be used through ``run_sync``.
+
+    With DATABASE_ASYNC on this is an ``AsyncSession`` on the asyncio driver,
+    otherwise a regular session whose work runs in the threadpool.
+    """
+    if get_settings().database_async:
+        async with get_async_sessionmaker()() as session:
+            yield session
+        return
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+
+def get_read_db() -> Session:
+    """Session for read-only routes that tolerate replication lag.
+
+    Uses DATABASE_READ_URL while the replica is reachable and within
+    DATABASE_READ_MAX_LAG_SECONDS, otherwise the primary. Never write through it.
+    """
+    db = read_router.sessionmaker()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_read_db() -> AsyncIterator[Union[AsyncSession, Session]]:
+    """``get_read_db`` for ``async def`` routes, to be used through ``run_sync``."""
+    if get_settings().database_async:
+        async with get_async_read_sessionmaker()() as session:
+            yield session
+        return
+    db = read_router.sessionmaker()()
+    try:
+        yield db
+    finally:
+        await run_in_threadpool(db.close)
+
+
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Principal:
     settings = get_settings()
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials"
@@ -30,36 +77,20 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.username == username, User.is_active == True).first()  # noqa: E712
+    user = get_principal(db, username)
     if user is None:
         raise credentials_exception
     return user
 
 
+def get_user_permissions(user=Depends(get_current_user), db: Session = Depends(get_db)) -> PermissionSet:
+    """Permission set of the current user, resolved once per request."""
+    return resolve_permissions(user, db)
+
+
 def has_permission(user: User, permission: str, location_id: int | None = None, db: Session | None = None) -> bool:
     """Check if user has a specific permission"""
-    # Check if user ID is in super admin IDs
-    settings = get_settings()
-    # DEBUG: Print super admin IDs and current user ID
-    print(f"DEBUG: Current user ID: {user.id}, Super admin IDs: {settings.super_admin_ids}")
-
-    if user.id in settings.super_admin_ids:
-        print(f"DEBUG: User {user.id} is a super admin")
-        return True
-
-    role_ids = [ur.role_id for ur in db.query(UserRole).filter(UserRole.user_id == user.id).all()]
-    permissions = (
-        db.query(Permission.code, Role.scope, Role.location_id)
-        .join(RolePermission, RolePermission.permission_id == Permission.id)
-        .join(Role, Role.id == RolePermission.role_id)
-        .filter(Role.id.in_(role_ids))
-        .all()
-    )
-    for code, scope, loc in permissions:
-        if code == permission:
-            if scope == "global" or loc == location_id:
-                return True
-    return False
+    return resolve_permissions(user, db).allows(permission, location_id)
 
 
 def check_permission(user: User, permission: str, location_id: int | None = None, db: Session | None = None) -> None:
@@ -72,10 +103,10 @@ class PermissionChecker:
         self.permissions = permissions
         self.location_id = location_id
 
-    def __call__(self, user=Depends(get_current_user), db: Session = Depends(get_db)):
+    def __call__(self, user=Depends(get_current_user), permissions: PermissionSet = Depends(get_user_permissions)):
         # Check if user has any of the required permissions
         for perm in self.permissions:
-            if has_permission(user, perm, self.location_id, db):
+            if permissions.allows(perm, self.location_id):
                 return user
 
         raise HTTPException(status_code=403, detail="Permission denied")
@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
-from app.api.v1.deps.auth import get_db, PermissionChecker, allow_public
-from app.services.catalog_service import CatalogService
+from app.api.v1.deps.auth import get_async_db, get_db, PermissionChecker, allow_public
+from app.common.etag import Representation, conditional_response
+from app.infrastructure.db.session import run_sync
+from app.services.catalog_service import CatalogService, cached_catalog
 
 router = APIRouter(prefix="/catalog", tags=["catalog"])
 
 
+def _catalog_representation(db: Session, location: int) -> Representation:
+    return CatalogService(db).catalog_representation(location)
+
+
 @router.get("")
-def get_catalog(location: int = Query(...), user=Depends(PermissionChecker(["catalog.read"])), db: Session = Depends(get_db)):
-    service = CatalogService(db)
-    return {"location_id": location, "items": service.catalog_for_location(location)}
+async def get_catalog(request: Request, location: int = Query(...), user=Depends(PermissionChecker(["catalog.read"])), db=Depends(get_async_db)):
+    # Cached catalogs are served, or answered with 304, from the event loop without touching the database.
+    # Misses are rebuilt on the primary: a lagging replica would keep a pre-write catalog cached for the TTL
+    representation = cached_catalog(location) or await run_sync(db, _catalog_representation, location)
+    return conditional_response(request, representation)
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from app.api.v1.deps.auth import PermissionChecker, get_db
+from app.audit.request_log_writer import request_log_writer
+from app.infrastructure.db.pool import pool_metrics
+from app.services import ingest_queue
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/request-log")
+def request_log_metrics(user=Depends(PermissionChecker(["metrics.read"]))):
+    return request_log_writer.stats()
+
+
+@router.get("/ingest")
+def ingest_metrics(user=Depends(PermissionChecker(["metrics.read"])), db: Session = Depends(get_db)):
+    return ingest_queue.lag_metrics(db)
+
+
+@router.get("/db")
+def db_metrics(user=Depends(PermissionChecker(["metrics.read"]))):
+    return pool_metrics()
@@ -1,46 +1,67 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from typing import BinaryIO
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.api.v1.deps.auth import get_db
-from app.security.hmac import verify_hmac_signature
-from app.models.models import Terminal
+from app.api.v1.deps.auth import get_async_db
+from app.config import get_settings
+from app.common.json_stream import JSONStreamError, iter_array_items
+from app.infrastructure.db.session import run_sync
+from app.security.hmac import SignedBody, TerminalRecord, hmac_dependency, hmac_stream_dependency
 from app.services.sales_service import SalesService
 
 router = APIRouter(prefix="/sales", tags=["sales"])
 
 
-@router.post("")
-async def submit_sale(
-    request: Request,
-    payload: dict,
-    x_terminal_id: str = Header(..., alias="X-Terminal-ID"),
-    x_signature: str = Header(..., alias="X-Signature"),
-    x_timestamp: str = Header(..., alias="X-Timestamp"),
-    db: Session = Depends(get_db),
-):
-    verify_hmac_signature(request.method, request.url.path, await request.body(), x_terminal_id, x_signature, x_timestamp)
-    terminal = db.query(Terminal).filter_by(terminal_id=x_terminal_id).first()
-    if not terminal:
-        raise HTTPException(status_code=401, detail="Unknown terminal")
-    service = SalesService(db)
-    sale = service.ingest_sale(payload["event_id"], terminal.id, terminal.location_id, payload["lines"])
+def _ingest_sale(db: Session, terminal: TerminalRecord, payload: dict) -> dict:
+    sale = SalesService(db).ingest_sale(payload["event_id"], terminal.id, terminal.location_id, payload["lines"])
     db.commit()
     return {"event_id": sale.event_id, "status": sale.status}
 
 
-@router.post("/daily-log")
-async def daily_log(
-    request: Request,
-    payload: dict,
-    x_terminal_id: str = Header(..., alias="X-Terminal-ID"),
-    x_signature: str = Header(..., alias="X-Signature"),
-    x_timestamp: str = Header(..., alias="X-Timestamp"),
-    db: Session = Depends(get_db),
-):
-    verify_hmac_signature(request.method, request.url.path, await request.body(), x_terminal_id, x_signature, x_timestamp)
-    terminal = db.query(Terminal).filter_by(terminal_id=x_terminal_id).first()
-    if not terminal:
-        raise HTTPException(status_code=401, detail="Unknown terminal")
-    service = SalesService(db)
-    result = service.reconcile_daily(terminal.id, terminal.location_id, payload["events"])
+def _ingest_batch(db: Session, terminal: TerminalRecord, body: BinaryIO) -> dict:
+    events = iter_array_items(body, "events")
+    try:
+        results = SalesService(db).ingest_batch(terminal.id, terminal.location_id, events)
+    except JSONStreamError as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Invalid batch: {exc}")
+    db.commit()
+    return {"results": results}
+
+
+def _enqueue_daily(db: Session, terminal: TerminalRecord, body: BinaryIO) -> dict:
+    # Queue mode: store the events as pending and leave the stock to the reconcile worker
+    result = _ingest_batch(db, terminal, body)
+    return {"status": "queued", **result}
+
+
+def _reconcile_daily(db: Session, terminal: TerminalRecord, body: BinaryIO) -> dict:
+    # Events are decoded one at a time from the spooled body while the batches are reconciled
+    events = iter_array_items(body, "events")
+    try:
+        result = SalesService(db).reconcile_daily(terminal.id, terminal.location_id, events)
+    except JSONStreamError as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Invalid daily log: {exc}")
     db.commit()
     return result
+
+
+@router.post("")
+async def submit_sale(payload: dict, terminal: TerminalRecord = Depends(hmac_dependency), db=Depends(get_async_db)):
+    return await run_sync(db, _ingest_sale, terminal, payload)
+
+
+@router.post("/batch")
+async def submit_sales_batch(signed: SignedBody = Depends(hmac_stream_dependency), db=Depends(get_async_db)):
+    """Ingest ``{"events": [...]}`` under one signature; returns a status per event, in order."""
+    return await run_sync(db, _ingest_batch, signed.terminal, signed.body)
+
+
+@router.post("/daily-log")
+async def daily_log(signed: SignedBody = Depends(hmac_stream_dependency), db=Depends(get_async_db)):
+    """Reconcile a terminal's day; the body is ``{"events": [...]}`` and is never buffered whole.
+
+    With SALES_INGEST_MODE=queue the events are only stored and the response does not wait for stock.
+    """
+    handler = _enqueue_daily if get_settings().sales_ingest_mode == "queue" else _reconcile_daily
+    return await run_sync(db, handler, signed.terminal, signed.body)
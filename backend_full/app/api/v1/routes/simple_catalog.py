@@ -1,13 +1,24 @@
+import base64
+import json
 import logging
 from decimal import Decimal
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func, text
+from typing import Callable, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import text, exists
 
-from app.api.v1.deps.auth import get_db, get_current_user, PermissionChecker, allow_public
+from app.api.v1.deps.auth import get_async_read_db, get_db, get_read_db, get_current_user, PermissionChecker, allow_public
+from app.infrastructure.db.session import run_sync
 from app.models import models
 from app.schemas import simple as schemas
+from app.services import stock_totals
+from app.services.bom import BomExpander
+from app.services.locations import default_location_id
+from app.services.stock_service import StockService
+from app.services.units import UnitConverter
+from app.common.cache import TTLCache, invalidate_on_commit, touch
+from app.common.etag import Representation, conditional_response
+from app.common.errors import ValidationError
 
 from app.models.models import AttributeDefinition, ProductAttributeValue, Location, ProductUnit
 from app.config import get_settings
@@ -17,31 +28,40 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/simple-catalog", tags=["simple-catalog"])
 
 
-def _default_location(db: Session) -> models.Location:
-    settings = get_settings()
-    # Сначала пытаемся найти склад с ID из настроек
-    loc = db.query(models.Location).filter(models.Location.id == settings.default_location_id).first()
-    if loc:
-        return loc
-
-    # Если склад с заданным ID не найден, пробуем найти по имени
-    loc = db.query(models.Location).filter(models.Location.name == settings.default_location_name).first()
-    if loc:
-        return loc
-
-    # Если ни по ID, ни по имени не найден, используем первый склад
-    loc = db.query(models.Location).first()
-    if not loc:
-        # Если вообще нет складов, создаем первый
-        loc = models.Location(name=settings.default_location_name, kind="warehouse")
-        db.add(loc)
-        db.flush()
-    return loc
+# Serialized reference lists polled by the admin and terminals, keyed by resource name
+_reference_cache = TTLCache(ttl_seconds=get_settings().reference_cache_ttl_seconds, maxsize=16)
+
+
+def _reference_response(request: Request, db: Session, resource: str, build: Callable[[Session], list]) -> Response:
+    """Serve a cached reference list, or ``304`` when the client's ETag is still current."""
+    representation = _reference_cache.get(resource)
+    if representation is None:
+        version = _reference_cache.version
+        representation = Representation.of(build(db))
+        _reference_cache.set(resource, representation, version=version)
+    return conditional_response(request, representation)
+
+
+def _invalidate_references(resources: Optional[set] = None) -> None:
+    if resources is None:
+        _reference_cache.clear()
+        return
+    for resource in resources:
+        _reference_cache.invalidate(resource)
+
+
+invalidate_on_commit(models.Unit, callback=_invalidate_references, key=lambda _: "units")
+invalidate_on_commit(models.ProductType, AttributeDefinition, callback=_invalidate_references, key=lambda _: "product_types")
+invalidate_on_commit(models.Location, callback=_invalidate_references, key=lambda _: "locations")
 
 
 # Units
 @router.get("/units/", response_model=List[schemas.Unit])
-def get_units(user=Depends(PermissionChecker(["unit.read"])), db: Session = Depends(get_db)):
+def get_units(request: Request, user=Depends(PermissionChecker(["unit.read"])), db: Session = Depends(get_db)):
+    return _reference_response(request, db, "units", _units)
+
+
+def _units(db: Session) -> List[schemas.Unit]:
     units = db.query(models.Unit).all()
     return [
         schemas.Unit(
@@ -82,77 +102,60 @@ def create_unit(unit: schemas.UnitCreate, user=Depends(PermissionChecker(["unit.
 
 # Product types
 @router.get("/product-types/", response_model=List[schemas.ProductType])
-def get_product_types(user=Depends(PermissionChecker(["product_type.read"])), db: Session = Depends(get_db)):
-    types = db.query(models.ProductType).all()
-    result = []
-    for t in types:
-        attrs = db.query(models.AttributeDefinition).filter(models.AttributeDefinition.product_type_id == t.id).all()
-        result.append(
-            schemas.ProductType(
-                id=t.id,
-                name=t.name,
-                description=t.description,
-                is_composite=t.is_composite,
-                attributes=attrs,
-            )
+def get_product_types(request: Request, user=Depends(PermissionChecker(["product_type.read"])), db: Session = Depends(get_db)):
+    return _reference_response(request, db, "product_types", _product_types)
+
+
+def _product_types(db: Session) -> List[schemas.ProductType]:
+    # Types and all their attribute definitions in two queries
+    types = db.query(models.ProductType).options(selectinload(models.ProductType.attributes)).order_by(models.ProductType.id)
+    return [_product_type_schema(t) for t in types]
+
+
+def _product_type_schema(t: models.ProductType) -> schemas.ProductType:
+    return schemas.ProductType(
+        id=t.id,
+        name=t.name,
+        description=t.description,
+        is_composite=t.is_composite,
+        attributes=t.attributes,
+    )
+
+
+def _attribute_definitions(attributes: List[schemas.AttributeDefinitionCreate]) -> List[models.AttributeDefinition]:
+    return [
+        models.AttributeDefinition(
+            name=attr_data.name,
+            code=attr_data.code,
+            data_type=attr_data.data_type,
+            unit_id=attr_data.unit_id,
+            is_required=attr_data.is_required,
         )
-    return result
+        for attr_data in attributes
+    ]
 
 
 @router.get("/product-types/{product_type_id}", response_model=schemas.ProductType)
-def get_product_type(product_type_id: int, user=Depends(PermissionChecker(["product_type.read"])), db: Session = Depends(get_db)):
-    t = db.query(models.ProductType).get(product_type_id)
+def get_product_type(product_type_id: int, user=Depends(PermissionChecker(["product_type.read"])), db: Session = Depends(get_read_db)):
+    t = (
+        db.query(models.ProductType)
+        .options(selectinload(models.ProductType.attributes))
+        .filter(models.ProductType.id == product_type_id)
+        .first()
+    )
     if not t:
         raise HTTPException(status_code=404, detail="Product type not found")
-    attrs = db.query(models.AttributeDefinition).filter(models.AttributeDefinition.product_type_id == t.id).all()
-    return schemas.ProductType(id=t.id, name=t.name, description=t.description, is_composite=t.is_composite, attributes=attrs)
+    return _product_type_schema(t)
 
 
 @router.post("/product-types/", response_model=schemas.ProductType)
 def create_product_type(payload: schemas.ProductTypeCreate, user=Depends(PermissionChecker(["product_type.write"])), db: Session = Depends(get_db)):
     t = models.ProductType(name=payload.name, description=payload.description, is_composite=payload.is_composite)
+    # Definitions are inserted with the type in a single flush
+    t.attributes = _attribute_definitions(payload.attributes)
     db.add(t)
-    db.flush()  # Get the ID before committing
-
-    # Create attributes if provided
-    created_attributes = []
-    if hasattr(payload, 'attributes') and payload.attributes:
-        for attr_data in payload.attributes:
-            unit_id = None
-            if attr_data.unit_code:
-                unit = db.query(models.Unit).filter(models.Unit.code == attr_data.unit_code).first()
-                if unit:
-                    unit_id = unit.id
-
-            attr = models.AttributeDefinition(
-                product_type_id=t.id,
-                name=attr_data.name,
-                code=attr_data.code,
-                data_type=attr_data.data_type,
-                unit_id=unit_id,
-                is_required=attr_data.is_required
-            )
-            db.add(attr)
-            db.flush()
-            created_attributes.append(attr)
-
     db.commit()
-    db.refresh(t)
-
-    # Refresh attributes
-    for attr in created_attributes:
-        db.refresh(attr)
-
-    # Get all attributes for this product type
-    attrs = db.query(models.AttributeDefinition).filter(models.AttributeDefinition.product_type_id == t.id).all()
-
-    return schemas.ProductType(
-        id=t.id,
-        name=t.name,
-        description=t.description,
-        is_composite=t.is_composite,
-        attributes=attrs
-    )
+    return _product_type_schema(t)
 
 
 @router.put("/product-types/{product_type_id}", response_model=schemas.ProductType)
@@ -183,46 +186,12 @@ def update_product_type(product_type_id: int, payload: schemas.ProductTypeUpdate
     db.query(models.AttributeDefinition).filter(
         models.AttributeDefinition.product_type_id == product_type_id
     ).delete()
+    touch(db, models.AttributeDefinition)
 
-    # Create new attributes
-    created_attributes = []
-    if hasattr(payload, 'attributes') and payload.attributes:
-        for attr_data in payload.attributes:
-            unit_id = None
-            if attr_data.unit_code:
-                unit = db.query(models.Unit).filter(models.Unit.code == attr_data.unit_code).first()
-                if unit:
-                    unit_id = unit.id
-
-            attr = models.AttributeDefinition(
-                product_type_id=product_type_id,
-                name=attr_data.name,
-                code=attr_data.code,
-                data_type=attr_data.data_type,
-                unit_id=unit_id,
-                is_required=attr_data.is_required
-            )
-            db.add(attr)
-            db.flush()
-            created_attributes.append(attr)
-
+    # The old definitions are gone already; the new ones are inserted by the commit's flush
+    t.attributes = _attribute_definitions(payload.attributes)
     db.commit()
-    db.refresh(t)
-
-    # Refresh attributes
-    for attr in created_attributes:
-        db.refresh(attr)
-
-    # Get all attributes for this product type
-    attrs = db.query(models.AttributeDefinition).filter(models.AttributeDefinition.product_type_id == t.id).all()
-
-    return schemas.ProductType(
-        id=t.id,
-        name=t.name,
-        description=t.description,
-        is_composite=t.is_composite,
-        attributes=attrs
-    )
+    return _product_type_schema(t)
 
 
 @router.delete("/product-types/{product_type_id}")
@@ -235,6 +204,7 @@ def delete_product_type(product_type_id: int, user=Depends(PermissionChecker(["p
     db.query(models.AttributeDefinition).filter(
         models.AttributeDefinition.product_type_id == product_type_id
     ).delete()
+    touch(db, models.AttributeDefinition)
 
     # Delete the product type
     db.delete(t)
@@ -245,18 +215,12 @@ def delete_product_type(product_type_id: int, user=Depends(PermissionChecker(["p
 # Attribute definitions
 @router.post("/attribute-definitions/", response_model=schemas.AttributeDefinition)
 def create_attribute_definition(attr_def: schemas.AttributeDefinitionCreate, user=Depends(PermissionChecker(["attribute_definition.write"])), db: Session = Depends(get_db)):
-    unit_id = None
-    if attr_def.unit_code:
-        unit = db.query(models.Unit).filter(models.Unit.code == attr_def.unit_code).first()
-        if unit:
-            unit_id = unit.id
-
     db_def = models.AttributeDefinition(
         product_type_id=attr_def.product_type_id,
         name=attr_def.name,
         code=attr_def.code,
         data_type=attr_def.data_type,
-        unit_id=unit_id,
+        unit_id=attr_def.unit_id,
         is_required=attr_def.is_required,
     )
     db.add(db_def)
@@ -265,7 +229,7 @@ def create_attribute_definition(attr_def: schemas.AttributeDefinitionCreate, use
     return db_def
 
 
-def _serialize_product(db_product: models.Product, db: Session) -> schemas.Product:
+def _serialize_product(db_product: models.Product, db: Session, total_stock: Optional[Decimal] = None) -> schemas.Product:
     # Собираем атрибуты как список с единым полем "value"
     attributes = []
     for attr in db_product.attributes:
@@ -291,13 +255,9 @@ def _serialize_product(db_product: models.Product, db: Session) -> schemas.Produ
         for c in db_product.components
     ]
 
-    # Calculate total stock across all locations for this product
-    total_stock_result = (
-        db.query(func.coalesce(func.sum(models.Stock.quantity), Decimal("0")))
-        .filter(models.Stock.product_id == db_product.id)
-        .scalar()
-    )
-    total_stock = total_stock_result if total_stock_result is not None else Decimal("0")
+    # Total stock across all locations comes from the materialized projection
+    if total_stock is None:
+        total_stock = stock_totals.totals_for(db, [db_product.id]).get(db_product.id, Decimal("0"))
 
     return schemas.Product(
         id=db_product.id,
@@ -312,6 +272,12 @@ def _serialize_product(db_product: models.Product, db: Session) -> schemas.Produ
     )
 
 
+def _serialize_products(products: List[models.Product], db: Session) -> List[schemas.Product]:
+    """Serialize a page of products; relations must be eager-loaded by the caller."""
+    totals = stock_totals.totals_for(db, [p.id for p in products])
+    return [_serialize_product(p, db, totals.get(p.id, Decimal("0"))) for p in products]
+
+
 def _ensure_unit(code: str, db: Session) -> models.Unit:
     unit = db.query(models.Unit).filter(models.Unit.code == code).first()
     if not unit:
@@ -326,6 +292,92 @@ def _ensure_unit(code: str, db: Session) -> models.Unit:
     return unit
 
 
+def _attribute_columns(db: Session, attributes: List[schemas.ProductAttributeValueCreate]) -> dict:
+    """Typed value columns per attribute definition id; all definitions are checked in one query."""
+    definition_ids = {attr.attribute_definition_id for attr in attributes}
+    data_types = {}
+    if definition_ids:
+        data_types = dict(
+            db.query(AttributeDefinition.id, AttributeDefinition.data_type).filter(AttributeDefinition.id.in_(definition_ids))
+        )
+    if len(data_types) != len(definition_ids):
+        raise ValueError("Invalid attribute definition")
+
+    columns = {}
+    for attr in attributes:
+        values = {"value_number": None, "value_boolean": None, "value_string": None}
+        data_type = data_types[attr.attribute_definition_id]
+        if attr.value is not None:
+            if data_type == "number":
+                # Decimal compares equal to the value read back from the NUMERIC column
+                values["value_number"] = Decimal(str(attr.value))
+            elif data_type == "boolean":
+                values["value_boolean"] = bool(attr.value)
+            elif data_type == "string":
+                values["value_string"] = str(attr.value)
+        columns[attr.attribute_definition_id] = values
+    return columns
+
+
+def _component_recipe(db: Session, components: List[schemas.ProductComponentCreate]) -> dict:
+    """``(quantity, unit id)`` per component; quantities are in the component's base unit."""
+    component_ids = {comp.component_product_id for comp in components}
+    base_units = {}
+    if component_ids:
+        base_units = dict(db.query(models.Product.id, models.Product.base_unit_id).filter(models.Product.id.in_(component_ids)))
+    if len(base_units) != len(component_ids):
+        raise HTTPException(status_code=400, detail="Component product not found")
+    return {
+        comp.component_product_id: (Decimal(str(comp.quantity)), base_units[comp.component_product_id])
+        for comp in components
+    }
+
+
+def _sync_attribute_values(db: Session, product_id: int, columns: dict) -> None:
+    """Apply only the differences to the product's attribute values.
+
+    Values whose columns are unchanged produce no statement and no audit row; the
+    flush batches the remaining inserts, updates and deletes per table.
+    """
+    current = {
+        row.attribute_definition_id: row
+        for row in db.query(ProductAttributeValue).filter(ProductAttributeValue.product_id == product_id)
+    }
+    for definition_id, row in current.items():
+        if definition_id not in columns:
+            db.delete(row)
+    for definition_id, values in columns.items():
+        row = current.get(definition_id)
+        if row is None:
+            db.add(ProductAttributeValue(product_id=product_id, attribute_definition_id=definition_id, **values))
+            continue
+        for key, value in values.items():
+            # Assigning an equal value leaves no attribute history, so nothing is flushed
+            setattr(row, key, value)
+
+
+def _sync_components(db: Session, product_id: int, recipe: dict) -> None:
+    """Apply only the differences to a composite's recipe, keyed by component product."""
+    current = {
+        row.component_product_id: row
+        for row in db.query(models.CompositeComponent).filter(models.CompositeComponent.parent_product_id == product_id)
+    }
+    for component_id, row in current.items():
+        if component_id not in recipe:
+            db.delete(row)
+    for component_id, (quantity, unit_id) in recipe.items():
+        row = current.get(component_id)
+        if row is None:
+            db.add(
+                models.CompositeComponent(
+                    parent_product_id=product_id, component_product_id=component_id, quantity=quantity, unit_id=unit_id
+                )
+            )
+            continue
+        row.quantity = quantity
+        row.unit_id = unit_id
+
+
 # Products
 @router.post("/products/", response_model=schemas.Product)
 def create_product(product: schemas.ProductCreate, user=Depends(PermissionChecker(["product.write"])), db: Session = Depends(get_db)):
@@ -351,24 +403,10 @@ def create_product(product: schemas.ProductCreate, user=Depends(PermissionChecke
     db.flush()
 
     # Атрибуты
-    for attr in product.attributes:
-        attr_def = db.get(AttributeDefinition, attr.attribute_definition_id)
-        if not attr_def:
-            raise ValueError("Invalid attribute definition")
-
-        db_attr = ProductAttributeValue(
-            product_id=db_product.id,  # ✅ ПРАВИЛЬНО: используем id сохранённого товара
-            attribute_definition_id=attr.attribute_definition_id
-        )
-
-        if attr_def.data_type == "number":
-            db_attr.value_number = float(attr.value) if attr.value is not None else None
-        elif attr_def.data_type == "boolean":
-            db_attr.value_boolean = bool(attr.value) if attr.value is not None else None
-        elif attr_def.data_type == "string":
-            db_attr.value_string = str(attr.value) if attr.value is not None else None
-
-        db.add(db_attr)
+    db.add_all(
+        ProductAttributeValue(product_id=db_product.id, attribute_definition_id=definition_id, **values)
+        for definition_id, values in _attribute_columns(db, product.attributes).items()
+    )
 
     # Create product_unit entry for the base unit with ratio 1.0
     base_product_unit = models.ProductUnit(
@@ -385,19 +423,20 @@ def create_product(product: schemas.ProductCreate, user=Depends(PermissionChecke
 
     # Компоненты (если составной)
     if pt.is_composite:
-        for comp in product.components:
-            db_comp = models.CompositeComponent(
+        db.add_all(
+            models.CompositeComponent(
                 parent_product_id=db_product.id,
-                component_product_id=comp.component_product_id,
-                quantity=Decimal(str(comp.quantity)),
-                unit_id=product.base_unit_id,  # Changed to unit_id
+                component_product_id=component_id,
+                quantity=quantity,
+                unit_id=unit_id,
             )
-            db.add(db_comp)
+            for component_id, (quantity, unit_id) in _component_recipe(db, product.components).items()
+        )
 
     # Складской остаток
-    loc = _default_location(db)
+    location_id = default_location_id(db)
     stock = models.Stock(
-        location_id=loc.id,
+        location_id=location_id,
         product_id=db_product.id,  # ✅ тоже используем db_product.id
         quantity=Decimal(str(product.stock)),
         unit_id=product.base_unit_id,  # Changed to unit_id
@@ -409,32 +448,100 @@ def create_product(product: schemas.ProductCreate, user=Depends(PermissionChecke
     return _serialize_product(db_product, db)
 
 
+def _filter_products(query, location_id: Optional[int], product_type_id: Optional[int]):
+    if product_type_id:
+        query = query.filter(models.Product.product_type_id == product_type_id)
+
+    if location_id:
+        # Only products that have a stock row at the specified location
+        query = query.filter(
+            exists().where(
+                models.Stock.product_id == models.Product.id,
+                models.Stock.location_id == location_id,
+            )
+        )
+    return query
+
+
+def _products_with_relations(db: Session):
+    # Relations are batch-loaded so the page costs a fixed number of queries
+    return db.query(models.Product).options(
+        joinedload(models.Product.product_type),
+        selectinload(models.Product.attributes),
+        selectinload(models.Product.components),
+    )
+
+
+def _encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _list_products(
+    db: Session, location_id: Optional[int], product_type_id: Optional[int], skip: int, limit: int
+) -> List[schemas.Product]:
+    query = _filter_products(_products_with_relations(db), location_id, product_type_id)
+    products = query.order_by(models.Product.id).offset(skip).limit(limit).all()
+    return _serialize_products(products, db)
+
+
+def _products_page(
+    db: Session,
+    location_id: Optional[int],
+    product_type_id: Optional[int],
+    cursor: Optional[str],
+    limit: int,
+    include_total: bool,
+) -> schemas.ProductPage:
+    query = _filter_products(_products_with_relations(db), location_id, product_type_id)
+    if cursor:
+        query = query.filter(models.Product.id > _decode_cursor(cursor))
+    # Fetch one extra row to know whether another page exists
+    products = query.order_by(models.Product.id).limit(limit + 1).all()
+    has_more = len(products) > limit
+    products = products[:limit]
+
+    total = None
+    if include_total and not cursor:
+        total = _filter_products(db.query(models.Product.id), location_id, product_type_id).count()
+
+    return schemas.ProductPage(
+        items=_serialize_products(products, db),
+        next_cursor=_encode_cursor(products[-1].id) if has_more else None,
+        total=total,
+    )
+
+
 @router.get("/products/", response_model=List[schemas.Product])
-def get_products(
+async def get_products(
     location_id: Optional[int] = None,
     product_type_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 100,
     user=Depends(PermissionChecker(["product.read"])),
-    db: Session = Depends(get_db)
+    db=Depends(get_async_read_db)
 ):
-    query = db.query(models.Product)
+    return await run_sync(db, _list_products, location_id, product_type_id, skip, limit)
 
-    if product_type_id:
-        query = query.filter(models.Product.product_type_id == product_type_id)
 
-    # Apply location filter if specified
-    if location_id:
-        # Subquery to get product IDs that have stock at the specified location
-        subquery = (
-            db.query(models.Stock.product_id)
-            .filter(models.Stock.location_id == location_id)
-            .distinct()
-        )
-        query = query.filter(models.Product.id.in_(subquery))
-
-    products = query.offset(skip).limit(limit).all()
-    return [_serialize_product(p, db) for p in products]
+@router.get("/products/page/", response_model=schemas.ProductPage)
+async def get_products_page(
+    location_id: Optional[int] = None,
+    product_type_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    include_total: bool = True,
+    user=Depends(PermissionChecker(["product.read"])),
+    db=Depends(get_async_read_db)
+):
+    """Keyset pagination on product id; the total is only counted for the first page."""
+    return await run_sync(db, _products_page, location_id, product_type_id, cursor, limit, include_total)
 
 
 @router.get("/products-count/")
@@ -442,28 +549,14 @@ def get_products_count(
     location_id: Optional[int] = None,
     product_type_id: Optional[int] = None,
     user=Depends(PermissionChecker(["product.read"])),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
-    query = db.query(models.Product)
-
-    if product_type_id:
-        query = query.filter(models.Product.product_type_id == product_type_id)
-
-    if location_id:
-        # Subquery to get product IDs that have stock at the specified location
-        subquery = (
-            db.query(models.Stock.product_id)
-            .filter(models.Stock.location_id == location_id)
-            .distinct()
-        )
-        query = query.filter(models.Product.id.in_(subquery))
-
-    count = query.count()
+    count = _filter_products(db.query(models.Product.id), location_id, product_type_id).count()
     return {"count": count}
 
 
 @router.get("/products/{product_id}", response_model=schemas.Product)
-def get_product(product_id: int, user=Depends(PermissionChecker(["product.read"])), db: Session = Depends(get_db)):
+def get_product(product_id: int, user=Depends(PermissionChecker(["product.read"])), db: Session = Depends(get_read_db)):
     product = db.query(models.Product).get(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -497,25 +590,7 @@ def update_product(product_id: int, product_update: schemas.ProductUpdate, user=
     # Always update base_unit_id with the resolved value
     product.base_unit_id = base_unit_id
 
-    db.query(models.ProductAttributeValue).filter(models.ProductAttributeValue.product_id == product.id).delete()
-    for attr in product_update.attributes:
-        attr_def = db.get(AttributeDefinition, attr.attribute_definition_id)
-        if not attr_def:
-            raise ValueError("Invalid attribute definition")
-
-        db_attr = models.ProductAttributeValue(
-            product_id=product.id,
-            attribute_definition_id=attr.attribute_definition_id
-        )
-
-        if attr_def.data_type == "number":
-            db_attr.value_number = float(attr.value) if attr.value is not None else None
-        elif attr_def.data_type == "boolean":
-            db_attr.value_boolean = bool(attr.value) if attr.value is not None else None
-        elif attr_def.data_type == "string":
-            db_attr.value_string = str(attr.value) if attr.value is not None else None
-
-        db.add(db_attr)
+    _sync_attribute_values(db, product.id, _attribute_columns(db, product_update.attributes))
 
     # Update product_unit entry for the base unit with ratio 1.0
     # First, check if there's already a product_unit entry for the base unit
@@ -537,21 +612,13 @@ def update_product(product_id: int, product_update: schemas.ProductUpdate, user=
         )
         db.add(base_product_unit)
 
-    db.query(models.CompositeComponent).filter(models.CompositeComponent.parent_product_id == product.id).delete()
-    if pt.is_composite:
-        for comp in product_update.components:
-            db_comp = models.CompositeComponent(
-                parent_product_id=product.id,
-                component_product_id=comp.component_product_id,
-                quantity=Decimal(str(comp.quantity)),
-                unit_id=base_unit_id,  # Changed to unit_id
-            )
-            db.add(db_comp)
+    recipe = _component_recipe(db, product_update.components) if pt.is_composite else {}
+    _sync_components(db, product.id, recipe)
 
-    loc = _default_location(db)
+    location_id = default_location_id(db)
     stock = (
         db.query(models.Stock)
-        .filter(models.Stock.location_id == loc.id, models.Stock.product_id == product.id)
+        .filter(models.Stock.location_id == location_id, models.Stock.product_id == product.id)
         .first()
     )
     if stock:
@@ -560,7 +627,7 @@ def update_product(product_id: int, product_update: schemas.ProductUpdate, user=
     else:
         db.add(
             models.Stock(
-                location_id=loc.id,
+                location_id=location_id,
                 product_id=product.id,
                 quantity=Decimal(str(product_update.stock)),
                 unit_id=base_unit_id,
@@ -578,6 +645,7 @@ def delete_product(product_id: int, user=Depends(PermissionChecker(["product.del
         raise HTTPException(status_code=404, detail="Product not found")
     db.query(models.ProductAttributeValue).filter(models.ProductAttributeValue.product_id == product.id).delete()
     db.query(models.CompositeComponent).filter(models.CompositeComponent.parent_product_id == product.id).delete()
+    touch(db, models.CompositeComponent)
     db.delete(product)
     db.commit()
     return {"message": "Product deleted successfully"}
@@ -586,7 +654,7 @@ def delete_product(product_id: int, user=Depends(PermissionChecker(["product.del
 
 # Unit Conversions
 @router.get("/unit-conversions/", response_model=List[schemas.UnitConversionSchema])
-def get_unit_conversions(user=Depends(PermissionChecker(["unit_conversion.read"])), db: Session = Depends(get_db)):
+def get_unit_conversions(user=Depends(PermissionChecker(["unit_conversion.read"])), db: Session = Depends(get_read_db)):
     logger.warning("UnitConversion API is deprecated. Use ProductUnit for product-specific conversions.")
     # Return empty list since UnitConversion table no longer exists
     return []
@@ -601,7 +669,11 @@ def create_unit_conversion(conversion: schemas.UnitConversionSchema, user=Depend
 
 # Locations
 @router.get("/locations/", response_model=List[schemas.Location])
-def get_locations(user=Depends(PermissionChecker(["location.read"])), db: Session = Depends(get_db)):
+def get_locations(request: Request, user=Depends(PermissionChecker(["location.read"])), db: Session = Depends(get_db)):
+    return _reference_response(request, db, "locations", _locations)
+
+
+def _locations(db: Session) -> List[schemas.Location]:
     locations = db.query(models.Location).all()
     return [
         schemas.Location(
@@ -631,62 +703,57 @@ def sell_product(sale_request: schemas.SaleRequest, user=Depends(PermissionCheck
     product = db.query(models.Product).get(sale_request.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    loc = _default_location(db)
-    stock = (
-        db.query(models.Stock)
-        .filter(models.Stock.location_id == loc.id, models.Stock.product_id == product.id)
-        .with_for_update()
-        .first()
-    )
-    if not stock or stock.quantity < sale_request.quantity:
-        raise HTTPException(status_code=400, detail="Insufficient stock")
-
+    location_id = default_location_id(db)
+    required = {}
     if product.product_type.is_composite:
-        components = db.query(models.CompositeComponent).filter(models.CompositeComponent.parent_product_id == product.id).all()
-        for comp in components:
-            comp_stock = (
-                db.query(models.Stock)
-                .filter(models.Stock.location_id == loc.id, models.Stock.product_id == comp.component_product_id)
-                .with_for_update()
-                .first()
-            )
-            required = Decimal(str(comp.quantity)) * sale_request.quantity
-            if not comp_stock or comp_stock.quantity < required:
-                raise HTTPException(status_code=400, detail="Insufficient stock for component")
-            comp_stock.quantity -= required
-    stock.quantity -= sale_request.quantity
+        # A composite without a recipe flattens to itself; its own stock is deducted below
+        required = {pid: qty for pid, qty in BomExpander(db).flatten(product.id).items() if pid != product.id}
+    debits = {component_id: per_unit * sale_request.quantity for component_id, per_unit in required.items()}
+    debits[product.id] = sale_request.quantity
+    try:
+        # Parent and components are debited by one conditional UPDATE
+        StockService(db).debit(location_id, debits)
+    except ValidationError as exc:
+        detail = "Insufficient stock" if product.id in exc.details["product_ids"] else "Insufficient stock for component"
+        raise HTTPException(status_code=400, detail=detail)
     db.commit()
     return {"message": f"Successfully sold {sale_request.quantity} of {product.name}"}
 
 
-@router.post("/glass-sales/")
-def sell_wine_glass(sale_request: schemas.SaleRequest, user=Depends(PermissionChecker(["sale.write"])), db: Session = Depends(get_db)):
-    product = db.query(models.Product).get(sale_request.product_id)
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    glasses_per_bottle = (
-        db.query(models.ProductAttributeValue)
+def _glasses_per_bottle(db: Session, product_id: int) -> Optional[Decimal]:
+    """Legacy ``glasses_per_bottle`` attribute, used when the product has no glass unit configured."""
+    value = (
+        db.query(models.ProductAttributeValue.value_number)
         .join(models.AttributeDefinition, models.ProductAttributeValue.attribute_definition_id == models.AttributeDefinition.id)
         .filter(
-            models.ProductAttributeValue.product_id == product.id,
+            models.ProductAttributeValue.product_id == product_id,
             models.AttributeDefinition.code == "glasses_per_bottle",
         )
-        .first()
+        .scalar()
     )
-    if not glasses_per_bottle or not glasses_per_bottle.value_number:
-        raise HTTPException(status_code=400, detail="Missing glasses_per_bottle")
-    bottles_needed = sale_request.quantity / glasses_per_bottle.value_number
+    return Decimal(str(value)) if value else None
 
-    loc = _default_location(db)
-    stock = (
-        db.query(models.Stock)
-        .filter(models.Stock.location_id == loc.id, models.Stock.product_id == product.id)
-        .with_for_update()
-        .first()
-    )
-    if not stock or stock.quantity < bottles_needed:
+
+@router.post("/glass-sales/")
+def sell_wine_glass(sale_request: schemas.SaleRequest, user=Depends(PermissionChecker(["sale.write"])), db: Session = Depends(get_db)):
+    product = db.query(models.Product).get(sale_request.product_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    converter = UnitConverter(db)
+    try:
+        glass_unit_id = converter.unit_ids(["glass"])["glass"]
+        bottles_needed = converter.to_base(product.id, glass_unit_id, sale_request.quantity)
+    except ValidationError:
+        glasses_per_bottle = _glasses_per_bottle(db, product.id)
+        if not glasses_per_bottle:
+            raise HTTPException(status_code=400, detail="Missing glasses_per_bottle")
+        bottles_needed = sale_request.quantity / glasses_per_bottle
+
+    location_id = default_location_id(db)
+    try:
+        StockService(db).debit(location_id, {product.id: bottles_needed})
+    except ValidationError:
         raise HTTPException(status_code=400, detail="Insufficient stock")
-    stock.quantity -= bottles_needed
     db.commit()
     return {"message": f"Successfully sold {sale_request.quantity} glasses of {product.name}"}
 
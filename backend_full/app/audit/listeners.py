@@ -1,8 +1,8 @@
 from datetime import date, datetime
 from decimal import Decimal
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
-from sqlalchemy import event, inspect
+from sqlalchemy import event, insert, inspect
 from sqlalchemy.orm import Session
 
 from app.models import models as orm
@@ -10,6 +10,14 @@ import structlog
 
 logger = structlog.get_logger()
 
+# Models that are never audited (the audit tables themselves, derived projections)
+EXCLUDED_MODELS = {"AuditLog", "RequestLog", "ProductStockTotal", "IngestLocationError"}
+
+# High-churn models audited in compact form: only the listed columns are captured
+COMPACT_MODELS: Dict[str, Tuple[str, ...]] = {
+    "Stock": ("location_id", "product_id", "quantity"),
+}
+
 
 def _json_friendly(value: Any) -> Any:
     if isinstance(value, Decimal):
@@ -19,33 +27,112 @@ def _json_friendly(value: Any) -> Any:
     return value
 
 
-def as_dict(obj: Any) -> Dict[str, Any]:
+def as_dict(obj: Any, columns: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
     state = {}
     for attr in inspect(obj).mapper.column_attrs:
         key = attr.key
-        state[key] = _json_friendly(getattr(obj, key))
+        if columns is None or key in columns:
+            state[key] = _json_friendly(getattr(obj, key))
     return state
 
 
-def before_flush(session: Session, flush_context, instances):
-    for obj in session.new:
-        _create_audit(session, obj, "insert", None, as_dict(obj))
-    for obj in session.deleted:
-        _create_audit(session, obj, "delete", as_dict(obj), None)
-    for obj in session.dirty:
-        if session.is_modified(obj, include_collections=False):
-            _create_audit(session, obj, "update", as_dict(obj), as_dict(obj))
+def changed_columns(obj: Any, columns: Optional[Tuple[str, ...]] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Old and new values of the columns modified on ``obj``, read from attribute history."""
+    old, new = {}, {}
+    state = inspect(obj)
+    for attr in state.mapper.column_attrs:
+        key = attr.key
+        if columns is not None and key not in columns:
+            continue
+        history = state.attrs[key].history
+        if not history.has_changes():
+            continue
+        old[key] = _json_friendly(history.deleted[0]) if history.deleted else None
+        new[key] = _json_friendly(history.added[0]) if history.added else None
+    return old, new
+
+
+def _record_id(obj: Any) -> str:
+    pk = inspect(obj).mapper.primary_key_from_instance(obj)
+    return ",".join(str(value) for value in pk)
+
+
+def _log_row(model: str, record_id: str, action: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "record_id": record_id,
+        "action": action,
+        "old_data": old,
+        "new_data": new,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def _audit_row(obj: Any, action: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return _log_row(obj.__class__.__name__, _record_id(obj), action, old, new)
+
+
+def collect_audit_rows(session: Session) -> List[Dict[str, Any]]:
+    rows = []
+    for action, objects in (("insert", session.new), ("delete", session.deleted), ("update", session.dirty)):
+        for obj in objects:
+            model_name = obj.__class__.__name__
+            if model_name in EXCLUDED_MODELS:
+                continue
+            columns = COMPACT_MODELS.get(model_name)
+            if action == "insert":
+                old, new = None, as_dict(obj, columns)
+            elif action == "delete":
+                old, new = as_dict(obj, columns), None
+            else:
+                old, new = changed_columns(obj, columns)
+                if not new:
+                    continue
+            rows.append(_audit_row(obj, action, old, new))
+    return rows
+
+
+def audit_inserts(session: Session, objects: Iterable[Any]) -> None:
+    """Audit rows inserted by statements that bypass the unit of work, such as INSERT ... ON CONFLICT."""
+    rows = [
+        _audit_row(obj, "insert", None, as_dict(obj, COMPACT_MODELS.get(obj.__class__.__name__)))
+        for obj in objects
+        if obj.__class__.__name__ not in EXCLUDED_MODELS
+    ]
+    if rows:
+        session.connection().execute(insert(orm.AuditLog), rows)
+
+
+def audit_updates(session: Session, model: type, changes: Iterable[Tuple[Any, Dict[str, Any], Dict[str, Any]]]) -> None:
+    """Audit rows changed by UPDATE statements that bypass the unit of work.
+
+    ``changes`` holds ``(primary key, old values, new values)`` of the changed columns.
+    """
+    if model.__name__ in EXCLUDED_MODELS:
+        return
+    rows = [
+        _log_row(
+            model.__name__,
+            str(record_id),
+            "update",
+            {key: _json_friendly(value) for key, value in old.items()},
+            {key: _json_friendly(value) for key, value in new.items()},
+        )
+        for record_id, old, new in changes
+    ]
+    if rows:
+        session.connection().execute(insert(orm.AuditLog), rows)
 
 
-def _create_audit(session: Session, obj: Any, action: str, old: Dict | None, new: Dict | None) -> None:
-    if isinstance(obj, orm.AuditLog) or isinstance(obj, orm.RequestLog):
+def after_flush(session: Session, flush_context) -> None:
+    # Runs once generated keys are known and while attribute history is still intact
+    rows = collect_audit_rows(session)
+    if not rows:
         return
-    model_name = obj.__class__.__name__
-    pk_val = getattr(obj, "id", None)
-    audit = orm.AuditLog(model=model_name, record_id=str(pk_val), action=action, old_data=old, new_data=new)
-    session.add(audit)
-    logger.info("audit_event", model=model_name, action=action, record_id=pk_val)
+    session.connection().execute(insert(orm.AuditLog), rows)
+    logger.debug("audit_flush", records=len(rows))
 
 
 def register_listeners():
-    event.listen(Session, "before_flush", before_flush, retval=False)
+    if not event.contains(Session, "after_flush", after_flush):
+        event.listen(Session, "after_flush", after_flush)
@@ -1,11 +1,11 @@
 import time
 import uuid
+from datetime import datetime
 from typing import Callable
 from fastapi import Request, Response
 from starlette.middleware.base import BaseHTTPMiddleware
 import structlog
-from app.infrastructure.db.session import SessionLocal
-from app.models.models import RequestLog
+from app.audit.request_log_writer import request_log_writer
 
 logger = structlog.get_logger()
 
@@ -19,17 +19,15 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
         start = time.time()
         response = await call_next(request)
         duration_ms = int((time.time() - start) * 1000)
-        try:
-            with SessionLocal() as session:
-                log_entry = RequestLog(
-                    request_id=request_id,
-                    method=request.method,
-                    path=str(request.url.path),
-                    status_code=response.status_code,
-                    context={"duration_ms": duration_ms},
-                )
-                session.add(log_entry)
-                session.commit()
-        except Exception:  # pragma: no cover - logging should never break flow
-            logger.warning("request_log_failed", request_id=request_id)
+        # Written in batches by the background writer; drops are counted, not logged
+        request_log_writer.submit(
+            {
+                "request_id": request_id,
+                "method": request.method,
+                "path": str(request.url.path),
+                "status_code": response.status_code,
+                "context": {"duration_ms": duration_ms},
+                "created_at": datetime.utcnow(),
+            }
+        )
         return response
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from typing import Callable, List, Optional
+
+import structlog
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.config import get_settings
+from app.infrastructure.db.session import BackgroundSessionLocal
+from app.models.models import RequestLog
+
+logger = structlog.get_logger()
+
+
+class RequestLogWriter:
+    """Buffers request logs in a bounded queue and writes them in multi-row inserts.
+
+    Requests only enqueue a dict; a background task flushes the queue when
+    ``batch_size`` entries are pending or ``flush_interval_ms`` elapsed. When the
+    queue is full new entries are dropped and counted instead of blocking.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = BackgroundSessionLocal,
+        max_queue_size: int = 10_000,
+        batch_size: int = 200,
+        flush_interval_ms: int = 500,
+    ):
+        self.session_factory = session_factory
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._batch: List[dict] = []
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and flush whatever is still queued."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._inflight is not None:
+            await self._inflight
+        pending, self._batch = self._batch, []
+        pending.extend(self._drain(self._queue.qsize() if self._queue else 0))
+        self._queue = None
+        for start in range(0, len(pending), self.batch_size):
+            await self._flush(pending[start:start + self.batch_size])
+
+    def submit(self, entry: dict) -> bool:
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+    def _drain(self, limit: int) -> List[dict]:
+        batch = []
+        while self._queue is not None and len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            # Collected on the instance so that stop() can flush a partial batch
+            self._batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                self._batch.extend(self._drain(self.batch_size - len(self._batch)))
+                timeout = deadline - time.monotonic()
+                if len(self._batch) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            # Shielded so that stop() never loses a batch that is being written
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+            self._inflight = None
+
+    async def _flush(self, batch: List[dict]) -> None:
+        try:
+            await asyncio.to_thread(self._write, batch)
+            self.written += len(batch)
+            self.batches += 1
+        except Exception:  # pragma: no cover - logging should never break flow
+            self.failed += len(batch)
+            logger.warning("request_log_flush_failed", entries=len(batch))
+
+    def _write(self, batch: List[dict]) -> None:
+        with self.session_factory() as session:
+            session.execute(insert(RequestLog), batch)
+            session.commit()
+
+
+settings = get_settings()
+request_log_writer = RequestLogWriter(
+    max_queue_size=settings.request_log_queue_size,
+    batch_size=settings.request_log_batch_size,
+    flush_interval_ms=settings.request_log_flush_interval_ms,
+)
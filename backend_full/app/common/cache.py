@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_MISSING = object()
+_caches: List["TTLCache"] = []
+_invalidators: List[Tuple[tuple, Callable[[Optional[set]], None], Optional[Callable[[Any], Hashable]]]] = []
+
+
+class TTLCache:
+    """Thread-safe in-process cache with per-entry TTL and a bounded size.
+
+    Entries are evicted in insertion order once ``maxsize`` is reached. ``version`` is
+    bumped by every invalidation; loaders that read it before querying can pass it to
+    ``set`` so that a result loaded concurrently with an invalidation is not stored.
+    """
+
+    def __init__(self, ttl_seconds: float, maxsize: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self.version = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.append(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None) -> None:
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._data.pop(key, None)
+            while len(self._data) >= self.maxsize:
+                self._data.popitem(last=False)
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            version = self.version
+            value = loader()
+            # Returned to this caller, but not cached if an invalidation ran meanwhile
+            self.set(key, value, version=version)
+        return value
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self.version += 1
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def clear_all_caches() -> None:
+    for cache in _caches:
+        cache.clear()
+
+
+def invalidate_on_commit(
+    *models: type,
+    callback: Callable[[Optional[set]], None],
+    key: Optional[Callable[[Any], Hashable]] = None,
+) -> None:
+    """Run ``callback`` after a commit that inserted, updated or deleted any of ``models``.
+
+    ``key`` is evaluated at flush time for each touched instance and the collected
+    keys are passed to ``callback``; ``None`` means "everything may have changed".
+    Bulk ``query.update()/delete()`` statements bypass the ORM and must call ``touch``.
+    """
+    _invalidators.append((models, callback, key))
+    if not event.contains(Session, "after_flush", _collect_touched):
+        event.listen(Session, "after_flush", _collect_touched)
+        event.listen(Session, "after_commit", _run_invalidators)
+        event.listen(Session, "after_soft_rollback", _discard_touched)
+
+
+def touch(session: Session, *models: type, keys: Optional[Iterable[Hashable]] = None) -> None:
+    """Queue an invalidation for ``models`` changed outside the ORM unit of work.
+
+    Without ``keys`` everything cached for the models is dropped. ``keys`` narrows
+    it to the given keys for invalidators registered with a ``key`` function, which
+    must produce keys of the same kind (for example location ids).
+    """
+    pending = session.info.setdefault("cache_invalidations", {})
+    for index, (watched, _, key) in enumerate(_invalidators):
+        if not any(issubclass(model, watched) for model in models):
+            continue
+        if keys is None or key is None:
+            pending[index] = None
+        elif pending.get(index, set()) is not None:
+            pending.setdefault(index, set()).update(keys)
+
+
+def _collect_touched(session: Session, flush_context) -> None:
+    pending = session.info.setdefault("cache_invalidations", {})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        for index, (models, _, key) in enumerate(_invalidators):
+            if not isinstance(obj, models):
+                continue
+            if key is None:
+                pending[index] = None
+            elif pending.get(index, set()) is not None:
+                pending.setdefault(index, set()).add(key(obj))
+
+
+def _run_invalidators(session: Session) -> None:
+    pending = session.info.pop("cache_invalidations", None)
+    if not pending:
+        return
+    for index, keys in pending.items():
+        _invalidators[index][1](keys)
+
+
+def _discard_touched(session: Session, previous_transaction) -> None:
+    session.info.pop("cache_invalidations", None)
@@ -0,0 +1,39 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+
+@dataclass(frozen=True)
+class Representation:
+    """Serialized JSON body of a resource together with its strong ETag."""
+
+    body: bytes
+    etag: str
+
+    @classmethod
+    def of(cls, payload: Any) -> "Representation":
+        body = json.dumps(jsonable_encoder(payload), separators=(",", ":")).encode()
+        # Derived from the body rather than an in-process counter, so the tag stays
+        # valid across restarts and never repeats for different content
+        return cls(body=body, etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """True when ``If-None-Match`` lists ``etag`` or ``*`` (weak comparison, as RFC 9110 requires)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag in tags
+
+
+def conditional_response(request: Request, representation: Representation) -> Response:
+    """``304`` without a body when the client already holds this representation, otherwise ``200``."""
+    headers = {"ETag": representation.etag, "Cache-Control": "no-cache"}
+    if not_modified(request, representation.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=representation.body, media_type="application/json", headers=headers)
@@ -0,0 +1,102 @@
+import codecs
+import json
+from typing import Any, BinaryIO, Iterator
+
+_WHITESPACE = " \t\n\r"
+
+
+class JSONStreamError(ValueError):
+    """Malformed or truncated JSON in a streamed document."""
+
+
+class _Reader:
+    """Chunked UTF-8 reader over a binary file with a sliding text buffer."""
+
+    def __init__(self, fp: BinaryIO, chunk_size: int):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> None:
+        if self.eof:
+            raise JSONStreamError("Unexpected end of JSON document")
+        chunk = self._fp.read(self._chunk_size)
+        if not chunk:
+            self.eof = True
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(chunk)
+        # Drop the consumed prefix so the buffer only holds unparsed input
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+
+    def peek(self) -> str:
+        """Next non-whitespace character without consuming it; empty string at end of input."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                return ""
+            self.fill()
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise JSONStreamError(f"Expected '{char}' at offset {self.pos}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise JSONStreamError("Malformed JSON value")
+                self.fill()
+                continue
+            # A number ending at the buffer boundary may continue in the next chunk
+            if end == len(self.buf) and not self.eof:
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+
+def iter_array_items(fp: BinaryIO, key: str, chunk_size: int = 64 * 1024) -> Iterator[Any]:
+    """Yield the items of the array under top-level ``key`` of a JSON object, one at a time.
+
+    Only the item being decoded and one read chunk are held in memory; other
+    top-level members are decoded and discarded. A missing key yields nothing.
+    """
+    reader = _Reader(fp, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        name = reader.value()
+        if not isinstance(name, str):
+            raise JSONStreamError("Object keys must be strings")
+        reader.expect(":")
+        if name == key:
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.value()
+                    separator = reader.peek()
+                    reader.expect(separator if separator in ",]" else ",")
+                    if separator == "]":
+                        break
+        else:
+            reader.value()
+        separator = reader.peek()
+        reader.expect(separator if separator in ",}" else ",")
+        if separator == "}":
+            return
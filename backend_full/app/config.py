@@ -1,4 +1,5 @@
 from functools import lru_cache
+from typing import Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
@@ -7,6 +8,21 @@ class Settings(BaseSettings):
     app_name: str = "Cavina Backoffice"
     environment: str = Field("development", description="Environment name for toggling features")
     database_url: str = Field(..., env="DATABASE_URL")
+    database_async: bool = Field(False, env="DATABASE_ASYNC")
+    database_async_url: Optional[str] = Field(None, env="DATABASE_ASYNC_URL")
+    database_read_url: Optional[str] = Field(None, env="DATABASE_READ_URL", description="Read replica for read-only routes")
+    database_read_max_lag_seconds: float = Field(10, env="DATABASE_READ_MAX_LAG_SECONDS", description="Use the primary above this lag; 0 tolerates any lag")
+    database_read_check_interval_seconds: float = Field(5, env="DATABASE_READ_CHECK_INTERVAL_SECONDS")
+    database_read_retry_seconds: float = Field(30, env="DATABASE_READ_RETRY_SECONDS", description="Primary-only period after a replica failure")
+    db_pool_size: int = Field(10, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(20, env="DB_MAX_OVERFLOW")
+    db_pool_timeout_seconds: float = Field(5, env="DB_POOL_TIMEOUT_SECONDS", description="Wait for a free connection before failing with 503")
+    db_pool_recycle_seconds: int = Field(1800, env="DB_POOL_RECYCLE_SECONDS")
+    db_pool_pre_ping: bool = Field(True, env="DB_POOL_PRE_PING")
+    db_statement_timeout_ms: int = Field(15_000, env="DB_STATEMENT_TIMEOUT_MS", description="0 disables the timeout")
+    db_background_pool_size: int = Field(2, env="DB_BACKGROUND_POOL_SIZE")
+    db_background_max_overflow: int = Field(3, env="DB_BACKGROUND_MAX_OVERFLOW")
+    db_background_statement_timeout_ms: int = Field(60_000, env="DB_BACKGROUND_STATEMENT_TIMEOUT_MS")
     jwt_secret_key: str = Field("change-me", env="JWT_SECRET_KEY")
     jwt_algorithm: str = "HS256"
     jwt_expire_minutes: int = 60 * 12
@@ -14,6 +30,8 @@ class Settings(BaseSettings):
     log_level: str = Field("INFO", env="LOG_LEVEL")
     structlog_json: bool = Field(True, env="STRUCTLOG_JSON")
     hmac_clock_skew_seconds: int = 300
+    signed_body_max_bytes: int = Field(32 * 1024 * 1024, env="SIGNED_BODY_MAX_BYTES")
+    signed_body_spool_bytes: int = 1024 * 1024
     default_currency: str = "EUR"
     glasses_per_bottle: int = 5
     loaf_fraction: str = "0.1"
@@ -22,6 +40,25 @@ class Settings(BaseSettings):
     admin_password: str = Field("admin", env="ADMIN_PASSWORD")
     default_location_id: int = Field(1, env="DEFAULT_LOCATION_ID")
     default_location_name: str = Field("Main Warehouse", env="DEFAULT_LOCATION_NAME")
+    permission_cache_ttl_seconds: int = Field(60, env="PERMISSION_CACHE_TTL_SECONDS")
+    permission_cache_size: int = 10_000
+    principal_cache_ttl_seconds: int = Field(30, env="PRINCIPAL_CACHE_TTL_SECONDS")
+    principal_cache_size: int = 10_000
+    terminal_cache_ttl_seconds: int = Field(60, env="TERMINAL_CACHE_TTL_SECONDS")
+    terminal_cache_size: int = 10_000
+    unit_cache_ttl_seconds: int = Field(300, env="UNIT_CACHE_TTL_SECONDS")
+    unit_cache_size: int = 50_000
+    bom_cache_ttl_seconds: int = Field(300, env="BOM_CACHE_TTL_SECONDS")
+    bom_cache_size: int = 50_000
+    catalog_cache_ttl_seconds: int = Field(30, env="CATALOG_CACHE_TTL_SECONDS")
+    catalog_cache_size: int = 1_000
+    reference_cache_ttl_seconds: int = Field(300, env="REFERENCE_CACHE_TTL_SECONDS")
+    sales_ingest_mode: str = Field("sync", env="SALES_INGEST_MODE", description="sync: reconcile daily logs in the request; queue: enqueue for the worker")
+    ingest_worker_batch_size: int = Field(500, env="INGEST_WORKER_BATCH_SIZE")
+    ingest_worker_poll_interval_ms: int = Field(1000, env="INGEST_WORKER_POLL_INTERVAL_MS")
+    request_log_queue_size: int = Field(10_000, env="REQUEST_LOG_QUEUE_SIZE")
+    request_log_batch_size: int = Field(200, env="REQUEST_LOG_BATCH_SIZE")
+    request_log_flush_interval_ms: int = Field(500, env="REQUEST_LOG_FLUSH_INTERVAL_MS")
 
     class Config:
         case_sensitive = False
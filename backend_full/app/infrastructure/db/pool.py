@@ -0,0 +1,83 @@
+"""Connection pools that record how long requests wait for a database connection."""
+import threading
+import time
+from typing import Dict
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+class PoolStats:
+    """Checkout counters of one engine's pool; waits include pre-ping and new connections."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited: float, timed_out: bool = False) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_avg": self.wait_seconds_total / attempts if attempts else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+            }
+
+
+# Keyed by the pool's logging name, which survives ``Engine.dispose()`` recreating the pool
+_stats: Dict[str, PoolStats] = {}
+_pools: Dict[str, Pool] = {}
+
+
+def stats_for(name: str) -> PoolStats:
+    return _stats.setdefault(name, PoolStats())
+
+
+class _TimedCheckout:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _pools[self.logging_name] = self
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            stats_for(self.logging_name).record(time.perf_counter() - started, timed_out=True)
+            raise
+        stats_for(self.logging_name).record(time.perf_counter() - started)
+        return connection
+
+
+class InstrumentedQueuePool(_TimedCheckout, QueuePool):
+    """``QueuePool`` recording checkout waits under its ``pool_logging_name``."""
+
+
+class InstrumentedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """``AsyncAdaptedQueuePool`` recording checkout waits under its ``pool_logging_name``."""
+
+
+def pool_metrics() -> Dict[str, dict]:
+    """Checkout statistics and current occupancy of every instrumented pool."""
+    metrics = {}
+    for name, pool in _pools.items():
+        metrics[name] = {
+            **stats_for(name).snapshot(),
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
+    return metrics
@@ -0,0 +1,103 @@
+"""Routing of read-only sessions to an optional read replica."""
+import threading
+import time
+from typing import Optional
+
+import structlog
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+
+logger = structlog.get_logger()
+
+# Seconds the replica trails the primary; zero while it has replayed everything it received
+_PG_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+def replication_lag_seconds(conn: Connection) -> float:
+    if conn.dialect.name != "postgresql":
+        conn.execute(text("SELECT 1"))
+        return 0.0
+    return float(conn.execute(_PG_LAG_SQL).scalar() or 0)
+
+
+class ReplicaRouter:
+    """Hands out replica sessions while the replica is reachable and not lagging too far behind.
+
+    Health is probed in a background thread at most every ``check_interval_seconds``,
+    started by whichever request comes first; requests only read the last result, so
+    they never wait on a replica connection. Until a probe succeeds, after a failed
+    probe, or after a connection error on any replica statement, reads go to the
+    primary, and a down replica is probed again after ``retry_seconds``.
+    ``max_lag_seconds <= 0`` tolerates any replication lag.
+    """
+
+    def __init__(
+        self,
+        primary: sessionmaker,
+        replica: Optional[sessionmaker],
+        max_lag_seconds: float,
+        check_interval_seconds: float,
+        retry_seconds: float,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval_seconds = check_interval_seconds
+        self.retry_seconds = retry_seconds
+        self._healthy = False
+        self._next_check = 0.0
+        self._down_until = 0.0
+        self._probe_lock = threading.Lock()
+        if replica is not None:
+            event.listen(replica.kw["bind"], "handle_error", self.on_error)
+
+    def sessionmaker(self) -> sessionmaker:
+        return self.replica if self.available() else self.primary
+
+    def available(self) -> bool:
+        if self.replica is None:
+            return False
+        # Only one probe runs at a time; requests keep using the last known state
+        if time.monotonic() >= self._next_check and self._probe_lock.acquire(blocking=False):
+            threading.Thread(target=self._probe_in_background, name="read-replica-probe", daemon=True).start()
+        return self._healthy and time.monotonic() >= self._down_until
+
+    def _probe_in_background(self) -> None:
+        try:
+            self.probe()
+        finally:
+            self._probe_lock.release()
+
+    def probe(self) -> None:
+        """Measure reachability and lag of the replica and update the routing state."""
+        self._next_check = time.monotonic() + self.check_interval_seconds
+        engine: Engine = self.replica.kw["bind"]
+        try:
+            with engine.connect() as conn:
+                lag = replication_lag_seconds(conn)
+        except DBAPIError as exc:
+            self.mark_down(str(exc.orig))
+            return
+        healthy = self.max_lag_seconds <= 0 or lag <= self.max_lag_seconds
+        if healthy != self._healthy:
+            logger.warning("read_replica_lag", lag_seconds=lag, routed_to="replica" if healthy else "primary")
+        self._healthy = healthy
+
+    def mark_down(self, reason: str) -> None:
+        if self._healthy or time.monotonic() >= self._down_until:
+            logger.warning("read_replica_unavailable", reason=reason, retry_seconds=self.retry_seconds)
+        # Stays on the primary after the retry period until a probe succeeds again
+        self._healthy = False
+        self._down_until = time.monotonic() + self.retry_seconds
+        self._next_check = self._down_until
+
+    def on_error(self, context) -> None:
+        """``handle_error`` listener for replica engines."""
+        # Lost or refused connections open the circuit; query errors do not
+        if context.is_disconnect or context.connection is None:
+            self.mark_down(str(context.original_exception))
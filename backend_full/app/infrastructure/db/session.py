@@ -1,11 +1,101 @@
 from contextlib import contextmanager
-from sqlalchemy import create_engine
+from typing import Any, Callable, Optional, TypeVar, Union
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
+from starlette.concurrency import run_in_threadpool
 from app.config import get_settings
+from app.infrastructure.db.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+from app.infrastructure.db.replica import ReplicaRouter
 
 settings = get_settings()
-engine = create_engine(settings.database_url, future=True, echo=False)
+
+
+def engine_options(url: str, name: str, pool_size: int, max_overflow: int, statement_timeout_ms: int) -> dict:
+    """``create_engine`` keyword arguments for a pooled engine named ``name`` (the key in ``/metrics/db``).
+
+    SQLite keeps SQLAlchemy's default pool; PostgreSQL gets the configured pool and a
+    server-side ``statement_timeout`` set at connect time, so it costs no round trip.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "postgresql":
+        return {}
+    options = {
+        "poolclass": InstrumentedAsyncQueuePool if parsed.get_driver_name() == "asyncpg" else InstrumentedQueuePool,
+        "pool_logging_name": name,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+    if statement_timeout_ms:
+        if parsed.get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(statement_timeout_ms)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+    return options
+
+
+def _background_engine() -> Engine:
+    # SQLite has a single writer anyway, and in-memory databases cannot be shared between engines
+    if make_url(settings.database_url).get_backend_name() == "sqlite":
+        return engine
+    return create_engine(
+        settings.database_url,
+        future=True,
+        echo=False,
+        **engine_options(
+            settings.database_url,
+            "background",
+            settings.db_background_pool_size,
+            settings.db_background_max_overflow,
+            settings.db_background_statement_timeout_ms,
+        ),
+    )
+
+
+# Request traffic and background writers (request logs, reconcile worker) use separate
+# pools, so a burst of log flushes never takes connections away from requests
+engine = create_engine(
+    settings.database_url,
+    future=True,
+    echo=False,
+    **engine_options(settings.database_url, "request", settings.db_pool_size, settings.db_max_overflow, settings.db_statement_timeout_ms),
+)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, future=True)
+background_engine = _background_engine()
+BackgroundSessionLocal = sessionmaker(bind=background_engine, autoflush=False, expire_on_commit=False, future=True)
+
+# Optional read replica for read-only routes, see ``get_read_db``
+read_engine: Optional[Engine] = None
+ReadSessionLocal: Optional[sessionmaker] = None
+if settings.database_read_url:
+    read_engine = create_engine(
+        settings.database_read_url,
+        future=True,
+        echo=False,
+        **engine_options(settings.database_read_url, "read", settings.db_pool_size, settings.db_max_overflow, settings.db_statement_timeout_ms),
+    )
+    ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, expire_on_commit=False, future=True)
+read_router = ReplicaRouter(
+    SessionLocal,
+    ReadSessionLocal,
+    max_lag_seconds=settings.database_read_max_lag_seconds,
+    check_interval_seconds=settings.database_read_check_interval_seconds,
+    retry_seconds=settings.database_read_retry_seconds,
+)
+
+T = TypeVar("T")
+
+# asyncio drivers used when DATABASE_ASYNC is on and no DATABASE_ASYNC_URL is given
+_ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+_async_engine: Optional[AsyncEngine] = None
+_AsyncSessionLocal: Optional[async_sessionmaker] = None
+_async_read_engine: Optional[AsyncEngine] = None
+_AsyncReadSessionLocal: Optional[async_sessionmaker] = None
 
 
 @contextmanager
@@ -19,3 +109,62 @@ def session_scope() -> Session:
         raise
     finally:
         session.close()
+
+
+def async_database_url(url: str) -> str:
+    """Swap the driver of a sync database URL for its asyncio counterpart."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver known for '{backend}', set DATABASE_ASYNC_URL")
+    return parsed.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    """Async session factory, created on first use so the asyncio driver is only required when enabled."""
+    global _async_engine, _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        url = settings.database_async_url or async_database_url(settings.database_url)
+        _async_engine = create_async_engine(
+            url,
+            echo=False,
+            **engine_options(url, "async", settings.db_pool_size, settings.db_max_overflow, settings.db_statement_timeout_ms),
+        )
+        _AsyncSessionLocal = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _AsyncSessionLocal
+
+
+def get_async_read_sessionmaker() -> async_sessionmaker:
+    """Async factory for read-only routes: the replica while ``read_router`` allows it, else the primary."""
+    global _async_read_engine, _AsyncReadSessionLocal
+    if not read_router.available():
+        return get_async_sessionmaker()
+    if _AsyncReadSessionLocal is None:
+        url = async_database_url(settings.database_read_url)
+        _async_read_engine = create_async_engine(
+            url,
+            echo=False,
+            **engine_options(url, "async_read", settings.db_pool_size, settings.db_max_overflow, settings.db_statement_timeout_ms),
+        )
+        event.listen(_async_read_engine.sync_engine, "handle_error", read_router.on_error)
+        _AsyncReadSessionLocal = async_sessionmaker(_async_read_engine, autoflush=False, expire_on_commit=False)
+    return _AsyncReadSessionLocal
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _AsyncSessionLocal, _async_read_engine, _AsyncReadSessionLocal
+    for async_engine in (_async_engine, _async_read_engine):
+        if async_engine is not None:
+            await async_engine.dispose()
+    _async_engine = _AsyncSessionLocal = _async_read_engine = _AsyncReadSessionLocal = None
+
+
+async def run_sync(db: Union[AsyncSession, Session], fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run synchronous ORM code ``fn(session, *args)`` without blocking the event loop.
+
+    An ``AsyncSession`` runs it on the asyncio driver through ``run_sync``; a plain
+    ``Session`` is handed to the threadpool instead.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
@@ -1,14 +1,41 @@
 import uvicorn
-from fastapi import FastAPI
+import structlog
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from app.config import get_settings
 from app.common.logging import setup_logging
-from app.api.v1.routes import auth, products, sales, catalog, users, stock, simple_catalog, me
+from app.api.v1.routes import auth, products, sales, catalog, users, stock, simple_catalog, me, metrics
 from app.audit.middleware import RequestLoggingMiddleware
+from app.audit.request_log_writer import request_log_writer
 from app.audit.listeners import register_listeners
-from app.infrastructure.db.session import SessionLocal
+from app.services import stock_totals
+from app.services.locations import ensure_default_location
+from app.infrastructure.db.session import SessionLocal, dispose_async_engine
 from app.security.auth import get_password_hash
 from app.models.models import User
+from app.common.errors import DomainError
+
+logger = structlog.get_logger()
+
+
+async def domain_error_handler(request: Request, exc: DomainError):
+    error_data = exc.to_dict()
+
+    # Internal error details are not shown to clients
+    if exc.is_internal:
+        error_data["message"] = "Internal server error"
+        error_data["details"] = {}
+        logger.exception("internal_error", code=exc.error_code.code, exc_info=exc)
+
+    return JSONResponse(status_code=error_data["http_status"], content={"error": error_data})
+
+
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # Every pooled connection stayed busy for DB_POOL_TIMEOUT_SECONDS; shed load instead of queueing
+    logger.warning("db_pool_exhausted", path=request.url.path)
+    return JSONResponse(status_code=503, content={"detail": "Database busy, retry later"}, headers={"Retry-After": "1"})
 
 
 def create_app() -> FastAPI:
@@ -28,6 +55,8 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     app.add_middleware(RequestLoggingMiddleware)
+    app.add_exception_handler(DomainError, domain_error_handler)
+    app.add_exception_handler(PoolTimeoutError, pool_timeout_handler)
 
     app.include_router(auth.router, prefix="/api/v1")
     app.include_router(products.router, prefix="/api/v1")
@@ -37,8 +66,10 @@ def create_app() -> FastAPI:
     app.include_router(stock.router, prefix="/api/v1")
     app.include_router(simple_catalog.router, prefix="/api/v1")
     app.include_router(me.router, prefix="/api/v1")
+    app.include_router(metrics.router, prefix="/api/v1")
 
     register_listeners()
+    stock_totals.register_listeners()
 
     @app.on_event("startup")
     def ensure_default_admin():
@@ -55,6 +86,26 @@ def create_app() -> FastAPI:
                 session.add(admin)
                 session.commit()
 
+    @app.on_event("startup")
+    def resolve_default_location():
+        """Validate the default location once instead of on the first product write."""
+        with SessionLocal() as session:
+            location_id = ensure_default_location(session)
+            logger.info("default_location", location_id=location_id)
+
+    @app.on_event("startup")
+    async def start_request_log_writer():
+        await request_log_writer.start()
+
+    @app.on_event("shutdown")
+    async def flush_request_logs():
+        """Write request logs still buffered in memory."""
+        await request_log_writer.stop()
+
+    @app.on_event("shutdown")
+    async def close_async_engine():
+        await dispose_async_engine()
+
     return app
 
 
@@ -8,6 +8,7 @@ from sqlalchemy import (
     DateTime,
     DECIMAL,
     ForeignKey,
+    Index,
     Integer,
     JSON,
     Numeric,
@@ -87,6 +88,14 @@ class Stock(Base):
     )
 
 
+class ProductStockTotal(Base):
+    """Materialized stock total per product across all locations."""
+
+    product_id: Mapped[int] = mapped_column(ForeignKey("product.id", ondelete="CASCADE"), primary_key=True, comment="Product reference")
+    quantity: Mapped[Decimal] = mapped_column(DECIMAL(18, 6), default=Decimal("0"), comment="Sum of stock quantity over locations")
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, comment="Last update timestamp")
+
+
 class ProductType(Base):
     """Types of products (wine, olive, etc)."""
 
@@ -94,6 +103,7 @@ class ProductType(Base):
     name: Mapped[str] = mapped_column(String(100), unique=True, comment="Type name")
     description: Mapped[Optional[str]] = mapped_column(String(255), nullable=True, comment="Extended description")
     is_composite: Mapped[bool] = mapped_column(Boolean, default=False, comment="Composite flag for recipes")
+    attributes: Mapped[list["AttributeDefinition"]] = relationship(order_by="AttributeDefinition.id")
 
 
 class Product(Base):
@@ -264,9 +274,22 @@ class SaleEvent(Base):
     terminal_id: Mapped[int] = mapped_column(ForeignKey("terminal.id"), comment="Terminal reference")
     location_id: Mapped[int] = mapped_column(ForeignKey("location.id"), comment="Location reference")
     payload: Mapped[dict] = mapped_column(JSON, comment="Original payload for audit")
-    status: Mapped[str] = mapped_column(String(16), default="pending", comment="pending/confirmed")
+    status: Mapped[str] = mapped_column(String(16), default="pending", comment="pending/confirmed/failed")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, comment="Creation time")
     confirmed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, comment="Confirmation time")
+    __table_args__ = (
+        # Queue scans of the reconcile worker: pending events per location, oldest first
+        Index("ix_sale_event_status_location", "status", "location_id", "id"),
+    )
+
+
+class IngestLocationError(Base):
+    """Unexpected reconcile errors of the ingest worker per location, shared with the metrics endpoint."""
+
+    location_id: Mapped[int] = mapped_column(ForeignKey("location.id"), primary_key=True, comment="Location reference")
+    errors: Mapped[int] = mapped_column(Integer, default=0, comment="Failed reconcile passes")
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True, comment="Last error message")
+    last_error_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, comment="Last error time")
 
 
 class SaleLine(Base):
@@ -150,6 +150,12 @@ class Product(BaseModel):
         from_attributes = True
 
 
+class ProductPage(BaseModel):
+    items: List[Product] = []
+    next_cursor: Optional[str] = None  # Opaque keyset cursor, None on the last page
+    total: Optional[int] = None  # Only computed for the first page
+
+
 class SaleRequest(BaseModel):
     product_id: int
-    quantity: Decimal
\ No newline at end of file
+    quantity: Decimal = Field(gt=0)
\ No newline at end of file
@@ -1,12 +1,36 @@
 import hashlib
 import hmac
+import tempfile
 import time
-from typing import Optional
-from fastapi import HTTPException, Header
+from dataclasses import dataclass
+from typing import AsyncIterator, BinaryIO, Optional
+from fastapi import HTTPException, Header, Request
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from app.common.cache import TTLCache, invalidate_on_commit
 from app.config import get_settings
 from app.infrastructure.db.session import SessionLocal
 from app.models.models import Terminal
 
+settings = get_settings()
+_terminal_cache = TTLCache(ttl_seconds=settings.terminal_cache_ttl_seconds, maxsize=settings.terminal_cache_size)
+
+
+@dataclass(frozen=True)
+class TerminalRecord:
+    """Detached snapshot of a terminal's credentials, safe to share between requests."""
+
+    id: int
+    terminal_id: str
+    location_id: int
+    secret: str
+    status: str
+
+    @property
+    def is_active(self) -> bool:
+        return self.status == "active"
+
 
 def _canonical_string(method: str, path: str, timestamp: str, body_hash: str) -> bytes:
     return f"{method.upper()}|{path}|{timestamp}|{body_hash}".encode()
@@ -16,6 +40,70 @@ def _hash_body(body: bytes) -> str:
     return hashlib.sha256(body).hexdigest()
 
 
+def load_terminal(db: Session, terminal_id: str) -> Optional[TerminalRecord]:
+    terminal = db.query(Terminal).filter_by(terminal_id=terminal_id).first()
+    if terminal is None:
+        return None
+    return TerminalRecord(
+        id=terminal.id,
+        terminal_id=terminal.terminal_id,
+        location_id=terminal.location_id,
+        secret=terminal.secret_hash,
+        status=terminal.status or "active",
+    )
+
+
+def get_terminal(terminal_id: str, db: Optional[Session] = None) -> Optional[TerminalRecord]:
+    """Terminal credentials for a public terminal id; only hits the database on a cache miss.
+
+    Unknown terminals are not cached so that a newly registered terminal is accepted immediately.
+    """
+    terminal = _terminal_cache.get(terminal_id)
+    if terminal is None:
+        # A revocation or secret rotation committed during the load must not be overwritten
+        version = _terminal_cache.version
+        if db is None:
+            with SessionLocal() as session:
+                terminal = load_terminal(session, terminal_id)
+        else:
+            terminal = load_terminal(db, terminal_id)
+        if terminal is not None:
+            _terminal_cache.set(terminal_id, terminal, version=version)
+    return terminal
+
+
+def invalidate_terminals(terminal_ids: Optional[set] = None) -> None:
+    if terminal_ids is None:
+        _terminal_cache.clear()
+        return
+    for terminal_id in terminal_ids:
+        _terminal_cache.invalidate(terminal_id)
+
+
+def _cached_terminal_id(terminal: Terminal) -> str:
+    # Renaming a terminal must evict the entry cached under the previous id
+    history = inspect(terminal).attrs.terminal_id.history
+    return (history.deleted or [terminal.terminal_id])[0]
+
+
+# Secret rotation, status changes and moves between locations drop the cached credentials
+invalidate_on_commit(Terminal, callback=invalidate_terminals, key=_cached_terminal_id)
+
+
+def _check_timestamp(timestamp: str) -> None:
+    now = int(time.time())
+    if abs(now - int(timestamp)) > settings.hmac_clock_skew_seconds:
+        raise HTTPException(status_code=401, detail="Timestamp out of range")
+
+
+def _check_signature(terminal: TerminalRecord, method: str, path: str, body_hash: str, signature: str, timestamp: str) -> None:
+    message = _canonical_string(method, path, timestamp, body_hash)
+    computed = hmac.new(terminal.secret.encode(), message, hashlib.sha256).hexdigest()
+    _check_timestamp(timestamp)
+    if not hmac.compare_digest(computed, signature):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+
 def verify_hmac_signature(
     method: str,
     path: str,
@@ -23,26 +111,72 @@ def verify_hmac_signature(
     terminal_id: str,
     signature: str,
     timestamp: str,
-) -> None:
-    settings = get_settings()
-    with SessionLocal() as session:
-        terminal: Optional[Terminal] = session.query(Terminal).filter_by(terminal_id=terminal_id).first()
-        if not terminal:
-            raise HTTPException(status_code=401, detail="Invalid terminal")
-        secret = terminal.secret_hash.encode()
-    body_hash = _hash_body(body)
-    message = _canonical_string(method, path, timestamp, body_hash)
-    computed = hmac.new(secret, message, hashlib.sha256).hexdigest()
-    now = int(time.time())
-    if abs(now - int(timestamp)) > settings.hmac_clock_skew_seconds:
-        raise HTTPException(status_code=401, detail="Timestamp out of range")
-    if not hmac.compare_digest(computed, signature):
-        raise HTTPException(status_code=401, detail="Invalid signature")
+    db: Optional[Session] = None,
+) -> TerminalRecord:
+    terminal = get_terminal(terminal_id, db)
+    if not terminal or not terminal.is_active:
+        raise HTTPException(status_code=401, detail="Invalid terminal")
+    _check_signature(terminal, method, path, _hash_body(body), signature, timestamp)
+    return terminal
 
 
 async def hmac_dependency(
+    request: Request,
     x_terminal_id: str = Header(..., alias="X-Terminal-ID"),
     x_signature: str = Header(..., alias="X-Signature"),
     x_timestamp: str = Header(..., alias="X-Timestamp"),
-) -> str:
-    return x_terminal_id
+) -> TerminalRecord:
+    """Verify a signed terminal request and return the resolved terminal.
+
+    Cached terminals are checked on the event loop; only a cache miss goes to the threadpool.
+    """
+    body = await request.body()
+    args = (request.method, request.url.path, body, x_terminal_id, x_signature, x_timestamp)
+    if _terminal_cache.get(x_terminal_id) is not None:
+        return verify_hmac_signature(*args)
+    return await run_in_threadpool(verify_hmac_signature, *args)
+
+
+@dataclass
+class SignedBody:
+    """Verified terminal plus the request body spooled to a temporary file, positioned at the start."""
+
+    terminal: TerminalRecord
+    body: BinaryIO
+
+
+async def hmac_stream_dependency(
+    request: Request,
+    x_terminal_id: str = Header(..., alias="X-Terminal-ID"),
+    x_signature: str = Header(..., alias="X-Signature"),
+    x_timestamp: str = Header(..., alias="X-Timestamp"),
+) -> AsyncIterator[SignedBody]:
+    """Verify a signed request while streaming its body, for payloads too large to buffer.
+
+    The body is hashed chunk by chunk and spooled to memory up to
+    ``signed_body_spool_bytes``, then to disk. Bodies over ``signed_body_max_bytes``
+    are rejected with 413 before they are read in full.
+    """
+    terminal = _terminal_cache.get(x_terminal_id) or await run_in_threadpool(get_terminal, x_terminal_id)
+    if not terminal or not terminal.is_active:
+        raise HTTPException(status_code=401, detail="Invalid terminal")
+    _check_timestamp(x_timestamp)
+    max_bytes = settings.signed_body_max_bytes
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise HTTPException(status_code=413, detail="Request body too large")
+
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.signed_body_spool_bytes)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail="Request body too large")
+            digest.update(chunk)
+            spool.write(chunk)
+        _check_signature(terminal, request.method, request.url.path, digest.hexdigest(), x_signature, x_timestamp)
+        spool.seek(0)
+        yield SignedBody(terminal=terminal, body=spool)
+    finally:
+        spool.close()
@@ -0,0 +1,74 @@
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Union
+
+from sqlalchemy.orm import Session
+
+from app.common.cache import TTLCache, invalidate_on_commit
+from app.config import get_settings
+from app.models.models import Permission, Role, RolePermission, UserRole
+
+GLOBAL_SCOPE = "global"
+
+settings = get_settings()
+_permission_cache = TTLCache(ttl_seconds=settings.permission_cache_ttl_seconds, maxsize=settings.permission_cache_size)
+
+
+@dataclass(frozen=True)
+class PermissionSet:
+    """Resolved permissions of a user: code -> scopes (GLOBAL_SCOPE or role location ids)."""
+
+    scopes: Dict[str, FrozenSet[Union[str, int, None]]] = field(default_factory=dict)
+    is_super_admin: bool = False
+
+    def allows(self, permission: str, location_id: Optional[int] = None) -> bool:
+        if self.is_super_admin:
+            return True
+        scopes = self.scopes.get(permission)
+        if not scopes:
+            return False
+        return GLOBAL_SCOPE in scopes or location_id in scopes
+
+    @property
+    def codes(self) -> List[str]:
+        if self.is_super_admin:
+            return ["*"]
+        return sorted(self.scopes)
+
+
+SUPER_ADMIN_PERMISSIONS = PermissionSet(is_super_admin=True)
+
+
+def load_permissions(db: Session, user_id: int) -> PermissionSet:
+    """Resolve all permissions of a user with a single join."""
+    rows = (
+        db.query(Permission.code, Role.scope, Role.location_id)
+        .join(RolePermission, RolePermission.permission_id == Permission.id)
+        .join(Role, Role.id == RolePermission.role_id)
+        .join(UserRole, UserRole.role_id == Role.id)
+        .filter(UserRole.user_id == user_id)
+        .all()
+    )
+    scopes: Dict[str, set] = {}
+    for code, scope, location_id in rows:
+        scopes.setdefault(code, set()).add(GLOBAL_SCOPE if scope == GLOBAL_SCOPE else location_id)
+    return PermissionSet(scopes={code: frozenset(values) for code, values in scopes.items()})
+
+
+def resolve_permissions(user, db: Session) -> PermissionSet:
+    """Permission set of a user, served from the process-wide cache when possible."""
+    if user.id in settings.super_admin_ids:
+        return SUPER_ADMIN_PERMISSIONS
+    return _permission_cache.get_or_load(user.id, lambda: load_permissions(db, user.id))
+
+
+def invalidate_permissions(user_ids: Optional[set] = None) -> None:
+    """Drop cached permissions for the given users, or for everybody."""
+    if user_ids is None:
+        _permission_cache.clear()
+        return
+    for user_id in user_ids:
+        _permission_cache.invalidate(user_id)
+
+
+invalidate_on_commit(UserRole, callback=invalidate_permissions, key=lambda user_role: user_role.user_id)
+invalidate_on_commit(Role, RolePermission, Permission, callback=lambda _: invalidate_permissions())
@@ -0,0 +1,62 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from app.common.cache import TTLCache, invalidate_on_commit
+from app.config import get_settings
+from app.models.models import User
+
+settings = get_settings()
+_principal_cache = TTLCache(ttl_seconds=settings.principal_cache_ttl_seconds, maxsize=settings.principal_cache_size)
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Detached snapshot of an active user, safe to share between requests."""
+
+    id: int
+    username: str
+    is_superuser: bool
+    is_active: bool = True
+
+
+def load_principal(db: Session, username: str) -> Optional[Principal]:
+    user = db.query(User).filter(User.username == username, User.is_active == True).first()  # noqa: E712
+    if user is None:
+        return None
+    return Principal(id=user.id, username=user.username, is_superuser=user.is_superuser)
+
+
+def get_principal(db: Session, username: str) -> Optional[Principal]:
+    """Active principal for a token subject; only hits the database on a cache miss.
+
+    Unknown or inactive users are not cached so that they are rejected consistently.
+    """
+    principal = _principal_cache.get(username)
+    if principal is None:
+        # A deactivation committed during the load must not be overwritten by the stale principal
+        version = _principal_cache.version
+        principal = load_principal(db, username)
+        if principal is not None:
+            _principal_cache.set(username, principal, version=version)
+    return principal
+
+
+def invalidate_principals(usernames: Optional[set] = None) -> None:
+    if usernames is None:
+        _principal_cache.clear()
+        return
+    for username in usernames:
+        _principal_cache.invalidate(username)
+
+
+def _cached_username(user: User) -> str:
+    # A rename must evict the principal cached under the previous name
+    history = inspect(user).attrs.username.history
+    return (history.deleted or [user.username])[0]
+
+
+# Any user write (deactivation, rename, superuser flag) drops the affected principal
+invalidate_on_commit(User, callback=invalidate_principals, key=_cached_username)
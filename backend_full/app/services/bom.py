@@ -0,0 +1,125 @@
+"""Bill-of-materials expansion for composite products.
+
+A composite is flattened recursively into the leaf products it consumes, with
+quantities in the leaf's base unit per one base unit of the composite. Flattened
+BOMs are cached per product and dropped whenever a recipe, unit ratio or product
+changes, since an edit deep in a recipe affects every composite above it.
+"""
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.common.cache import TTLCache, invalidate_on_commit
+from app.common.errors import ValidationError
+from app.config import get_settings
+from app.models.models import CompositeComponent, Product, ProductUnit
+from app.services.units import UnitConverter
+
+settings = get_settings()
+_bom_cache = TTLCache(ttl_seconds=settings.bom_cache_ttl_seconds, maxsize=settings.bom_cache_size)
+
+Bom = Dict[int, Decimal]
+
+
+class BomExpander:
+    """Flattens composites into leaf product quantities using cached BOMs."""
+
+    def __init__(self, db: Session, converter: Optional[UnitConverter] = None):
+        self.db = db
+        self.converter = converter or UnitConverter(db)
+
+    def flatten(self, product_id: int) -> Bom:
+        return self.flatten_many([product_id])[product_id]
+
+    def flatten_many(self, product_ids: Iterable[int]) -> Dict[int, Bom]:
+        """Map products to ``{leaf_product_id: base quantity per base unit}``.
+
+        Plain products map to themselves with quantity 1. Recipes missing from the
+        cache are loaded one nesting level per query; a cycle raises ValidationError.
+        """
+        found: Dict[int, Bom] = {}
+        missing = set()
+        for product_id in set(product_ids):
+            bom = _bom_cache.get(product_id)
+            if bom is None:
+                missing.add(product_id)
+            else:
+                found[product_id] = bom
+        if missing:
+            version = _bom_cache.version
+            recipes = self._load_recipes(missing)
+            flattened: Dict[int, Bom] = {}
+            for product_id in missing:
+                self._flatten(product_id, recipes, flattened, [])
+            for product_id, bom in flattened.items():
+                _bom_cache.set(product_id, bom, version=version)
+            found.update((product_id, flattened[product_id]) for product_id in missing)
+        return found
+
+    def consumption(self, items: Iterable[Tuple[int, Decimal]]) -> Dict[int, Decimal]:
+        """Total leaf consumption in base units for ``(product_id, base quantity)`` pairs."""
+        items = list(items)
+        boms = self.flatten_many(product_id for product_id, _ in items)
+        consumed: Dict[int, Decimal] = {}
+        for product_id, quantity in items:
+            for leaf_id, per_unit in boms[product_id].items():
+                consumed[leaf_id] = consumed.get(leaf_id, Decimal("0")) + quantity * per_unit
+        return consumed
+
+    def _load_recipes(self, product_ids: Set[int]) -> Dict[int, List[Tuple[int, Decimal]]]:
+        """Direct components of ``product_ids`` and everything below them, in base units."""
+        rows: List[CompositeComponent] = []
+        seen: Set[int] = set()
+        level = set(product_ids)
+        while level:
+            seen |= level
+            components = self.db.query(CompositeComponent).filter(CompositeComponent.parent_product_id.in_(level)).all()
+            rows.extend(components)
+            level = {comp.component_product_id for comp in components} - seen
+        snapshots = self.converter.known_product_units(comp.component_product_id for comp in rows)
+        recipes: Dict[int, List[Tuple[int, Decimal]]] = {}
+        for comp in rows:
+            snapshot = snapshots.get(comp.component_product_id)
+            if snapshot is None:
+                raise ValidationError(f"Component product {comp.component_product_id} missing")
+            ratio = snapshot.ratio(comp.unit_id)
+            if ratio is None:
+                raise ValidationError(
+                    f"No conversion for unit {comp.unit_id} of component {comp.component_product_id} "
+                    f"in recipe of product {comp.parent_product_id}"
+                )
+            recipes.setdefault(comp.parent_product_id, []).append(
+                (comp.component_product_id, Decimal(str(comp.quantity)) * ratio)
+            )
+        return recipes
+
+    def _flatten(self, product_id: int, recipes: Dict[int, List[Tuple[int, Decimal]]], flattened: Dict[int, Bom], path: List[int]) -> Bom:
+        if product_id in flattened:
+            return flattened[product_id]
+        if product_id in path:
+            cycle = " -> ".join(str(pid) for pid in path[path.index(product_id):] + [product_id])
+            raise ValidationError(f"Composite cycle: {cycle}")
+        components = recipes.get(product_id)
+        if not components:
+            bom = {product_id: Decimal("1")}
+        else:
+            bom = {}
+            path.append(product_id)
+            for component_id, quantity in components:
+                child = self._flatten(component_id, recipes, flattened, path)
+                for leaf_id, per_unit in child.items():
+                    bom[leaf_id] = bom.get(leaf_id, Decimal("0")) + quantity * per_unit
+            path.pop()
+        flattened[product_id] = bom
+        return bom
+
+
+def invalidate_boms(_: Optional[set] = None) -> None:
+    _bom_cache.clear()
+
+
+# Any recipe or ratio edit may change composites several levels up, so drop them all
+invalidate_on_commit(CompositeComponent, callback=invalidate_boms)
+invalidate_on_commit(ProductUnit, callback=invalidate_boms)
+invalidate_on_commit(Product, callback=invalidate_boms)
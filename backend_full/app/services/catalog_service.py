@@ -1,5 +1,14 @@
+from typing import Optional
+from sqlalchemy import and_, select
 from sqlalchemy.orm import Session
-from app.models.models import Product, PriceList, Stock
+from app.common.cache import TTLCache, invalidate_on_commit
+from app.common.etag import Representation
+from app.config import get_settings
+from app.models.models import Product, PriceList, Stock, Unit
+
+settings = get_settings()
+# Serialized catalogs per location, shared by all terminals polling that location
+_catalog_cache = TTLCache(ttl_seconds=settings.catalog_cache_ttl_seconds, maxsize=settings.catalog_cache_size)
 
 
 class CatalogService:
@@ -9,26 +18,68 @@ class CatalogService:
         self.db = db
 
     def catalog_for_location(self, location_id: int) -> list[dict]:
-        products = self.db.query(Product).filter(Product.is_active == True).all()  # noqa: E712
-        prices = {
-            (p.product_id, p.unit_code): p
-            for p in self.db.query(PriceList).filter(PriceList.location_id == location_id).all()
-        }
-        stocks = {s.product_id: s for s in self.db.query(Stock).filter(Stock.location_id == location_id).all()}
-        items = []
-        for product in products:
-            price_entry = prices.get((product.id, product.base_unit_code))
-            stock_entry = stocks.get(product.id)
-            items.append(
-                {
-                    "id": product.id,
-                    "name": product.name,
-                    "sku": product.sku,
-                    "price": float(price_entry.amount) if price_entry else None,
-                    "currency": price_entry.currency if price_entry else None,
-                    "stock": float(stock_entry.quantity) if stock_entry else 0,
-                    "unit": product.base_unit_code,
-                    "category": product.primary_category,
-                }
+        """Active products with their base-unit price and stock at the location, in one query."""
+        rows = self.db.execute(
+            select(
+                Product.id,
+                Product.name,
+                Product.sku,
+                Product.primary_category,
+                Unit.code,
+                PriceList.amount,
+                PriceList.currency,
+                Stock.quantity,
+            )
+            .join(Unit, Unit.id == Product.base_unit_id)
+            .outerjoin(
+                PriceList,
+                and_(
+                    PriceList.product_id == Product.id,
+                    PriceList.location_id == location_id,
+                    PriceList.unit_id == Product.base_unit_id,
+                ),
             )
-        return items
+            .outerjoin(Stock, and_(Stock.product_id == Product.id, Stock.location_id == location_id))
+            .where(Product.is_active == True)  # noqa: E712
+            .order_by(Product.id)
+        ).all()
+        return [
+            {
+                "id": product_id,
+                "name": name,
+                "sku": sku,
+                "price": float(amount) if amount is not None else None,
+                "currency": currency if amount is not None else None,
+                "stock": float(quantity) if quantity is not None else 0,
+                "unit": unit_code,
+                "category": category,
+            }
+            for product_id, name, sku, category, unit_code, amount, currency, quantity in rows
+        ]
+
+    def catalog_representation(self, location_id: int) -> Representation:
+        """``/catalog`` body and ETag for a location, built and serialized once per cache version."""
+        representation = _catalog_cache.get(location_id)
+        if representation is None:
+            version = _catalog_cache.version
+            items = self.catalog_for_location(location_id)
+            representation = Representation.of({"location_id": location_id, "items": items})
+            _catalog_cache.set(location_id, representation, version=version)
+        return representation
+
+
+def cached_catalog(location_id: int) -> Optional[Representation]:
+    return _catalog_cache.get(location_id)
+
+
+def invalidate_catalogs(location_ids: Optional[set] = None) -> None:
+    if location_ids is None:
+        _catalog_cache.clear()
+        return
+    for location_id in location_ids:
+        _catalog_cache.invalidate(location_id)
+
+
+# Stock and price edits drop the catalog of their location; product and unit edits drop all
+invalidate_on_commit(Stock, PriceList, callback=invalidate_catalogs, key=lambda row: row.location_id)
+invalidate_on_commit(Product, Unit, callback=invalidate_catalogs)
@@ -0,0 +1,152 @@
+"""Durable ingest queue: sale events stored as ``pending`` are reconciled by a worker.
+
+In queue mode terminals only append events to ``sale_event`` and are acknowledged
+right away; ``run_worker`` later applies their stock in batches. Every batch runs
+in its own transaction scoped to one location, so stock locks of one location never
+hold up another, and workers can split locations between them with ``partition``.
+"""
+import threading
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.common.errors import DomainError
+from app.infrastructure.db.dialects import upsert_insert
+from app.models.models import IngestLocationError, SaleEvent
+from app.services.sales_service import SalesService
+import structlog
+
+logger = structlog.get_logger()
+
+
+def pending_locations(db: Session, partition: int = 0, partitions: int = 1) -> List[int]:
+    """Locations with pending events that belong to ``partition`` out of ``partitions``."""
+    query = select(SaleEvent.location_id).where(SaleEvent.status == "pending").distinct()
+    if partitions > 1:
+        query = query.where(SaleEvent.location_id % partitions == partition)
+    return list(db.execute(query.order_by(SaleEvent.location_id)).scalars())
+
+
+def _confirm_one_by_one(session_factory: Callable[[], Session], location_id: int, event_ids: List[str]) -> Tuple[int, int]:
+    """Retry a failed batch event by event so one bad event does not block the queue."""
+    confirmed = failed = 0
+    for event_id in event_ids:
+        with session_factory() as db:
+            service = SalesService(db)
+            events = service.claim_pending(location_id, 1, event_ids=[event_id])
+            if not events:
+                continue
+            try:
+                service.confirm_events(location_id, events)
+                db.commit()
+                confirmed += 1
+            except DomainError as exc:
+                db.rollback()
+                service.mark_failed([event_id])
+                db.commit()
+                failed += 1
+                logger.warning("ingest_event_failed", event_id=event_id, location_id=location_id, error=str(exc))
+    return confirmed, failed
+
+
+def reconcile_location(session_factory: Callable[[], Session], location_id: int, batch_size: int) -> Tuple[int, int]:
+    """Reconcile the oldest batch of pending events of one location; returns (confirmed, failed)."""
+    with session_factory() as db:
+        service = SalesService(db)
+        events = service.claim_pending(location_id, batch_size)
+        if not events:
+            return 0, 0
+        try:
+            service.confirm_events(location_id, events)
+            db.commit()
+            return len(events), 0
+        except DomainError:
+            db.rollback()
+    return _confirm_one_by_one(session_factory, location_id, [event["event_id"] for event in events])
+
+
+def run_once(session_factory: Callable[[], Session], batch_size: int, partition: int = 0, partitions: int = 1) -> int:
+    """Reconcile one batch per pending location of this partition, round-robin; returns processed events."""
+    with session_factory() as db:
+        locations = pending_locations(db, partition, partitions)
+    processed = 0
+    for location_id in locations:
+        try:
+            confirmed, failed = reconcile_location(session_factory, location_id, batch_size)
+        except Exception as exc:
+            # Deadlocks, statement timeouts or data errors of one location must not stop the others
+            logger.exception("ingest_location_error", location_id=location_id)
+            record_error(session_factory, location_id, exc)
+            continue
+        if confirmed or failed:
+            logger.info("ingest_batch_reconciled", location_id=location_id, confirmed=confirmed, failed=failed)
+        processed += confirmed + failed
+    return processed
+
+
+def record_error(session_factory: Callable[[], Session], location_id: int, exc: Exception) -> None:
+    """Count an unexpected reconcile error of a location for ``lag_metrics``."""
+    now = datetime.utcnow()
+    message = f"{type(exc).__name__}: {exc}"[:1000]
+    try:
+        with session_factory() as db:
+            stmt = upsert_insert(db, IngestLocationError).values(
+                location_id=location_id, errors=1, last_error=message, last_error_at=now
+            )
+            db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[IngestLocationError.location_id],
+                    set_={"errors": IngestLocationError.errors + 1, "last_error": message, "last_error_at": now},
+                )
+            )
+            db.commit()
+    except Exception:
+        logger.exception("ingest_error_not_recorded", location_id=location_id)
+
+
+def run_worker(
+    session_factory: Callable[[], Session],
+    batch_size: int,
+    poll_interval_seconds: float,
+    partition: int = 0,
+    partitions: int = 1,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    stop = stop or threading.Event()
+    logger.info("ingest_worker_started", partition=partition, partitions=partitions)
+    while not stop.is_set():
+        try:
+            processed = run_once(session_factory, batch_size, partition, partitions)
+        except Exception:
+            logger.exception("ingest_worker_error")
+            processed = 0
+        if not processed:
+            stop.wait(poll_interval_seconds)
+
+
+def lag_metrics(db: Session) -> dict:
+    """Queue depth, age of the oldest pending event and worker errors, overall and per location."""
+    rows = db.execute(
+        select(SaleEvent.location_id, func.count(), func.min(SaleEvent.created_at))
+        .where(SaleEvent.status == "pending")
+        .group_by(SaleEvent.location_id)
+    ).all()
+    failed = db.execute(select(func.count()).where(SaleEvent.status == "failed")).scalar_one()
+    errors = {row.location_id: row for row in db.scalars(select(IngestLocationError))}
+    now = datetime.utcnow()
+    locations = {
+        location_id: {"depth": depth, "oldest_pending_age_seconds": (now - oldest).total_seconds()}
+        for location_id, depth, oldest in rows
+    }
+    for location_id, error in errors.items():
+        location = locations.setdefault(location_id, {"depth": 0, "oldest_pending_age_seconds": 0.0})
+        location.update(errors=error.errors, last_error=error.last_error, last_error_at=error.last_error_at)
+    return {
+        "depth": sum(location["depth"] for location in locations.values()),
+        "oldest_pending_age_seconds": max((location["oldest_pending_age_seconds"] for location in locations.values()), default=0.0),
+        "failed": failed,
+        "errors": sum(error.errors for error in errors.values()),
+        "locations": locations,
+    }
@@ -0,0 +1,54 @@
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.common.cache import TTLCache, invalidate_on_commit
+from app.config import get_settings
+from app.models.models import Location
+
+settings = get_settings()
+# Id of the location used by the simple catalog; resolved once per process
+_default_location_cache = TTLCache(ttl_seconds=settings.reference_cache_ttl_seconds, maxsize=1)
+
+
+def _find_default_location(db: Session) -> Optional[Location]:
+    active = db.query(Location).filter(Location.is_active == True)  # noqa: E712
+    # The configured id first, then the configured name, then any active location
+    return (
+        active.filter(Location.id == settings.default_location_id).first()
+        or active.filter(Location.name == settings.default_location_name).first()
+        or active.order_by(Location.id).first()
+    )
+
+
+def ensure_default_location(db: Session) -> int:
+    """Resolve the default location, creating it when the database has none. Called at startup."""
+    loc = _find_default_location(db)
+    if loc is None:
+        loc = Location(name=settings.default_location_name, kind="warehouse")
+        db.add(loc)
+        db.commit()
+    _default_location_cache.set("id", loc.id)
+    return loc.id
+
+
+def default_location_id(db: Session) -> int:
+    """Cached id of the default location; dropped whenever a location is created or changed."""
+    location_id = _default_location_cache.get("id")
+    if location_id is not None:
+        return location_id
+    version = _default_location_cache.version
+    loc = _find_default_location(db)
+    if loc is None:
+        # Only when locations were removed after startup; the caller's commit keeps it
+        loc = Location(name=settings.default_location_name, kind="warehouse")
+        db.add(loc)
+        db.flush()
+        return loc.id
+    _default_location_cache.set("id", loc.id, version=version)
+    return loc.id
+
+
+def _invalidate_default_location(_: Optional[set] = None) -> None:
+    _default_location_cache.clear()
+
+
+invalidate_on_commit(Location, callback=_invalidate_default_location)
@@ -1,9 +1,14 @@
 from datetime import datetime
-from decimal import Decimal
-from typing import List
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
+from app.audit.listeners import audit_inserts
 from app.common.errors import IdempotencyError
-from app.models.models import SaleEvent, SaleLine, Product, CompositeComponent
+from app.infrastructure.db.dialects import upsert_insert
+from app.models.models import SaleEvent, SaleLine
+from app.services.bom import BomExpander
 from app.services.stock_service import StockService
 import structlog
 
@@ -13,9 +18,15 @@ logger = structlog.get_logger()
 class SalesService:
     """Handles ingestion and reconciliation of sale events."""
 
+    # Events reconciled or ingested per round of bulk queries
+    RECONCILE_BATCH_SIZE = 500
+    INGEST_BATCH_SIZE = 500
+
     def __init__(self, db: Session):
         self.db = db
         self.stock_service = StockService(db)
+        self.converter = self.stock_service.converter
+        self.bom = BomExpander(db, self.converter)
 
     def _convert_decimal_in_payload(self, obj):
         """Convert Decimal objects to float for JSON serialization"""
@@ -28,66 +39,233 @@ class SalesService:
         return obj
 
     def ingest_sale(self, event_id: str, terminal_id: int, location_id: int, lines: List[dict]) -> SaleEvent:
-        existing = self.db.query(SaleEvent).filter_by(event_id=event_id).first()
-        if existing:
-            raise IdempotencyError("Event already ingested")
-        
-        # Convert Decimal objects in lines for JSON serialization
-        serialized_lines = self._convert_decimal_in_payload(lines)
-        payload = {"lines": serialized_lines}
-        sale = SaleEvent(event_id=event_id, terminal_id=terminal_id, location_id=location_id, payload=payload, status="pending")
-        self.db.add(sale)
-        self.db.flush()
+        unit_ids = self.converter.unit_ids(line["unit"] for line in lines)
+        sale = self._insert_events(terminal_id, location_id, [{"event_id": event_id, "lines": lines}]).get(event_id)
+        if sale is None:
+            raise IdempotencyError("Event already ingested", details={"event_id": event_id})
         for line in lines:
-            sale_line = SaleLine(
-                sale_event_id=sale.id,
-                product_id=line["product_id"],
-                quantity=Decimal(str(line["quantity"])),
-                unit_code=line["unit"],
-                currency=line.get("currency", "USD"),
-                price=Decimal(str(line.get("price", "0"))),
-            )
-            self.db.add(sale_line)
+            self.db.add(SaleLine(**self._sale_line_values(sale.id, line, unit_ids)))
         logger.info("sale_ingested", event_id=event_id)
         return sale
 
-    def _expand_components(self, product_id: int, quantity: Decimal, unit: str) -> List[dict]:
-        components = self.db.query(CompositeComponent).filter_by(parent_product_id=product_id).all()
-        if not components:
-            return [{"product_id": product_id, "quantity": quantity, "unit": unit}]
-        expanded: List[dict] = []
-        for comp in components:
-            expanded.append(
-                {
-                    "product_id": comp.component_product_id,
-                    "quantity": quantity * Decimal(comp.quantity),
-                    "unit": comp.unit_code,
-                }
+    def _sale_line_values(self, sale_event_id: int, line: dict, unit_ids: Dict[str, int]) -> dict:
+        return {
+            "sale_event_id": sale_event_id,
+            "product_id": line["product_id"],
+            "quantity": Decimal(str(line["quantity"])),
+            "unit_id": unit_ids[line["unit"]],
+            "currency": line.get("currency", "USD"),
+            "price": Decimal(str(line.get("price", "0"))),
+        }
+
+    def _insert_events(self, terminal_id: int, location_id: int, events: List[dict]) -> Dict[str, SaleEvent]:
+        """Insert events with ``INSERT ... ON CONFLICT (event_id) DO NOTHING RETURNING``.
+
+        Duplicate detection and insertion are one atomic statement, so concurrent retries
+        cannot race into a unique-constraint error. Only newly inserted events are returned.
+        """
+        now = datetime.utcnow()
+        stmt = (
+            upsert_insert(self.db, SaleEvent)
+            .values(
+                [
+                    {
+                        "event_id": event["event_id"],
+                        "terminal_id": terminal_id,
+                        "location_id": location_id,
+                        # Decimal quantities are stored as floats in the JSON audit payload
+                        "payload": {"lines": self._convert_decimal_in_payload(event["lines"])},
+                        "status": "pending",
+                        "created_at": now,
+                    }
+                    for event in events
+                ]
             )
-        return expanded
+            .on_conflict_do_nothing(index_elements=[SaleEvent.event_id])
+            .returning(SaleEvent)
+        )
+        inserted = {sale.event_id: sale for sale in self.db.scalars(stmt)}
+        audit_inserts(self.db, inserted.values())
+        return inserted
+
+    def ingest_many(self, terminal_id: int, location_id: int, events: List[dict]) -> Dict[str, SaleEvent]:
+        """Insert sale events with one multi-row statement and add their lines to the session.
+
+        Events whose id is already stored are skipped; only inserted events are returned.
+        """
+        if not events:
+            return {}
+        unit_ids = self.converter.unit_ids(line["unit"] for event in events for line in event["lines"])
+        sales = self._insert_events(terminal_id, location_id, events)
+        self.db.add_all(
+            SaleLine(**self._sale_line_values(sales[event["event_id"]].id, line, unit_ids))
+            for event in events
+            if event["event_id"] in sales
+            for line in event["lines"]
+        )
+        logger.info("sales_ingested", events=len(sales))
+        return sales
+
+    def ingest_batch(self, terminal_id: int, location_id: int, events: Iterable[dict]) -> List[dict]:
+        """Ingest many events with one duplicate check and one batched insert per chunk.
+
+        Returns one ``{"event_id", "status"}`` entry per input event, in order. The status is
+        ``accepted``, ``duplicate`` (already stored or repeated in the request) or
+        ``rejected`` with an ``error``; rejected events do not affect the others.
+        """
+        results: List[dict] = []
+        events = iter(events)
+        while True:
+            chunk = list(islice(events, self.INGEST_BATCH_SIZE))
+            if not chunk:
+                break
+            results.extend(self._ingest_chunk(terminal_id, location_id, chunk))
+        logger.info("sales_batch_ingested", terminal_id=terminal_id, events=len(results))
+        return results
+
+    def _ingest_chunk(self, terminal_id: int, location_id: int, events: List[dict]) -> List[dict]:
+        lines = [
+            line
+            for event in events
+            if isinstance(event, dict) and isinstance(event.get("lines"), list)
+            for line in event["lines"]
+            if isinstance(line, dict)
+        ]
+        unit_ids = self.converter.known_unit_ids(line["unit"] for line in lines if isinstance(line.get("unit"), str))
+        products = self.converter.known_product_units(line["product_id"] for line in lines if type(line.get("product_id")) is int)
+        errors = [self._event_error(event, unit_ids, products) for event in events]
+
+        results: List[dict] = []
+        accepted: Dict[str, dict] = {}
+        for event, error in zip(events, errors):
+            if error is not None:
+                event_id = event.get("event_id") if isinstance(event, dict) else None
+                results.append({"event_id": event_id, "status": "rejected", "error": error})
+            elif event["event_id"] in accepted:
+                results.append({"event_id": event["event_id"], "status": "duplicate"})
+            else:
+                accepted[event["event_id"]] = event
+                results.append({"event_id": event["event_id"], "status": "accepted"})
+        # ON CONFLICT DO NOTHING RETURNING tells new events from stored ones, including
+        # events stored concurrently, without a separate duplicate check
+        inserted = self.ingest_many(terminal_id, location_id, list(accepted.values()))
+        for result in results:
+            if result["status"] == "accepted" and result["event_id"] not in inserted:
+                result["status"] = "duplicate"
+        return results
+
+    def _event_error(self, event: dict, unit_ids: Dict[str, int], products: Dict[int, object]) -> Optional[str]:
+        if not isinstance(event, dict) or not isinstance(event.get("event_id"), str) or not event["event_id"]:
+            return "event_id is required"
+        if not isinstance(event.get("lines"), list) or not event["lines"]:
+            return "lines are required"
+        for index, line in enumerate(event["lines"]):
+            # bool is a subclass of int; ``true`` must not be booked as product 1
+            if not isinstance(line, dict) or type(line.get("product_id")) is not int or line["product_id"] not in products:
+                return f"line {index}: unknown product"
+            if not isinstance(line.get("unit"), str) or line["unit"] not in unit_ids:
+                return f"line {index}: unknown unit"
+            try:
+                quantity = Decimal(str(line["quantity"]))
+                price = Decimal(str(line.get("price", "0")))
+            except (KeyError, InvalidOperation):
+                return f"line {index}: invalid quantity or price"
+            # A negative quantity would credit stock; NaN would fail the insert of the whole chunk
+            if not quantity.is_finite() or quantity <= 0:
+                return f"line {index}: quantity must be positive"
+            if not price.is_finite() or price < 0:
+                return f"line {index}: price must not be negative"
+        return None
 
-    def reconcile_daily(self, terminal_id: int, location_id: int, events: List[dict]) -> dict:
-        applied_events = []
-        delta_counter: dict[int, dict[str, Decimal]] = {}
+    def _stock_deltas(self, events: List[dict]) -> Dict[int, Decimal]:
+        """Aggregate base-unit stock consumption of events, expanding composites into their leaves."""
+        lines = [line for event in events for line in event["lines"]]
+        unit_ids = self.converter.unit_ids(line["unit"] for line in lines)
+        sold: Dict[Tuple[int, int], Decimal] = {}
+        for line in lines:
+            key = (line["product_id"], unit_ids[line["unit"]])
+            sold[key] = sold.get(key, Decimal("0")) + Decimal(str(line["quantity"]))
+        items = [(product_id, unit_id, qty) for (product_id, unit_id), qty in sold.items()]
+        base_quantities = zip((product_id for product_id, _, _ in items), self.converter.to_base_many(items))
+        return {product_id: -qty for product_id, qty in self.bom.consumption(base_quantities).items()}
+
+    def _reconcile_batch(self, terminal_id: int, location_id: int, events: List[dict]) -> Tuple[List[str], Dict[int, Decimal]]:
+        unique = {}
         for event in events:
-            event_id = event["event_id"]
-            lines = event["lines"]
-            existing = self.db.query(SaleEvent).filter_by(event_id=event_id).first()
-            if existing and existing.status == "confirmed":
-                continue
-            if not existing:
-                self.ingest_sale(event_id, terminal_id, location_id, lines)
-            applied_events.append(event_id)
-            for line in lines:
-                expanded = self._expand_components(line["product_id"], Decimal(str(line["quantity"])), line["unit"])
-                for comp_line in expanded:
-                    pid = comp_line["product_id"]
-                    delta_counter.setdefault(pid, {"qty": Decimal("0"), "unit": comp_line["unit"]})
-                    delta_counter[pid]["qty"] += Decimal(str(comp_line["quantity"]))
-        for product_id, info in delta_counter.items():
-            self.stock_service.adjust_stock(location_id, product_id, -info["qty"], info["unit"])
-        self.db.query(SaleEvent).filter(SaleEvent.event_id.in_(applied_events)).update(
-            {"status": "confirmed", "confirmed_at": datetime.utcnow()}, synchronize_session=False
+            unique.setdefault(event["event_id"], event)
+        # Only events inserted or locked by this transaction are applied; the rest are
+        # confirmed, or being confirmed, by a concurrent retry or the queue worker
+        inserted = self.ingest_many(terminal_id, location_id, list(unique.values()))
+        locked = self._lock_unconfirmed([event_id for event_id in unique if event_id not in inserted])
+        to_apply = [event for event_id, event in unique.items() if event_id in inserted or event_id in locked]
+        if not to_apply:
+            return [], {}
+        deltas = self.confirm_events(location_id, to_apply)
+        return [event["event_id"] for event in to_apply], deltas
+
+    def _lock_unconfirmed(self, event_ids: List[str]) -> set:
+        """Lock stored events that are not confirmed yet and return their ids.
+
+        A row confirmed by a transaction this one waited for is re-checked after the
+        wait and left out, so its stock is never debited twice.
+        """
+        if not event_ids:
+            return set()
+        query = (
+            select(SaleEvent.event_id)
+            .where(SaleEvent.event_id.in_(event_ids), SaleEvent.status != "confirmed")
+            .order_by(SaleEvent.id)
+            .with_for_update()
+        )
+        return set(self.db.execute(query).scalars())
+
+    def confirm_events(self, location_id: int, events: List[dict]) -> Dict[int, Decimal]:
+        """Deduct the stock of stored events and mark them confirmed; returns the applied deltas."""
+        deltas = self._stock_deltas(events)
+        self.stock_service.debit(location_id, {product_id: -delta for product_id, delta in deltas.items()})
+        self._set_status([event["event_id"] for event in events], "confirmed", confirmed_at=datetime.utcnow())
+        return deltas
+
+    def _set_status(self, event_ids: List[str], status: str, **values) -> None:
+        self.db.execute(
+            update(SaleEvent)
+            .where(SaleEvent.event_id.in_(event_ids))
+            .values(status=status, **values)
+            .execution_options(synchronize_session=False)
+        )
+
+    def claim_pending(self, location_id: int, limit: int, event_ids: Optional[List[str]] = None) -> List[dict]:
+        """Lock up to ``limit`` pending events of a location, oldest first.
+
+        ``FOR UPDATE SKIP LOCKED`` lets several workers drain the same queue without
+        waiting on each other; rows stay locked until the caller's transaction ends.
+        """
+        query = (
+            select(SaleEvent.event_id, SaleEvent.payload)
+            .where(SaleEvent.status == "pending", SaleEvent.location_id == location_id)
+            .order_by(SaleEvent.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
         )
+        if event_ids is not None:
+            query = query.where(SaleEvent.event_id.in_(event_ids))
+        return [{"event_id": event_id, "lines": payload["lines"]} for event_id, payload in self.db.execute(query).all()]
+
+    def mark_failed(self, event_ids: List[str]) -> None:
+        """Take events that cannot be applied (e.g. insufficient stock) out of the queue."""
+        self._set_status(event_ids, "failed")
+
+    def reconcile_daily(self, terminal_id: int, location_id: int, events: Iterable[dict]) -> dict:
+        """Confirm a day of events and deduct their stock with a fixed number of queries per batch."""
+        applied_events: List[str] = []
+        applied_products: Dict[int, None] = {}
+        events = iter(events)
+        while True:
+            batch = list(islice(events, self.RECONCILE_BATCH_SIZE))
+            if not batch:
+                break
+            confirmed, deltas = self._reconcile_batch(terminal_id, location_id, batch)
+            applied_events.extend(confirmed)
+            applied_products.update(dict.fromkeys(deltas))
         logger.info("daily_reconcile", terminal_id=terminal_id, location_id=location_id, events=len(applied_events))
-        return {"confirmed_events": applied_events, "applied_products": list(delta_counter.keys())}
+        return {"confirmed_events": applied_events, "applied_products": list(applied_products)}
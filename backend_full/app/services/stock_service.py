@@ -1,7 +1,13 @@
+from datetime import datetime
 from decimal import Decimal
+from typing import Dict, Iterable, Tuple
+from sqlalchemy import case, select, tuple_, update
 from sqlalchemy.orm import Session
+from app.audit.listeners import audit_updates
+from app.common.cache import touch
 from app.common.errors import ValidationError
-from app.models.models import Stock, Product
+from app.models.models import Stock
+from app.services import stock_totals
 from app.services.units import UnitConverter
 
 
@@ -12,17 +18,118 @@ class StockService:
         self.db = db
         self.converter = UnitConverter(db)
 
-    def adjust_stock(self, location_id: int, product_id: int, quantity: Decimal, unit_code: str) -> Stock:
-        product = self.db.query(Product).get(product_id)
-        if not product:
-            raise ValidationError("Product missing")
-        quantity_base = self.converter.to_base(unit_code, quantity, product.base_unit_code)
-        stock = self.db.query(Stock).filter_by(location_id=location_id, product_id=product_id).first()
-        if not stock:
-            stock = Stock(location_id=location_id, product_id=product_id, unit_code=product.base_unit_code, quantity=Decimal("0"))
-            self.db.add(stock)
-        new_qty = stock.quantity + quantity_base
-        if new_qty < 0:
-            raise ValidationError("Insufficient stock")
-        stock.quantity = self.converter.normalize(product.base_unit_code, new_qty)
-        return stock
+    def adjust_stock(self, location_id: int, product_id: int, quantity: Decimal, unit_code: str) -> Decimal:
+        """Add ``quantity`` (negative to remove) in ``unit_code``; returns the new base quantity."""
+        unit_id = self.converter.unit_ids([unit_code])[unit_code]
+        quantity_base = self.converter.to_base_many([(product_id, unit_id, quantity)])[0]
+        if quantity_base < 0:
+            return self.debit(location_id, {product_id: -quantity_base})[product_id]
+        return self.apply_deltas(location_id, {product_id: quantity_base})[product_id].quantity
+
+    def lock_stocks(self, keys: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], Stock]:
+        """Lock the stock rows of ``(location_id, product_id)`` pairs with one ``SELECT ... FOR UPDATE``.
+
+        Rows are locked in (location, product) order, so concurrent sales that share
+        products always wait on each other in the same order and cannot deadlock.
+        Debits go through ``debit``, which locks in the same order. Missing rows are
+        left out of the result.
+        """
+        keys = sorted(set(keys))
+        if not keys:
+            return {}
+        return {
+            (stock.location_id, stock.product_id): stock
+            for stock in self.db.query(Stock)
+            .filter(tuple_(Stock.location_id, Stock.product_id).in_(keys))
+            .order_by(Stock.location_id, Stock.product_id)
+            .with_for_update()
+            .all()
+        }
+
+    def apply_deltas(self, location_id: int, deltas: Dict[int, Decimal]) -> Dict[int, Stock]:
+        """Apply base-unit deltas for many products of one location.
+
+        Stock rows are locked with ``lock_stocks``; the modified rows are written
+        back by one batched UPDATE on flush.
+        """
+        if not deltas:
+            return {}
+        base_units = self.converter.base_units(deltas)
+        locked = self.lock_stocks((location_id, product_id) for product_id in deltas)
+        stocks = {product_id: stock for (_, product_id), stock in locked.items()}
+        now = datetime.utcnow()
+        for product_id in sorted(deltas):
+            stock = stocks.get(product_id)
+            if not stock:
+                stock = Stock(location_id=location_id, product_id=product_id, unit_id=base_units[product_id], quantity=Decimal("0"))
+                self.db.add(stock)
+                stocks[product_id] = stock
+            new_qty = Decimal(str(stock.quantity)) + deltas[product_id]
+            if new_qty < 0:
+                raise ValidationError("Insufficient stock")
+            stock.quantity = new_qty
+            stock.updated_at = now
+        return stocks
+
+    def debit(self, location_id: int, quantities: Dict[int, Decimal]) -> Dict[int, Decimal]:
+        """Remove base-unit ``quantities`` from stock of one location; returns the remaining quantities.
+
+        All products are debited by a single ``UPDATE ... SET quantity = quantity - :q
+        WHERE quantity >= :q RETURNING``, so no row is read into Python first and locks
+        are held only for the statement. Multi-product debits lock their rows through an
+        ordered ``SELECT ... FOR UPDATE`` sub-select, keeping the lock order of
+        ``lock_stocks``. Missing or short rows raise ValidationError with their product
+        ids; rows debited by the same statement are credited back first. Negative or
+        non-finite quantities raise ValidationError: the conditional UPDATE would
+        otherwise silently credit stock.
+        """
+        quantities = {product_id: qty for product_id, qty in quantities.items() if qty}
+        invalid = sorted(product_id for product_id, qty in quantities.items() if not (Decimal(qty).is_finite() and qty > 0))
+        if invalid:
+            raise ValidationError("Debit quantities must be positive", details={"product_ids": invalid})
+        if not quantities:
+            return {}
+        amount = case(quantities, value=Stock.product_id)
+        if len(quantities) == 1:
+            target = Stock.product_id.in_(quantities)
+        else:
+            target = Stock.id.in_(
+                select(Stock.id)
+                .where(Stock.location_id == location_id, Stock.product_id.in_(quantities))
+                .order_by(Stock.product_id)
+                .with_for_update()
+            )
+        rows = self.db.execute(
+            update(Stock)
+            .where(Stock.location_id == location_id, target, Stock.quantity >= amount)
+            .values(quantity=Stock.quantity - amount, updated_at=datetime.utcnow())
+            .returning(Stock.id, Stock.product_id, Stock.quantity)
+            .execution_options(synchronize_session="fetch")
+        ).all()
+        remaining = {product_id: Decimal(str(qty)) for _, product_id, qty in rows}
+        short = sorted(set(quantities) - set(remaining))
+        if short:
+            if remaining:
+                self._credit_back(location_id, {product_id: quantities[product_id] for product_id in remaining})
+            raise ValidationError("Insufficient stock", details={"product_ids": short})
+        # Core updates bypass the flush listeners that maintain totals, audit and caches
+        stock_totals.apply_deltas(self.db, {product_id: -qty for product_id, qty in quantities.items()})
+        audit_updates(
+            self.db,
+            Stock,
+            (
+                (stock_id, {"quantity": Decimal(str(qty)) + quantities[product_id]}, {"quantity": Decimal(str(qty))})
+                for stock_id, product_id, qty in rows
+            ),
+        )
+        touch(self.db, Stock, keys=[location_id])
+        return remaining
+
+    def _credit_back(self, location_id: int, quantities: Dict[int, Decimal]) -> None:
+        amount = case(quantities, value=Stock.product_id)
+        self.db.execute(
+            update(Stock)
+            .where(Stock.location_id == location_id, Stock.product_id.in_(quantities))
+            .values(quantity=Stock.quantity + amount)
+            .execution_options(synchronize_session="fetch")
+        )
@@ -0,0 +1,117 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Tuple
+
+from sqlalchemy import delete, event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from app.infrastructure.db.dialects import upsert_insert
+from app.models.models import Product, ProductStockTotal, Stock
+
+
+def apply_deltas(db: Session, deltas: Dict[int, Decimal]) -> None:
+    """Add per-product stock deltas to the materialized totals in one statement."""
+    rows = [
+        {"product_id": product_id, "quantity": delta, "updated_at": datetime.utcnow()}
+        for product_id, delta in sorted(deltas.items())
+        if delta
+    ]
+    if not rows:
+        return
+    stmt = upsert_insert(db, ProductStockTotal.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ProductStockTotal.product_id],
+        set_={
+            "quantity": ProductStockTotal.__table__.c.quantity + stmt.excluded.quantity,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.connection().execute(stmt, rows)
+
+
+def totals_for(db: Session, product_ids: List[int]) -> Dict[int, Decimal]:
+    """Primary-key lookup of materialized totals; missing rows mean zero stock."""
+    if not product_ids:
+        return {}
+    rows = db.execute(
+        select(ProductStockTotal.product_id, ProductStockTotal.quantity).where(
+            ProductStockTotal.product_id.in_(product_ids)
+        )
+    ).all()
+    return {product_id: quantity for product_id, quantity in rows}
+
+
+def _aggregate_stock_totals():
+    return select(Stock.product_id, func.coalesce(func.sum(Stock.quantity), Decimal("0")).label("quantity")).group_by(
+        Stock.product_id
+    )
+
+
+def find_drift(db: Session) -> List[Tuple[int, Decimal, Decimal]]:
+    """Return (product_id, stored, actual) for every product whose total disagrees with stock."""
+    actual = {product_id: Decimal(str(qty)) for product_id, qty in db.execute(_aggregate_stock_totals()).all()}
+    stored = {
+        product_id: Decimal(str(qty))
+        for product_id, qty in db.execute(select(ProductStockTotal.product_id, ProductStockTotal.quantity)).all()
+    }
+    drift = []
+    for product_id in sorted(set(actual) | set(stored)):
+        expected = actual.get(product_id, Decimal("0"))
+        current = stored.get(product_id, Decimal("0"))
+        if expected != current:
+            drift.append((product_id, current, expected))
+    return drift
+
+
+def rebuild(db: Session) -> int:
+    """Recompute every total from the stock table. Returns the number of rows written."""
+    db.execute(delete(ProductStockTotal))
+    rows = [
+        {"product_id": product_id, "quantity": qty, "updated_at": datetime.utcnow()}
+        for product_id, qty in db.execute(_aggregate_stock_totals()).all()
+    ]
+    if rows:
+        db.execute(ProductStockTotal.__table__.insert(), rows)
+    return len(rows)
+
+
+def _quantity_change(obj: Stock) -> List[Tuple[int, Decimal]]:
+    state = inspect(obj)
+    qty_hist = state.attrs.quantity.history
+    pid_hist = state.attrs.product_id.history
+    old_qty = (qty_hist.deleted or qty_hist.unchanged or [None])[0] or Decimal("0")
+    new_qty = (qty_hist.added or qty_hist.unchanged or [None])[0] or Decimal("0")
+    old_pid = (pid_hist.deleted or pid_hist.unchanged or [None])[0]
+    new_pid = (pid_hist.added or pid_hist.unchanged or [None])[0]
+    return [(old_pid, -Decimal(str(old_qty))), (new_pid, Decimal(str(new_qty)))]
+
+
+def after_flush(session: Session, flush_context) -> None:
+    deltas: Dict[int, Decimal] = {}
+
+    def add(product_id, delta):
+        if product_id is not None:
+            deltas[product_id] = deltas.get(product_id, Decimal("0")) + delta
+
+    for obj in session.new:
+        if isinstance(obj, Stock):
+            add(obj.product_id, Decimal(str(obj.quantity or 0)))
+    for obj in session.deleted:
+        if isinstance(obj, Stock):
+            old = inspect(obj).attrs.quantity.history
+            add(obj.product_id, -Decimal(str((old.deleted or old.unchanged or [obj.quantity])[0] or 0)))
+    for obj in session.dirty:
+        if isinstance(obj, Stock) and session.is_modified(obj, include_collections=False):
+            for product_id, delta in _quantity_change(obj):
+                add(product_id, delta)
+
+    # Totals of deleted products are removed by the FK cascade
+    deleted_products = {obj.id for obj in session.deleted if isinstance(obj, Product)}
+    for product_id in deleted_products:
+        deltas.pop(product_id, None)
+    apply_deltas(session, deltas)
+
+
+def register_listeners():
+    if not event.contains(Session, "after_flush", after_flush):
+        event.listen(Session, "after_flush", after_flush)
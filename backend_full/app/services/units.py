@@ -1,33 +1,154 @@
+from dataclasses import dataclass
 from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Iterable, List, Optional, Tuple
 from sqlalchemy.orm import Session
+from app.common.cache import TTLCache, invalidate_on_commit
+from app.config import get_settings
 from app.models.models import Unit, ProductUnit, Product
 from app.common.errors import ValidationError
 
+settings = get_settings()
+_product_units_cache = TTLCache(ttl_seconds=settings.unit_cache_ttl_seconds, maxsize=settings.unit_cache_size)
+_unit_code_cache = TTLCache(ttl_seconds=settings.unit_cache_ttl_seconds, maxsize=settings.unit_cache_size)
+
+
+@dataclass(frozen=True)
+class ProductUnits:
+    """Conversion snapshot of one product: unit_id -> (ratio_to_base, discrete_step)."""
+
+    base_unit_id: int
+    units: Dict[int, Tuple[Decimal, Optional[Decimal]]]
+
+    def ratio(self, unit_id: int) -> Optional[Decimal]:
+        if unit_id == self.base_unit_id:
+            return Decimal("1")
+        entry = self.units.get(unit_id)
+        return entry[0] if entry else None
+
+    def discrete_step(self, unit_id: int) -> Optional[Decimal]:
+        entry = self.units.get(unit_id)
+        return entry[1] if entry else None
+
 
 class UnitConverter:
-    """Converts units based on configured ratios."""
+    """Converts quantities to product base units using cached ``ProductUnit`` ratios."""
 
     def __init__(self, db: Session):
         self.db = db
 
-    def to_base(self, unit_code: str, quantity: Decimal, base_unit: str) -> Decimal:
-        """
-        Convert quantity from given unit to base unit.
-        NOTE: With the new product-specific unit system, this method may not work as expected
-        without product context. Consider using product-specific methods.
-        For backward compatibility, this method raises an error indicating the change.
-        """
-        # The old unit conversion system has been replaced with product-specific conversions
-        # The unit_conversion table was removed and replaced with product_unit table
-        raise ValidationError(
-            f"Unit conversion logic has been updated to be product-specific. "
-            f"Use product-specific conversion methods instead. "
-            f"Conversion from {unit_code} to {base_unit} requires product context."
+    def unit_ids(self, codes: Iterable[str]) -> Dict[str, int]:
+        """Map unit codes to ids; unknown codes raise ValidationError."""
+        codes = set(codes)
+        found = self.known_unit_ids(codes)
+        missing = codes - set(found)
+        if missing:
+            raise ValidationError(f"Unknown unit(s): {', '.join(sorted(missing))}")
+        return found
+
+    def known_unit_ids(self, codes: Iterable[str]) -> Dict[str, int]:
+        """Map unit codes to ids, leaving unknown codes out."""
+        found: Dict[str, int] = {}
+        missing = set()
+        for code in set(codes):
+            unit_id = _unit_code_cache.get(code)
+            if unit_id is None:
+                missing.add(code)
+            else:
+                found[code] = unit_id
+        if missing:
+            # Loads racing with a commit must not put stale entries back into the cache
+            version = _unit_code_cache.version
+            loaded = dict(self.db.query(Unit.code, Unit.id).filter(Unit.code.in_(missing)).all())
+            for code, unit_id in loaded.items():
+                _unit_code_cache.set(code, unit_id, version=version)
+            found.update(loaded)
+        return found
+
+    def product_units(self, product_ids: Iterable[int]) -> Dict[int, ProductUnits]:
+        """Conversion snapshots for products; unknown products raise ValidationError."""
+        product_ids = set(product_ids)
+        found = self.known_product_units(product_ids)
+        if product_ids - set(found):
+            raise ValidationError("Product missing")
+        return found
+
+    def known_product_units(self, product_ids: Iterable[int]) -> Dict[int, ProductUnits]:
+        """Conversion snapshots for existing products; cache misses are loaded in one query."""
+        found: Dict[int, ProductUnits] = {}
+        missing = set()
+        for product_id in set(product_ids):
+            snapshot = _product_units_cache.get(product_id)
+            if snapshot is None:
+                missing.add(product_id)
+            else:
+                found[product_id] = snapshot
+        if missing:
+            version = _product_units_cache.version
+            loaded = self._load_product_units(missing)
+            for product_id, snapshot in loaded.items():
+                _product_units_cache.set(product_id, snapshot, version=version)
+            found.update(loaded)
+        return found
+
+    def _load_product_units(self, product_ids: set) -> Dict[int, ProductUnits]:
+        rows = (
+            self.db.query(Product.id, Product.base_unit_id, ProductUnit.unit_id, ProductUnit.ratio_to_base, ProductUnit.discrete_step)
+            .outerjoin(ProductUnit, ProductUnit.product_id == Product.id)
+            .filter(Product.id.in_(product_ids))
+            .all()
         )
+        base_units: Dict[int, int] = {}
+        units: Dict[int, Dict[int, Tuple[Decimal, Optional[Decimal]]]] = {}
+        for product_id, base_unit_id, unit_id, ratio, step in rows:
+            base_units[product_id] = base_unit_id
+            product_units = units.setdefault(product_id, {})
+            if unit_id is not None:
+                product_units[unit_id] = (Decimal(str(ratio)), Decimal(str(step)) if step is not None else None)
+        return {product_id: ProductUnits(base_units[product_id], units[product_id]) for product_id in base_units}
 
-    def normalize(self, unit_code: str, quantity: Decimal) -> Decimal:
-        unit = self.db.query(Unit).filter(Unit.code == unit_code).first()
-        if unit and unit.discrete_step:
-            step = Decimal(unit.discrete_step)
+    def base_units(self, product_ids: Iterable[int]) -> Dict[int, int]:
+        """Map product ids to their base unit ids; unknown products raise ValidationError."""
+        return {product_id: snapshot.base_unit_id for product_id, snapshot in self.product_units(product_ids).items()}
+
+    def to_base(self, product_id: int, unit_id: int, quantity: Decimal) -> Decimal:
+        return self.to_base_many([(product_id, unit_id, quantity)])[0]
+
+    def to_base_many(self, items: List[Tuple[int, int, Decimal]]) -> List[Decimal]:
+        """Convert (product_id, unit_id, quantity) tuples to product base units.
+
+        Base units convert with ratio 1, other units use the product-specific
+        ``ProductUnit.ratio_to_base``. Only products missing from the cache are queried.
+        """
+        snapshots = self.product_units(product_id for product_id, _, _ in items)
+        converted = []
+        for product_id, unit_id, quantity in items:
+            ratio = snapshots[product_id].ratio(unit_id)
+            if ratio is None:
+                raise ValidationError(f"No conversion for unit {unit_id} of product {product_id}")
+            converted.append(quantity * ratio)
+        return converted
+
+    def normalize(self, product_id: int, unit_id: int, quantity: Decimal) -> Decimal:
+        """Round ``quantity`` to the product unit's discrete step, if one is configured."""
+        step = self.product_units([product_id])[product_id].discrete_step(unit_id)
+        if step:
             return (quantity / step).quantize(0, rounding=ROUND_HALF_UP) * step
         return quantity
+
+
+def invalidate_product_units(product_ids: Optional[set] = None) -> None:
+    if product_ids is None:
+        _product_units_cache.clear()
+        return
+    for product_id in product_ids:
+        _product_units_cache.invalidate(product_id)
+
+
+def invalidate_unit_codes(_: Optional[set] = None) -> None:
+    _unit_code_cache.clear()
+
+
+# Ratio or base unit edits drop the affected product snapshots; unit renames drop all codes
+invalidate_on_commit(ProductUnit, callback=invalidate_product_units, key=lambda product_unit: product_unit.product_id)
+invalidate_on_commit(Product, callback=invalidate_product_units, key=lambda product: product.id)
+invalidate_on_commit(Unit, callback=invalidate_unit_codes)
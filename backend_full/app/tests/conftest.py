@@ -1,10 +1,22 @@
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from app.common.cache import clear_all_caches
 from app.infrastructure.db.base import Base
 from app.models import models
 
 
+@pytest.fixture(autouse=True)
+def _clear_process_caches():
+    clear_all_caches()
+    yield
+    clear_all_caches()
+
+
 @pytest.fixture()
 def db_session():
     engine = create_engine("sqlite:///:memory:", future=True)
@@ -0,0 +1,27 @@
+import asyncio
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.infrastructure.db.base import Base
+from app.infrastructure.db.session import async_database_url, run_sync
+from app.models.models import Location
+
+
+def test_async_database_url_swaps_driver():
+    assert async_database_url("postgresql://u:p@db:5432/cava") == "postgresql+asyncpg://u:p@db:5432/cava"
+    assert async_database_url("postgresql+psycopg2://u:p@db/cava") == "postgresql+asyncpg://u:p@db/cava"
+    assert async_database_url("sqlite:///./cava.db") == "sqlite+aiosqlite:///./cava.db"
+
+
+def test_run_sync_uses_threadpool_for_sync_sessions():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+
+    def add_location(db, name):
+        db.add(Location(name=name, kind="bar"))
+        db.commit()
+        return db.query(Location.name).scalar()
+
+    assert asyncio.run(run_sync(session, add_location, "Bar")) == "Bar"
+    session.close()
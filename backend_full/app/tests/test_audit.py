@@ -1,11 +1,43 @@
+from decimal import Decimal
+from sqlalchemy import text
 from app.audit.listeners import register_listeners
-from app.models.models import Unit
+from app.models.models import AuditLog, Unit, ProductType, Product, Location, Stock
 
 
 def test_audit_inserts(db_session):
     register_listeners()
-    unit = Unit(code="bottle", description="Bottle")
+    unit = Unit(code="bottle", description="Bottle", unit_type="base")
     db_session.add(unit)
     db_session.commit()
-    audit = db_session.execute("select count(1) from audit_log").scalar()
+    audit = db_session.execute(text("select count(1) from audit_log")).scalar()
     assert audit == 1
+
+
+def test_audit_update_stores_only_changed_columns(db_session):
+    register_listeners()
+    unit = Unit(code="bottle", description="Bottle", unit_type="base")
+    db_session.add(unit)
+    db_session.commit()
+    unit.description = "Wine bottle"
+    db_session.commit()
+    audit = db_session.query(AuditLog).filter_by(action="update").one()
+    assert audit.record_id == str(unit.id)
+    assert audit.old_data == {"description": "Bottle"}
+    assert audit.new_data == {"description": "Wine bottle"}
+
+
+def test_stock_is_audited_in_compact_form(db_session):
+    register_listeners()
+    unit = Unit(code="bottle", description="Bottle", unit_type="base")
+    wine_type = ProductType(name="wine")
+    loc = Location(name="Bar", kind="bar")
+    db_session.add_all([unit, wine_type, loc])
+    db_session.flush()
+    wine = Product(name="Red", sku="W1", primary_category="wine", product_type_id=wine_type.id, base_unit_id=unit.id)
+    db_session.add(wine)
+    db_session.flush()
+    stock = Stock(location_id=loc.id, product_id=wine.id, quantity=Decimal("2"), unit_id=unit.id)
+    db_session.add(stock)
+    db_session.commit()
+    audit = db_session.query(AuditLog).filter_by(model="Stock").one()
+    assert audit.new_data == {"location_id": loc.id, "product_id": wine.id, "quantity": "2"}
@@ -0,0 +1,228 @@
+import asyncio
+import shutil
+import json
+from decimal import Decimal
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+from app.api.v1.deps import auth
+from app.api.v1.routes import catalog
+from app.api.v1.routes.catalog import get_catalog
+from app.api.v1.routes.simple_catalog import (
+    create_product_type,
+    get_locations,
+    get_product_types,
+    get_units,
+    update_product_type,
+)
+from app.infrastructure.db.base import Base
+from app.infrastructure.db.replica import ReplicaRouter
+from app.models.models import AttributeDefinition, Unit, ProductType, Product, Location, Stock, PriceList
+from app.schemas import simple as schemas
+from app.services.catalog_service import CatalogService, cached_catalog, invalidate_catalogs
+from app.services.stock_service import StockService
+
+
+def seed_catalog(db):
+    bottle = Unit(code="bottle", description="Bottle", unit_type="base")
+    wine_type = ProductType(name="wine", is_composite=False)
+    bar = Location(name="Bar", kind="bar")
+    cellar = Location(name="Cellar", kind="warehouse")
+    db.add_all([bottle, wine_type, bar, cellar])
+    db.flush()
+    red = Product(name="Red", sku="RED", primary_category="wine", product_type_id=wine_type.id, base_unit_id=bottle.id)
+    white = Product(name="White", sku="WHITE", primary_category="wine", product_type_id=wine_type.id, base_unit_id=bottle.id)
+    db.add_all([red, white])
+    db.flush()
+    db.add_all(
+        [
+            PriceList(location_id=bar.id, product_id=red.id, unit_id=bottle.id, currency="EUR", amount=Decimal("30")),
+            Stock(location_id=bar.id, product_id=red.id, quantity=Decimal("4"), unit_id=bottle.id),
+            Stock(location_id=cellar.id, product_id=red.id, quantity=Decimal("9"), unit_id=bottle.id),
+        ]
+    )
+    db.commit()
+    return red, white, bar, cellar
+
+
+def count_queries(db, fn):
+    statements = []
+    engine = db.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return result, len(statements)
+
+
+def test_catalog_is_built_with_one_query(db_session):
+    red, white, bar, _ = seed_catalog(db_session)
+    items, queries = count_queries(db_session, lambda: CatalogService(db_session).catalog_for_location(bar.id))
+    assert queries == 1
+    assert items == [
+        {"id": red.id, "name": "Red", "sku": "RED", "price": 30.0, "currency": "EUR", "stock": 4.0, "unit": "bottle", "category": "wine"},
+        {"id": white.id, "name": "White", "sku": "WHITE", "price": None, "currency": None, "stock": 0, "unit": "bottle", "category": "wine"},
+    ]
+
+
+def test_catalog_payload_is_cached_per_location(db_session):
+    _, _, bar, _ = seed_catalog(db_session)
+    service = CatalogService(db_session)
+    payload = service.catalog_representation(bar.id)
+    assert json.loads(payload.body)["location_id"] == bar.id
+    assert cached_catalog(bar.id) is payload
+    _, queries = count_queries(db_session, lambda: service.catalog_representation(bar.id))
+    assert queries == 0
+
+
+def test_stock_and_price_changes_drop_only_their_location(db_session):
+    red, _, bar, cellar = seed_catalog(db_session)
+    service = CatalogService(db_session)
+    service.catalog_representation(bar.id)
+    service.catalog_representation(cellar.id)
+
+    StockService(db_session).debit(bar.id, {red.id: Decimal("1")})
+    db_session.commit()
+    assert cached_catalog(bar.id) is None
+    assert cached_catalog(cellar.id) is not None
+    assert json.loads(service.catalog_representation(bar.id).body)["items"][0]["stock"] == 3.0
+
+    price = db_session.query(PriceList).one()
+    price.amount = Decimal("32")
+    db_session.commit()
+    assert cached_catalog(bar.id) is None
+    assert json.loads(service.catalog_representation(bar.id).body)["items"][0]["price"] == 32.0
+    assert cached_catalog(cellar.id) is not None
+
+
+def test_product_changes_drop_every_location(db_session):
+    red, _, bar, cellar = seed_catalog(db_session)
+    service = CatalogService(db_session)
+    service.catalog_representation(bar.id)
+    service.catalog_representation(cellar.id)
+    red.name = "Red reserve"
+    db_session.commit()
+    assert cached_catalog(bar.id) is None
+    assert cached_catalog(cellar.id) is None
+
+
+def make_request(etag=None):
+    headers = [(b"if-none-match", etag.encode())] if etag else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_catalog_answers_matching_etag_with_304_without_queries(db_session):
+    _, _, bar, _ = seed_catalog(db_session)
+    # Warm the cache in this thread; the in-memory database cannot be used from the threadpool
+    etag = CatalogService(db_session).catalog_representation(bar.id).etag
+    first = asyncio.run(get_catalog(make_request(), location=bar.id, user=None, db=db_session))
+    assert (first.status_code, first.headers["etag"]) == (200, etag)
+
+    second, queries = count_queries(
+        db_session, lambda: asyncio.run(get_catalog(make_request(f'W/{etag}, "other"'), location=bar.id, user=None, db=db_session))
+    )
+    assert (second.status_code, second.body, queries) == (304, b"", 0)
+    assert second.headers["etag"] == etag
+
+
+def test_reference_etag_changes_after_a_write(db_session):
+    seed_catalog(db_session)
+    first = get_units(make_request(), user=None, db=db_session)
+    assert json.loads(first.body)[0]["code"] == "bottle"
+    etag = first.headers["etag"]
+    assert get_units(make_request(etag), user=None, db=db_session).status_code == 304
+
+    db_session.add(Unit(code="glass", description="Glass", unit_type="portion"))
+    db_session.commit()
+    changed = get_units(make_request(etag), user=None, db=db_session)
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert get_locations(make_request(), user=None, db=db_session).status_code == 200
+    assert len(json.loads(get_product_types(make_request(), user=None, db=db_session).body)) == 1
+
+
+def test_product_types_load_attributes_in_one_extra_query(db_session):
+    red, *_ = seed_catalog(db_session)
+    for name in ("olive", "cheese"):
+        create_product_type(
+            schemas.ProductTypeCreate(
+                name=name,
+                attributes=[
+                    schemas.AttributeDefinitionCreate(
+                        product_type_id=0, name="Weight", code="weight", data_type="number", unit_id=red.base_unit_id
+                    ),
+                    schemas.AttributeDefinitionCreate(product_type_id=0, name="Origin", code="origin", data_type="string"),
+                ],
+            ),
+            user=None,
+            db=db_session,
+        )
+    response, queries = count_queries(db_session, lambda: get_product_types(make_request(), user=None, db=db_session))
+    assert queries == 2
+    types = json.loads(response.body)
+    assert [len(t["attributes"]) for t in types] == [0, 2, 2]
+    assert types[1]["attributes"][0]["unit_id"] == red.base_unit_id
+
+
+def test_product_type_update_replaces_attributes_and_refreshes_listing(db_session):
+    seed_catalog(db_session)
+    created = create_product_type(
+        schemas.ProductTypeCreate(
+            name="olive",
+            attributes=[schemas.AttributeDefinitionCreate(product_type_id=0, name="Pitted", code="pitted", data_type="boolean")],
+        ),
+        user=None,
+        db=db_session,
+    )
+    etag = get_product_types(make_request(), user=None, db=db_session).headers["etag"]
+    updated = update_product_type(
+        created.id,
+        schemas.ProductTypeUpdate(
+            name="olive",
+            attributes=[schemas.AttributeDefinitionCreate(product_type_id=0, name="Origin", code="origin", data_type="string")],
+        ),
+        user=None,
+        db=db_session,
+    )
+    assert [a.code for a in updated.attributes] == ["origin"]
+    assert db_session.query(AttributeDefinition).count() == 1
+    listing = get_product_types(make_request(etag), user=None, db=db_session)
+    assert listing.status_code == 200
+    assert json.loads(listing.body)[1]["attributes"][0]["code"] == "origin"
+
+
+def test_catalog_rebuilt_after_a_write_ignores_a_lagging_replica(tmp_path, monkeypatch):
+    def factory(name):
+        engine = create_engine(f"sqlite:///{tmp_path / name}", connect_args={"check_same_thread": False})
+        return sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+    primary = factory("primary.db")
+    Base.metadata.create_all(primary.kw["bind"])
+    with primary() as db:
+        red, _, bar, _ = seed_catalog(db)
+    # The replica has not replayed the sale below yet
+    shutil.copy(tmp_path / "primary.db", tmp_path / "replica.db")
+    router = ReplicaRouter(primary, factory("replica.db"), max_lag_seconds=0, check_interval_seconds=60, retry_seconds=60)
+    router.probe()
+    assert router.sessionmaker() is not primary
+    monkeypatch.setattr(auth, "SessionLocal", primary)
+    monkeypatch.setattr(auth, "read_router", router)
+
+    with primary() as db:
+        StockService(db).debit(bar.id, {red.id: Decimal("3")})
+        db.commit()
+    invalidate_catalogs()
+
+    app = FastAPI()
+    app.include_router(catalog.router)
+    route = next(route for route in catalog.router.routes if route.name == "get_catalog")
+    for dependency in route.dependant.dependencies:
+        if dependency.name == "user":
+            app.dependency_overrides[dependency.call] = lambda: None
+    response = TestClient(app).get("/catalog", params={"location": bar.id})
+    assert response.status_code == 200
+    assert [item["stock"] for item in response.json()["items"] if item["id"] == red.id] == [1]
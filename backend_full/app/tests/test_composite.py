@@ -1,4 +1,11 @@
 from decimal import Decimal
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+from app.api.v1.routes.simple_catalog import sell_product
+from app.common.errors import ValidationError
+from app.services.bom import BomExpander
+from app.schemas.simple import SaleRequest
 from app.services.sales_service import SalesService
 from app.models.models import (
     Unit,
@@ -13,34 +20,37 @@ from app.models.models import (
 
 
 def seed_composite(db):
-    bottle = Unit(code="bottle", description="Bottle")
-    glass = Unit(code="glass", description="Glass")
+    bottle = Unit(code="bottle", description="Bottle", unit_type="base")
+    glass = Unit(code="glass", description="Glass", unit_type="portion", is_discrete=False)
     wine_type = ProductType(name="wine", is_composite=False)
     snack_type = ProductType(name="snack", is_composite=True)
+    db.add_all([bottle, glass, wine_type, snack_type])
+    db.flush()
     wine = Product(
         name="Red wine",
         sku="WINE01",
         primary_category="wine",
-        product_type_id=1,
-        base_unit_code="bottle",
+        product_type_id=wine_type.id,
+        base_unit_id=bottle.id,
     )
     sandwich = Product(
         name="Sandwich",
         sku="SNACK01",
         primary_category="snack",
-        product_type_id=2,
-        base_unit_code="glass",
+        product_type_id=snack_type.id,
+        base_unit_id=glass.id,
     )
-    db.add_all([bottle, glass, wine_type, snack_type, wine, sandwich])
+    db.add_all([wine, sandwich])
     db.flush()
-    comp = CompositeComponent(parent_product_id=sandwich.id, component_product_id=wine.id, quantity=Decimal("1"), unit_code="glass")
+    db.add(ProductUnit(product_id=wine.id, unit_id=glass.id, ratio_to_base=Decimal("0.2")))
+    comp = CompositeComponent(parent_product_id=sandwich.id, component_product_id=wine.id, quantity=Decimal("1"), unit_id=glass.id)
     db.add(comp)
     loc = Location(name="Bar2", kind="bar")
     db.add(loc)
     db.flush()
     term = Terminal(terminal_id="t2", location_id=loc.id, secret_hash="secret")
     db.add(term)
-    stock = Stock(location_id=loc.id, product_id=wine.id, quantity=Decimal("5"), unit_code="bottle")
+    stock = Stock(location_id=loc.id, product_id=wine.id, quantity=Decimal("5"), unit_id=bottle.id)
     db.add(stock)
     db.commit()
     return sandwich, wine, loc, term
@@ -62,3 +72,102 @@ def test_composite_expansion_and_deduction(db_session):
     db_session.commit()
     stock = db_session.query(Stock).filter_by(product_id=wine.id).first()
     assert float(stock.quantity) == 4.6
+
+
+def add_tasting_set(db, sandwich, wine):
+    bread_type = ProductType(name="bakery", is_composite=False)
+    set_type = ProductType(name="set", is_composite=True)
+    db.add_all([bread_type, set_type])
+    db.flush()
+    bread = Product(name="Bread", sku="BREAD01", primary_category="bakery", product_type_id=bread_type.id, base_unit_id=wine.base_unit_id)
+    tasting = Product(name="Tasting set", sku="SET01", primary_category="set", product_type_id=set_type.id, base_unit_id=wine.base_unit_id)
+    db.add_all([bread, tasting])
+    db.flush()
+    db.add_all(
+        [
+            CompositeComponent(parent_product_id=sandwich.id, component_product_id=bread.id, quantity=Decimal("0.5"), unit_id=bread.base_unit_id),
+            CompositeComponent(parent_product_id=tasting.id, component_product_id=sandwich.id, quantity=Decimal("2"), unit_id=sandwich.base_unit_id),
+            CompositeComponent(parent_product_id=tasting.id, component_product_id=wine.id, quantity=Decimal("3"), unit_id=sandwich.base_unit_id),
+        ]
+    )
+    db.commit()
+    return tasting, bread
+
+
+def test_nested_composites_flatten_to_leaf_base_units(db_session):
+    sandwich, wine, _, _ = seed_composite(db_session)
+    tasting, bread = add_tasting_set(db_session, sandwich, wine)
+    bom = BomExpander(db_session).flatten(tasting.id)
+    # 2 sandwiches (1 glass of wine + 0.5 bread each) and 3 glasses of wine
+    assert bom == {wine.id: Decimal("1.0"), bread.id: Decimal("1.0")}
+
+
+def test_bom_cache_is_dropped_when_a_recipe_changes(db_session):
+    sandwich, wine, _, _ = seed_composite(db_session)
+    tasting, bread = add_tasting_set(db_session, sandwich, wine)
+    expander = BomExpander(db_session)
+    assert expander.flatten(tasting.id)[bread.id] == Decimal("1.0")
+    comp = db_session.query(CompositeComponent).filter_by(parent_product_id=sandwich.id, component_product_id=bread.id).one()
+    comp.quantity = Decimal("1")
+    db_session.commit()
+    assert expander.flatten(tasting.id)[bread.id] == Decimal("2")
+
+
+def test_short_component_leaves_stock_untouched(db_session):
+    sandwich, wine, loc, _ = seed_composite(db_session)
+    tasting, bread = add_tasting_set(db_session, sandwich, wine)
+    db_session.add(Stock(location_id=loc.id, product_id=tasting.id, quantity=Decimal("2"), unit_id=tasting.base_unit_id))
+    db_session.add(Stock(location_id=loc.id, product_id=bread.id, quantity=Decimal("0.5"), unit_id=bread.base_unit_id))
+    db_session.commit()
+    with pytest.raises(HTTPException, match="component"):
+        sell_product(SaleRequest(product_id=tasting.id, quantity=Decimal("1")), user=None, db=db_session)
+    quantities = dict(db_session.query(Stock.product_id, Stock.quantity).all())
+    assert quantities == {wine.id: Decimal("5"), tasting.id: Decimal("2"), bread.id: Decimal("0.5")}
+
+
+def test_composite_cycle_is_rejected(db_session):
+    sandwich, wine, _, _ = seed_composite(db_session)
+    tasting, _ = add_tasting_set(db_session, sandwich, wine)
+    db_session.add(CompositeComponent(parent_product_id=sandwich.id, component_product_id=tasting.id, quantity=Decimal("1"), unit_id=tasting.base_unit_id))
+    db_session.commit()
+    with pytest.raises(ValidationError, match="cycle"):
+        BomExpander(db_session).flatten(tasting.id)
+
+
+def test_component_unit_without_conversion_is_rejected(db_session):
+    sandwich, wine, _, _ = seed_composite(db_session)
+    tasting, bread = add_tasting_set(db_session, sandwich, wine)
+    # Bread is kept in bottles only, so a glass of bread has no meaning
+    comp = db_session.query(CompositeComponent).filter_by(parent_product_id=sandwich.id, component_product_id=bread.id).one()
+    comp.unit_id = sandwich.base_unit_id
+    db_session.commit()
+    with pytest.raises(ValidationError, match=f"component {bread.id} in recipe of product {sandwich.id}"):
+        BomExpander(db_session).flatten(tasting.id)
+
+
+def test_composite_sale_debits_all_stock_rows_in_one_update(db_session):
+    sandwich, wine, loc, _ = seed_composite(db_session)
+    tasting, bread = add_tasting_set(db_session, sandwich, wine)
+    db_session.add_all(
+        [
+            Stock(location_id=loc.id, product_id=tasting.id, quantity=Decimal("2"), unit_id=tasting.base_unit_id),
+            Stock(location_id=loc.id, product_id=bread.id, quantity=Decimal("3"), unit_id=bread.base_unit_id),
+        ]
+    )
+    db_session.commit()
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        sell_product(SaleRequest(product_id=tasting.id, quantity=Decimal("2")), user=None, db=db_session)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    stock_statements = [s for s in statements if "stock " in s and "product_stock_total" not in s]
+    assert len(stock_statements) == 1
+    assert stock_statements[0].startswith("UPDATE stock")
+    assert "ORDER BY stock.product_id" in stock_statements[0]
+    quantities = dict(db_session.query(Stock.product_id, Stock.quantity).all())
+    assert quantities[tasting.id] == 0
+    assert quantities[wine.id] == Decimal("3")
+    assert quantities[bread.id] == Decimal("1")
@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import create_engine, exc
+from app.infrastructure.db.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool, pool_metrics
+from app.infrastructure.db.session import engine_options
+
+
+def test_postgres_engines_get_pool_settings_and_statement_timeout():
+    options = engine_options("postgresql+psycopg2://u:p@db/app", "request", 7, 3, 1500)
+    assert options["poolclass"] is InstrumentedQueuePool
+    assert (options["pool_logging_name"], options["pool_size"], options["max_overflow"]) == ("request", 7, 3)
+    assert options["connect_args"] == {"options": "-c statement_timeout=1500"}
+
+    async_options = engine_options("postgresql+asyncpg://u:p@db/app", "async", 7, 3, 1500)
+    assert async_options["poolclass"] is InstrumentedAsyncQueuePool
+    assert async_options["connect_args"] == {"server_settings": {"statement_timeout": "1500"}}
+
+    assert "connect_args" not in engine_options("postgresql+psycopg2://u:p@db/app", "request", 7, 3, 0)
+    assert engine_options("sqlite://", "request", 7, 3, 1500) == {}
+
+
+def test_pool_records_checkouts_and_timeouts(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedQueuePool,
+        pool_logging_name="test-pool",
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    try:
+        with engine.connect():
+            with pytest.raises(exc.TimeoutError):
+                engine.connect()
+            metrics = pool_metrics()["test-pool"]
+            assert (metrics["checkouts"], metrics["timeouts"], metrics["checked_out"]) == (1, 1, 1)
+            assert metrics["wait_seconds_max"] >= 0.05
+        assert pool_metrics()["test-pool"]["checked_out"] == 0
+    finally:
+        engine.dispose()
@@ -0,0 +1,111 @@
+import hashlib
+import hmac
+import json
+import time
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from app.common.json_stream import iter_array_items
+from app.models.models import Location, Terminal
+from app.security import hmac as hmac_module
+from app.security.hmac import SignedBody, get_terminal, hmac_stream_dependency, verify_hmac_signature
+
+
+def seed_terminal(db):
+    loc = Location(name="Bar", kind="bar")
+    db.add(loc)
+    db.flush()
+    terminal = Terminal(terminal_id="t1", location_id=loc.id, secret_hash="secret", status="active")
+    db.add(terminal)
+    db.commit()
+    return terminal
+
+
+def sign(body: bytes, secret: str = "secret"):
+    timestamp = str(int(time.time()))
+    message = f"POST|/api/v1/sales|{timestamp}|{hashlib.sha256(body).hexdigest()}".encode()
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest(), timestamp
+
+
+def test_verify_returns_cached_terminal(db_session):
+    terminal = seed_terminal(db_session)
+    signature, timestamp = sign(b"{}")
+    resolved = verify_hmac_signature("POST", "/api/v1/sales", b"{}", "t1", signature, timestamp, db=db_session)
+    assert (resolved.id, resolved.location_id) == (terminal.id, terminal.location_id)
+    db_session.delete(terminal)
+    db_session.flush()
+    # Served from the cache: the uncommitted delete is not visible to verification
+    assert get_terminal("t1", db_session) == resolved
+    db_session.rollback()
+
+
+def test_status_change_invalidates_terminal(db_session):
+    terminal = seed_terminal(db_session)
+    signature, timestamp = sign(b"{}")
+    verify_hmac_signature("POST", "/api/v1/sales", b"{}", "t1", signature, timestamp, db=db_session)
+    terminal.status = "blocked"
+    db_session.commit()
+    with pytest.raises(HTTPException) as exc:
+        verify_hmac_signature("POST", "/api/v1/sales", b"{}", "t1", signature, timestamp, db=db_session)
+    assert exc.value.detail == "Invalid terminal"
+
+
+def test_secret_rotation_invalidates_terminal(db_session):
+    terminal = seed_terminal(db_session)
+    get_terminal("t1", db_session)
+    terminal.secret_hash = "rotated"
+    db_session.commit()
+    signature, timestamp = sign(b"{}", secret="rotated")
+    assert verify_hmac_signature("POST", "/api/v1/sales", b"{}", "t1", signature, timestamp, db=db_session).secret == "rotated"
+
+
+
+def test_rotation_during_load_is_not_overwritten(db_session, monkeypatch):
+    terminal = seed_terminal(db_session)
+    load_terminal = hmac_module.load_terminal
+
+    def load_then_rotate(db, terminal_id):
+        record = load_terminal(db, terminal_id)
+        # The rotation commits after the old secret was read
+        terminal.secret_hash = "rotated"
+        db.commit()
+        return record
+
+    monkeypatch.setattr(hmac_module, "load_terminal", load_then_rotate)
+    assert get_terminal("t1", db_session).secret == "secret"
+    monkeypatch.setattr(hmac_module, "load_terminal", load_terminal)
+    assert get_terminal("t1", db_session).secret == "rotated"
+
+
+def streaming_client():
+    app = FastAPI()
+
+    @app.post("/api/v1/sales")
+    def echo(signed: SignedBody = Depends(hmac_stream_dependency)):
+        return {"terminal": signed.terminal.terminal_id, "events": list(iter_array_items(signed.body, "events"))}
+
+    return TestClient(app)
+
+
+def test_stream_dependency_verifies_and_spools_body(db_session):
+    seed_terminal(db_session)
+    get_terminal("t1", db_session)
+    body = json.dumps({"events": [{"event_id": "e1"}, {"event_id": "e2"}]}).encode()
+    signature, timestamp = sign(body)
+    headers = {"X-Terminal-ID": "t1", "X-Signature": signature, "X-Timestamp": timestamp}
+    response = streaming_client().post("/api/v1/sales", content=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"terminal": "t1", "events": [{"event_id": "e1"}, {"event_id": "e2"}]}
+    tampered = streaming_client().post("/api/v1/sales", content=body + b" ", headers=headers)
+    assert tampered.status_code == 401
+
+
+def test_stream_dependency_rejects_oversized_body(db_session, monkeypatch):
+    seed_terminal(db_session)
+    get_terminal("t1", db_session)
+    monkeypatch.setattr(hmac_module.settings, "signed_body_max_bytes", 16)
+    body = json.dumps({"events": [{"event_id": "e1"}, {"event_id": "e2"}]}).encode()
+    signature, timestamp = sign(body)
+    headers = {"X-Terminal-ID": "t1", "X-Signature": signature, "X-Timestamp": timestamp}
+    response = streaming_client().post("/api/v1/sales", content=body, headers=headers)
+    assert response.status_code == 413
@@ -0,0 +1,113 @@
+from decimal import Decimal
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.infrastructure.db.base import Base
+from app.models.models import Unit, ProductType, Product, Location, Terminal, Stock, SaleEvent
+from app.services import ingest_queue
+from app.services.sales_service import SalesService
+
+
+def make_session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+def seed(factory):
+    with factory() as db:
+        bottle = Unit(code="bottle", description="Bottle", unit_type="base")
+        wine_type = ProductType(name="wine", is_composite=False)
+        bar, cellar = Location(name="Bar", kind="bar"), Location(name="Cellar", kind="warehouse")
+        db.add_all([bottle, wine_type, bar, cellar])
+        db.flush()
+        wine = Product(name="Red wine", sku="WINE01", primary_category="wine", product_type_id=wine_type.id, base_unit_id=bottle.id)
+        db.add(wine)
+        db.flush()
+        terminals = [Terminal(terminal_id=f"t{loc.id}", location_id=loc.id, secret_hash="secret") for loc in (bar, cellar)]
+        db.add_all(terminals)
+        db.add_all([Stock(location_id=loc.id, product_id=wine.id, quantity=Decimal("3"), unit_id=bottle.id) for loc in (bar, cellar)])
+        db.commit()
+        return wine.id, terminals
+
+
+def enqueue(factory, terminal, product_id, quantities):
+    with factory() as db:
+        events = [
+            {"event_id": f"{terminal.terminal_id}-{i}", "lines": [{"product_id": product_id, "quantity": qty, "unit": "bottle"}]}
+            for i, qty in enumerate(quantities)
+        ]
+        SalesService(db).ingest_batch(terminal.id, terminal.location_id, events)
+        db.commit()
+
+
+def stock_by_location(factory):
+    with factory() as db:
+        return {s.location_id: s.quantity for s in db.query(Stock).all()}
+
+
+def test_worker_drains_queue_per_location():
+    factory = make_session_factory()
+    wine_id, (bar, cellar) = seed(factory)
+    enqueue(factory, bar, wine_id, [1, 1])
+    enqueue(factory, cellar, wine_id, [2])
+    with factory() as db:
+        metrics = ingest_queue.lag_metrics(db)
+    assert metrics["depth"] == 3
+    assert {loc: m["depth"] for loc, m in metrics["locations"].items()} == {bar.location_id: 2, cellar.location_id: 1}
+    assert stock_by_location(factory) == {bar.location_id: Decimal("3"), cellar.location_id: Decimal("3")}
+
+    assert ingest_queue.run_once(factory, batch_size=10) == 3
+    assert stock_by_location(factory) == {bar.location_id: Decimal("1"), cellar.location_id: Decimal("1")}
+    with factory() as db:
+        assert ingest_queue.lag_metrics(db)["depth"] == 0
+        assert {e.status for e in db.query(SaleEvent).all()} == {"confirmed"}
+
+
+def test_unappliable_event_is_failed_without_blocking_others():
+    factory = make_session_factory()
+    wine_id, (bar, _) = seed(factory)
+    enqueue(factory, bar, wine_id, [1, 5, 2])
+    assert ingest_queue.run_once(factory, batch_size=10) == 3
+    with factory() as db:
+        statuses = {e.event_id: e.status for e in db.query(SaleEvent).all()}
+        assert ingest_queue.lag_metrics(db)["failed"] == 1
+    assert statuses == {"t1-0": "confirmed", "t1-1": "failed", "t1-2": "confirmed"}
+    assert stock_by_location(factory)[bar.location_id] == Decimal("0")
+
+
+
+def test_unexpected_error_at_one_location_does_not_stop_the_others(monkeypatch):
+    factory = make_session_factory()
+    wine_id, (bar, cellar) = seed(factory)
+    enqueue(factory, bar, wine_id, [1])
+    enqueue(factory, cellar, wine_id, [1])
+    confirm_events = SalesService.confirm_events
+
+    def time_out_at_bar(self, location_id, events):
+        if location_id == bar.location_id:
+            raise OperationalError("UPDATE stock", {}, Exception("canceling statement due to statement timeout"))
+        return confirm_events(self, location_id, events)
+
+    monkeypatch.setattr(SalesService, "confirm_events", time_out_at_bar)
+    # The bar is visited first and fails; the cellar is still reconciled
+    assert ingest_queue.run_once(factory, batch_size=10) == 1
+    assert ingest_queue.run_once(factory, batch_size=10) == 0
+    assert stock_by_location(factory) == {bar.location_id: Decimal("3"), cellar.location_id: Decimal("2")}
+    with factory() as db:
+        metrics = ingest_queue.lag_metrics(db)
+    assert metrics["errors"] == 2
+    assert metrics["locations"][bar.location_id]["depth"] == 1
+    assert metrics["locations"][bar.location_id]["errors"] == 2
+    assert "statement timeout" in metrics["locations"][bar.location_id]["last_error"]
+
+
+def test_partitions_split_locations():
+    factory = make_session_factory()
+    wine_id, (bar, cellar) = seed(factory)
+    enqueue(factory, bar, wine_id, [1])
+    enqueue(factory, cellar, wine_id, [1])
+    with factory() as db:
+        assert ingest_queue.pending_locations(db, partition=1, partitions=2) == [bar.location_id]
+        assert ingest_queue.pending_locations(db, partition=0, partitions=2) == [cellar.location_id]
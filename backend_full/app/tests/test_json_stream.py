@@ -0,0 +1,34 @@
+import io
+import json
+import pytest
+from app.common.json_stream import JSONStreamError, iter_array_items
+
+
+def stream(document, chunk_size=7):
+    return list(iter_array_items(io.BytesIO(json.dumps(document).encode()), "events", chunk_size=chunk_size))
+
+
+def test_yields_items_across_chunk_boundaries():
+    events = [{"event_id": f"e{i}", "lines": [{"product_id": i, "quantity": 12345.5, "unit": "glass"}]} for i in range(20)]
+    document = {"terminal": "t1", "meta": {"nested": [1, 2, {"x": "}]"}]}, "events": events, "after": 123456789}
+    assert stream(document) == events
+    assert stream(document, chunk_size=1) == events
+
+
+def test_handles_empty_and_missing_arrays():
+    assert stream({"events": []}) == []
+    assert stream({"other": [1]}) == []
+    assert stream({}) == []
+
+
+def test_multibyte_characters_split_between_chunks():
+    events = [{"name": "Вино красное 🍷"}]
+    assert stream({"events": events}, chunk_size=3) == events
+
+
+def test_truncated_document_raises():
+    body = io.BytesIO(b'{"events": [{"event_id": "e1"}, {"event_id": ')
+    items = iter_array_items(body, "events", chunk_size=8)
+    assert next(items) == {"event_id": "e1"}
+    with pytest.raises(JSONStreamError):
+        next(items)
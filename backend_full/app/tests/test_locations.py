@@ -0,0 +1,43 @@
+from sqlalchemy import event
+from app.config import get_settings
+from app.models.models import Location
+from app.services.locations import default_location_id, ensure_default_location
+
+
+def count_queries(db, fn):
+    statements = []
+    engine = db.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return result, len(statements)
+
+
+def test_startup_creates_missing_default_location(db_session):
+    location_id = ensure_default_location(db_session)
+    assert db_session.get(Location, location_id).name == get_settings().default_location_name
+    result, queries = count_queries(db_session, lambda: default_location_id(db_session))
+    assert (result, queries) == (location_id, 0)
+
+
+def test_default_location_is_reresolved_after_location_changes(db_session):
+    bar = Location(name="Bar", kind="bar")
+    main = Location(name=get_settings().default_location_name, kind="warehouse")
+    db_session.add_all([bar, main])
+    db_session.commit()
+    # DEFAULT_LOCATION_ID is 1
+    assert default_location_id(db_session) == bar.id
+
+    bar.is_active = False
+    db_session.commit()
+    # The configured id is inactive now, so the configured name wins
+    assert default_location_id(db_session) == main.id
+
+    main.name = "Renamed"
+    db_session.commit()
+    _, queries = count_queries(db_session, lambda: default_location_id(db_session))
+    assert queries > 0
+    assert default_location_id(db_session) == main.id
@@ -1,5 +1,10 @@
 import pytest
-from app.api.v1.deps.auth import check_permission
+from sqlalchemy import event
+from fastapi import HTTPException
+from app.api.v1.deps.auth import check_permission, has_permission, get_current_user
+from app.common.cache import TTLCache
+from app.security import principals
+from app.security.auth import create_access_token
 from app.models.models import User, Role, Permission, RolePermission, UserRole
 
 
@@ -22,3 +27,93 @@ def test_rbac_denies_without_permission(db_session):
     db_session.commit()
     with pytest.raises(Exception):
         check_permission(user, "product.write", db=db_session)
+
+
+def test_permissions_cached_until_roles_change(db_session):
+    user = User(username="user2", password_hash="x", is_superuser=False, is_active=True)
+    viewer = Role(name="viewer", scope="global")
+    editor = Role(name="editor", scope="location", location_id=7)
+    read, write = Permission(code="product.read"), Permission(code="product.write")
+    db_session.add_all([user, viewer, editor, read, write])
+    db_session.commit()
+    db_session.add_all([
+        RolePermission(role_id=viewer.id, permission_id=read.id),
+        RolePermission(role_id=editor.id, permission_id=write.id),
+        UserRole(user_id=user.id, role_id=viewer.id),
+    ])
+    db_session.commit()
+
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert has_permission(user, "product.read", db=db_session)
+        assert not has_permission(user, "product.write", location_id=7, db=db_session)
+        assert has_permission(user, "product.read", location_id=3, db=db_session)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(statements) == 1
+
+    db_session.add(UserRole(user_id=user.id, role_id=editor.id))
+    db_session.commit()
+    assert has_permission(user, "product.write", location_id=7, db=db_session)
+    assert not has_permission(user, "product.write", location_id=8, db=db_session)
+
+
+def test_load_racing_with_invalidation_is_not_cached():
+    cache = TTLCache(ttl_seconds=60)
+
+    def load_while_roles_change():
+        # A role change commits while the permissions are being read
+        cache.invalidate(1)
+        return "stale"
+
+    assert cache.get_or_load(1, load_while_roles_change) == "stale"
+    assert cache.get(1) is None
+    assert cache.get_or_load(1, lambda: "fresh") == "fresh"
+    assert cache.get(1) == "fresh"
+
+
+def test_principal_cached_until_user_deactivated(db_session):
+    user = User(username="cashier", password_hash="x", is_superuser=False, is_active=True)
+    db_session.add(user)
+    db_session.commit()
+    token = create_access_token("cashier")
+
+    assert get_current_user(token, db_session).id == user.id
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        assert get_current_user(token, db_session).username == "cashier"
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert statements == []
+
+    user.is_active = False
+    db_session.commit()
+    with pytest.raises(HTTPException):
+        get_current_user(token, db_session)
+
+
+def test_deactivation_during_principal_load_is_not_overwritten(db_session, monkeypatch):
+    user = User(username="barista", password_hash="x", is_superuser=False, is_active=True)
+    db_session.add(user)
+    db_session.commit()
+    token = create_access_token("barista")
+    load_principal = principals.load_principal
+
+    def load_then_deactivate(db, username):
+        principal = load_principal(db, username)
+        # The deactivation commits after the user was read as active
+        user.is_active = False
+        db.commit()
+        return principal
+
+    monkeypatch.setattr(principals, "load_principal", load_then_deactivate)
+    assert get_current_user(token, db_session).id == user.id
+    monkeypatch.setattr(principals, "load_principal", load_principal)
+    with pytest.raises(HTTPException):
+        get_current_user(token, db_session)
@@ -0,0 +1,73 @@
+import threading
+from types import SimpleNamespace
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from app.infrastructure.db import replica
+from app.infrastructure.db.replica import ReplicaRouter
+
+
+def make_router(tmp_path, replica_url=None, **options):
+    primary = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'primary.db'}"))
+    read = sessionmaker(bind=create_engine(replica_url or f"sqlite:///{tmp_path / 'replica.db'}"))
+    settings = {"max_lag_seconds": 10, "check_interval_seconds": 60, "retry_seconds": 60, **options}
+    return ReplicaRouter(primary, read, **settings), primary, read
+
+
+def test_reads_go_to_a_healthy_replica(tmp_path):
+    router, primary, read = make_router(tmp_path)
+    router.probe()
+    assert router.sessionmaker() is read
+    with router.sessionmaker()() as db:
+        assert db.execute(text("PRAGMA database_list")).all()[0][2].endswith("replica.db")
+
+
+def test_requests_never_wait_for_the_probe(tmp_path, monkeypatch):
+    release, probed = threading.Event(), threading.Event()
+
+    def slow_lag(conn):
+        release.wait(5)
+        probed.set()
+        return 0.0
+
+    monkeypatch.setattr(replica, "replication_lag_seconds", slow_lag)
+    router, primary, read = make_router(tmp_path)
+    # The probe is still connecting: requests use the primary instead of waiting for it
+    assert router.sessionmaker() is primary
+    assert router.sessionmaker() is primary
+    release.set()
+    assert probed.wait(5)
+    router.probe()
+    assert router.sessionmaker() is read
+
+
+def test_unreachable_replica_falls_back_to_primary(tmp_path):
+    router, primary, _ = make_router(tmp_path, replica_url=f"sqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    router.probe()
+    assert router.sessionmaker() is primary
+    # The circuit stays open: requests keep using the primary until the retry period is over
+    assert router.sessionmaker() is primary
+
+
+def test_lagging_replica_is_skipped_unless_lag_is_tolerated(tmp_path, monkeypatch):
+    monkeypatch.setattr(replica, "replication_lag_seconds", lambda conn: 30.0)
+    router, primary, _ = make_router(tmp_path)
+    router.probe()
+    assert router.sessionmaker() is primary
+
+    tolerant, _, read = make_router(tmp_path, max_lag_seconds=0)
+    tolerant.probe()
+    assert tolerant.sessionmaker() is read
+
+
+def test_disconnect_on_replica_opens_the_circuit(tmp_path):
+    router, primary, read = make_router(tmp_path)
+    router.probe()
+    assert router.sessionmaker() is read
+    router.on_error(SimpleNamespace(is_disconnect=True, connection=object(), original_exception=OSError("gone")))
+    assert router.sessionmaker() is primary
+
+
+def test_without_replica_everything_uses_primary(tmp_path):
+    primary = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'primary.db'}"))
+    router = ReplicaRouter(primary, None, max_lag_seconds=10, check_interval_seconds=5, retry_seconds=30)
+    assert router.sessionmaker() is primary
@@ -0,0 +1,49 @@
+import asyncio
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.audit.request_log_writer import RequestLogWriter
+from app.infrastructure.db.base import Base
+from app.models.models import RequestLog
+
+
+def make_session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)
+
+
+def log_entry(i):
+    return {"request_id": f"r{i}", "method": "GET", "path": "/", "status_code": 200, "context": {"duration_ms": 1}}
+
+
+def test_writer_batches_and_flushes_on_stop():
+    factory = make_session_factory()
+    writer = RequestLogWriter(session_factory=factory, max_queue_size=100, batch_size=10, flush_interval_ms=10_000)
+
+    async def scenario():
+        await writer.start()
+        for i in range(25):
+            writer.submit(log_entry(i))
+        await asyncio.sleep(0.05)
+        await writer.stop()
+
+    asyncio.run(scenario())
+    with factory() as session:
+        assert session.query(RequestLog).count() == 25
+    assert writer.stats()["written"] == 25
+    assert writer.batches == 3
+
+
+def test_writer_drops_when_queue_full():
+    writer = RequestLogWriter(session_factory=make_session_factory(), max_queue_size=2, batch_size=10)
+
+    async def scenario():
+        await writer.start()
+        accepted = [writer.submit(log_entry(i)) for i in range(5)]
+        await writer.stop()
+        return accepted
+
+    assert asyncio.run(scenario()) == [True, True, False, False, False]
+    assert writer.dropped == 3
+    assert writer.written == 2
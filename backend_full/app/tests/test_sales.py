@@ -1,5 +1,9 @@
+import asyncio
 from decimal import Decimal
 import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.infrastructure.db.base import Base
 from app.services.sales_service import SalesService
 from app.services.stock_service import StockService
 from app.common.errors import IdempotencyError, ValidationError
@@ -11,25 +15,31 @@ from app.models.models import (
     Terminal,
     Stock,
     ProductUnit,
+    SaleEvent,
+    SaleLine,
 )
 
 
 def seed_core(db):
-    bottle = Unit(code="bottle", description="Bottle")
-    glass = Unit(code="glass", description="Glass")
+    bottle = Unit(code="bottle", description="Bottle", unit_type="base")
+    glass = Unit(code="glass", description="Glass", unit_type="portion", is_discrete=False)
     wine_type = ProductType(name="wine", is_composite=False)
+    db.add_all([bottle, glass, wine_type])
+    db.flush()
     wine = Product(
         name="Red wine",
         sku="WINE01",
         primary_category="wine",
-        product_type_id=1,
-        base_unit_code="bottle",
+        product_type_id=wine_type.id,
+        base_unit_id=bottle.id,
     )
     loc = Location(name="Bar", kind="bar")
-    term = Terminal(terminal_id="t1", location_id=1, secret_hash="secret")
-    db.add_all([bottle, glass, wine_type, wine, loc, term])
+    db.add_all([wine, loc])
     db.flush()
-    stock = Stock(location_id=loc.id, product_id=wine.id, quantity=Decimal("10"), unit_code="bottle")
+    term = Terminal(terminal_id="t1", location_id=loc.id, secret_hash="secret")
+    db.add(term)
+    db.add(ProductUnit(product_id=wine.id, unit_id=glass.id, ratio_to_base=Decimal("0.2")))
+    stock = Stock(location_id=loc.id, product_id=wine.id, quantity=Decimal("10"), unit_id=bottle.id)
     db.add(stock)
     db.commit()
     return wine, loc, term
@@ -69,3 +79,181 @@ def test_stock_cannot_go_negative(db_session):
     stock_service = StockService(db_session)
     with pytest.raises(ValidationError):
         stock_service.adjust_stock(loc.id, wine.id, Decimal("-100"), "bottle")
+
+
+def _count_queries(db, fn):
+    """Count non-INSERT statements; SQLite cannot batch ORM inserts that need generated ids."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not statement.startswith("INSERT"):
+            statements.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return len(statements)
+
+
+def _glass_events(wine, prefix, count):
+    return [
+        {"event_id": f"{prefix}{i}", "lines": [{"product_id": wine.id, "quantity": 1, "unit": "glass", "price": 5}]}
+        for i in range(count)
+    ]
+
+
+def test_daily_reconcile_query_count_is_constant(db_session):
+    wine, loc, term = seed_core(db_session)
+    service = SalesService(db_session)
+
+    def reconcile(events):
+        service.reconcile_daily(term.id, loc.id, events)
+        db_session.flush()
+
+    reconcile(_glass_events(wine, "warm", 1))
+    few = _count_queries(db_session, lambda: reconcile(_glass_events(wine, "a", 2)))
+    many = _count_queries(db_session, lambda: reconcile(_glass_events(wine, "b", 20)))
+    db_session.commit()
+    assert many == few
+    stock = db_session.query(Stock).first()
+    assert float(stock.quantity) == pytest.approx(10 - 23 * 0.2)
+
+
+def test_daily_reconcile_skips_confirmed_and_duplicates(db_session):
+    wine, loc, term = seed_core(db_session)
+    service = SalesService(db_session)
+    events = _glass_events(wine, "d", 2)
+    first = service.reconcile_daily(term.id, loc.id, events + events[:1])
+    db_session.commit()
+    second = service.reconcile_daily(term.id, loc.id, events)
+    db_session.commit()
+    assert first["confirmed_events"] == ["d0", "d1"]
+    assert second["confirmed_events"] == []
+    stock = db_session.query(Stock).first()
+    assert float(stock.quantity) == 9.6
+
+
+def test_daily_reconcile_applies_pending_events_once(db_session):
+    wine, loc, term = seed_core(db_session)
+    service = SalesService(db_session)
+    events = _glass_events(wine, "p", 2)
+    # Queued by the ingest endpoint, not yet picked up by the worker
+    service.ingest_batch(term.id, loc.id, events[:1])
+    db_session.commit()
+    result = service.reconcile_daily(term.id, loc.id, events)
+    db_session.commit()
+    assert result["confirmed_events"] == ["p0", "p1"]
+    assert {e.status for e in db_session.query(SaleEvent)} == {"confirmed"}
+    assert float(db_session.query(Stock).first().quantity) == 9.6
+
+
+def test_daily_reconcile_skips_event_confirmed_concurrently(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sales.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    with factory() as db:
+        wine, loc, term = seed_core(db)
+    events = _glass_events(wine, "r", 1)
+
+    def confirm_elsewhere(conn, cursor, statement, *args):
+        # Another retry of the same log commits right before this one inserts its events
+        if statement.startswith("INSERT INTO sale_event") and not confirmed:
+            confirmed.append(True)
+            with factory() as other:
+                SalesService(other).reconcile_daily(term.id, loc.id, events)
+                other.commit()
+
+    confirmed = []
+    with factory() as db:
+        event.listen(engine, "before_cursor_execute", confirm_elsewhere)
+        try:
+            result = SalesService(db).reconcile_daily(term.id, loc.id, events)
+            db.commit()
+        finally:
+            event.remove(engine, "before_cursor_execute", confirm_elsewhere)
+        assert confirmed
+        assert result["confirmed_events"] == []
+        assert float(db.query(Stock).first().quantity) == 9.8
+
+
+def test_ingest_batch_reports_status_per_event(db_session):
+    wine, loc, term = seed_core(db_session)
+    service = SalesService(db_session)
+    service.ingest_sale("old", term.id, loc.id, [{"product_id": wine.id, "quantity": 1, "unit": "bottle", "price": 10}])
+    db_session.commit()
+    line = {"product_id": wine.id, "quantity": 2, "unit": "glass", "price": 5}
+    results = service.ingest_batch(
+        term.id,
+        loc.id,
+        [
+            {"event_id": "b1", "lines": [line]},
+            {"event_id": "old", "lines": [line]},
+            {"event_id": "b1", "lines": [line]},
+            {"event_id": "b2", "lines": [dict(line, unit="crate")]},
+            {"lines": [line]},
+            {"event_id": "b3", "lines": [line, line]},
+        ],
+    )
+    db_session.commit()
+    assert [(r["event_id"], r["status"]) for r in results] == [
+        ("b1", "accepted"),
+        ("old", "duplicate"),
+        ("b1", "duplicate"),
+        ("b2", "rejected"),
+        (None, "rejected"),
+        ("b3", "accepted"),
+    ]
+    assert results[3]["error"] == "line 0: unknown unit"
+    stored = {e.event_id: e.status for e in db_session.query(SaleEvent).all()}
+    assert stored == {"old": "pending", "b1": "pending", "b3": "pending"}
+    assert db_session.query(SaleLine).count() == 4
+
+
+@pytest.mark.parametrize(
+    "override, error",
+    [
+        ({"quantity": -5}, "line 0: quantity must be positive"),
+        ({"quantity": 0}, "line 0: quantity must be positive"),
+        ({"quantity": "NaN"}, "line 0: quantity must be positive"),
+        ({"quantity": "Infinity"}, "line 0: quantity must be positive"),
+        ({"price": -1}, "line 0: price must not be negative"),
+        ({"price": "NaN"}, "line 0: price must not be negative"),
+        ({"product_id": True}, "line 0: unknown product"),
+    ],
+)
+def test_ingest_batch_rejects_invalid_lines(db_session, override, error):
+    wine, loc, term = seed_core(db_session)
+    assert wine.id == 1
+    valid = {"product_id": wine.id, "quantity": 1, "unit": "bottle", "price": 5}
+    events = [{"event_id": "bad", "lines": [dict(valid, **override)]}, {"event_id": "good", "lines": [valid]}]
+    results = SalesService(db_session).ingest_batch(term.id, loc.id, events)
+    db_session.commit()
+    assert results == [
+        {"event_id": "bad", "status": "rejected", "error": error},
+        {"event_id": "good", "status": "accepted"},
+    ]
+    assert [e.event_id for e in db_session.query(SaleEvent)] == ["good"]
+
+
+def test_duplicate_ingest_is_atomic_and_returns_409(db_session):
+    from app.main import domain_error_handler
+
+    wine, loc, term = seed_core(db_session)
+    service = SalesService(db_session)
+    line = {"product_id": wine.id, "quantity": 1, "unit": "bottle", "price": 10}
+    service.ingest_sale("e1", term.id, loc.id, [line])
+    statements = []
+    engine = db_session.get_bind()
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        with pytest.raises(IdempotencyError) as exc:
+            service.ingest_sale("e1", term.id, loc.id, [line])
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len(statements) == 1 and "ON CONFLICT" in statements[0]
+    response = asyncio.run(domain_error_handler(None, exc.value))
+    assert response.status_code == 409
@@ -0,0 +1,142 @@
+from decimal import Decimal
+from sqlalchemy import event, func
+from app.api.v1.routes.simple_catalog import _list_products, _products_page, update_product
+from app.audit import listeners as audit_listeners
+from app.schemas import simple as schemas
+from app.services import stock_totals
+from app.models.models import (
+    AuditLog,
+    Unit,
+    ProductType,
+    Product,
+    Location,
+    Stock,
+    AttributeDefinition,
+    ProductAttributeValue,
+    CompositeComponent,
+)
+
+
+def seed_products(db, count):
+    stock_totals.register_listeners()
+    bottle = Unit(code="bottle", description="Bottle", unit_type="base")
+    wine_type = ProductType(name="wine", is_composite=False)
+    set_type = ProductType(name="set", is_composite=True)
+    loc = Location(name="Main", kind="warehouse")
+    db.add_all([bottle, wine_type, set_type, loc])
+    db.flush()
+    volume = AttributeDefinition(product_type_id=wine_type.id, name="Volume", code="volume", data_type="number")
+    db.add(volume)
+    db.flush()
+    products = []
+    for i in range(count):
+        product = Product(
+            name=f"Product {i}",
+            sku=f"SKU{i}",
+            primary_category="wine",
+            product_type_id=set_type.id if i % 2 else wine_type.id,
+            base_unit_id=bottle.id,
+            unit_cost=Decimal("1"),
+        )
+        db.add(product)
+        db.flush()
+        db.add(ProductAttributeValue(product_id=product.id, attribute_definition_id=volume.id, value_number=0.75))
+        db.add(Stock(location_id=loc.id, product_id=product.id, quantity=Decimal("3"), unit_id=bottle.id))
+        if products:
+            db.add(CompositeComponent(parent_product_id=product.id, component_product_id=products[0].id, quantity=Decimal("1"), unit_id=bottle.id))
+        products.append(product)
+    db.commit()
+    db.expunge_all()
+
+
+def count_listing_queries(db, limit):
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        result = _list_products(db, location_id=None, product_type_id=None, skip=0, limit=limit)
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+    db.expunge_all()
+    return result, len(statements)
+
+
+def test_product_listing_query_count_is_constant(db_session):
+    seed_products(db_session, 30)
+    small, small_queries = count_listing_queries(db_session, 3)
+    large, large_queries = count_listing_queries(db_session, 30)
+    assert len(small) == 3
+    assert len(large) == 30
+    assert small_queries == large_queries
+
+
+def test_product_listing_keeps_response_shape(db_session):
+    seed_products(db_session, 3)
+    products, _ = count_listing_queries(db_session, 10)
+    first, second = products[0], products[1]
+    assert first.stock == Decimal("3")
+    assert first.is_composite is False
+    assert [a.attribute_definition_id for a in first.attributes] == [1]
+    assert second.is_composite is True
+    assert second.components == [{"component_product_id": first.id, "quantity": Decimal("1")}]
+
+
+def test_product_page_walks_keyset_cursor(db_session):
+    seed_products(db_session, 7)
+    seen, cursor, totals = [], None, []
+    while True:
+        page = _products_page(db_session, location_id=1, product_type_id=None, cursor=cursor, limit=3, include_total=True)
+        seen.extend(p.id for p in page.items)
+        totals.append(page.total)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    assert seen == list(range(1, 8))
+    assert totals == [7, None, None]
+
+
+def product_update(product, volume, components=()):
+    return schemas.ProductUpdate(
+        product_type_id=product.product_type_id,
+        name=product.name,
+        unit_cost=Decimal("1"),
+        stock=Decimal("3"),
+        base_unit_id=product.base_unit_id,
+        attributes=[schemas.ProductAttributeValueCreate(attribute_definition_id=1, value=volume)],
+        components=[schemas.ProductComponentCreate(component_product_id=pid, quantity=qty) for pid, qty in components],
+    )
+
+
+def audited_since(db, last_id):
+    rows = db.query(AuditLog).filter(AuditLog.id > last_id, AuditLog.model != "Product")
+    return sorted((row.model, row.action) for row in rows)
+
+
+def test_product_update_writes_only_changed_attributes_and_components(db_session):
+    audit_listeners.register_listeners()
+    seed_products(db_session, 3)
+    composite = db_session.get(Product, 2)
+    unchanged = product_update(composite, 0.75, [(1, Decimal("1"))])
+    # The first save adds the base ProductUnit the seed lacks
+    update_product(composite.id, unchanged, user=None, db=db_session)
+    seeded = db_session.query(func.max(AuditLog.id)).scalar()
+
+    # Unchanged attribute and recipe: nothing is rewritten
+    update_product(composite.id, unchanged, user=None, db=db_session)
+    assert audited_since(db_session, seeded) == []
+    assert db_session.query(CompositeComponent).filter_by(parent_product_id=composite.id).one().id == 1
+
+    update_product(composite.id, product_update(composite, 0.5, [(3, Decimal("2"))]), user=None, db=db_session)
+    assert audited_since(db_session, seeded) == [
+        ("CompositeComponent", "delete"),
+        ("CompositeComponent", "insert"),
+        ("ProductAttributeValue", "update"),
+    ]
+    value = db_session.query(ProductAttributeValue).filter_by(product_id=composite.id).one()
+    assert value.value_number == Decimal("0.5")
+    recipe = db_session.query(CompositeComponent).filter_by(parent_product_id=composite.id)
+    assert [(c.component_product_id, c.quantity) for c in recipe] == [(3, Decimal("2"))]
@@ -0,0 +1,81 @@
+from decimal import Decimal
+import pytest
+from app.common.errors import ValidationError
+from app.services import stock_totals
+from app.services.stock_service import StockService
+from app.models.models import AuditLog, Unit, ProductType, Product, Location, Stock, ProductStockTotal
+
+
+def seed_stock(db):
+    stock_totals.register_listeners()
+    bottle = Unit(code="bottle", description="Bottle", unit_type="base")
+    wine_type = ProductType(name="wine", is_composite=False)
+    bar = Location(name="Bar", kind="bar")
+    cellar = Location(name="Cellar", kind="warehouse")
+    db.add_all([bottle, wine_type, bar, cellar])
+    db.flush()
+    wine = Product(name="Red wine", sku="WINE01", primary_category="wine", product_type_id=wine_type.id, base_unit_id=bottle.id)
+    db.add(wine)
+    db.flush()
+    bar_stock = Stock(location_id=bar.id, product_id=wine.id, quantity=Decimal("4"), unit_id=bottle.id)
+    cellar_stock = Stock(location_id=cellar.id, product_id=wine.id, quantity=Decimal("6"), unit_id=bottle.id)
+    db.add_all([bar_stock, cellar_stock])
+    db.commit()
+    return wine, bar_stock, cellar_stock
+
+
+def test_totals_follow_stock_mutations(db_session):
+    wine, bar_stock, cellar_stock = seed_stock(db_session)
+    assert stock_totals.totals_for(db_session, [wine.id]) == {wine.id: Decimal("10")}
+
+    bar_stock.quantity = Decimal("1.5")
+    db_session.commit()
+    assert stock_totals.totals_for(db_session, [wine.id])[wine.id] == Decimal("7.5")
+
+    db_session.delete(cellar_stock)
+    db_session.commit()
+    assert stock_totals.totals_for(db_session, [wine.id])[wine.id] == Decimal("1.5")
+    assert stock_totals.find_drift(db_session) == []
+
+
+def test_rebuild_fixes_drift(db_session):
+    wine, _, _ = seed_stock(db_session)
+    db_session.query(ProductStockTotal).update({"quantity": Decimal("99")})
+    db_session.commit()
+    assert stock_totals.find_drift(db_session) == [(wine.id, Decimal("99"), Decimal("10"))]
+
+    stock_totals.rebuild(db_session)
+    db_session.commit()
+    assert stock_totals.find_drift(db_session) == []
+
+
+def test_atomic_debit_keeps_totals_and_audit(db_session):
+    wine, bar_stock, _ = seed_stock(db_session)
+    remaining = StockService(db_session).debit(bar_stock.location_id, {wine.id: Decimal("1.5")})
+    db_session.commit()
+    assert remaining == {wine.id: Decimal("2.5")}
+    assert bar_stock.quantity == Decimal("2.5")
+    assert stock_totals.totals_for(db_session, [wine.id])[wine.id] == Decimal("8.5")
+    assert stock_totals.find_drift(db_session) == []
+    audit = db_session.query(AuditLog).filter_by(model="Stock", action="update").one()
+    assert audit.record_id == str(bar_stock.id)
+    assert Decimal(audit.old_data["quantity"]) == Decimal("4")
+    assert Decimal(audit.new_data["quantity"]) == Decimal("2.5")
+
+
+def test_atomic_debit_rejects_short_stock(db_session):
+    wine, bar_stock, _ = seed_stock(db_session)
+    with pytest.raises(ValidationError) as exc:
+        StockService(db_session).debit(bar_stock.location_id, {wine.id: Decimal("5")})
+    assert exc.value.details == {"product_ids": [wine.id]}
+    db_session.rollback()
+    assert stock_totals.totals_for(db_session, [wine.id])[wine.id] == Decimal("10")
+
+
+@pytest.mark.parametrize("amount", [Decimal("-5"), Decimal("NaN")])
+def test_atomic_debit_cannot_credit_stock(db_session, amount):
+    wine, bar_stock, _ = seed_stock(db_session)
+    with pytest.raises(ValidationError, match="must be positive"):
+        StockService(db_session).debit(bar_stock.location_id, {wine.id: amount})
+    db_session.rollback()
+    assert db_session.get(Stock, bar_stock.id).quantity == Decimal("4")
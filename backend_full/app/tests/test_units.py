@@ -0,0 +1,77 @@
+from decimal import Decimal
+import pytest
+from sqlalchemy import event
+from app.common.errors import ValidationError
+from app.services.stock_service import StockService
+from app.services.units import UnitConverter
+from app.models.models import Unit, ProductType, Product, Location, ProductUnit, Stock
+
+
+def seed_units(db):
+    bottle = Unit(code="bottle", description="Bottle", unit_type="base")
+    glass = Unit(code="glass", description="Glass", unit_type="portion", is_discrete=False)
+    wine_type = ProductType(name="wine", is_composite=False)
+    loc = Location(name="Bar", kind="bar")
+    db.add_all([bottle, glass, wine_type, loc])
+    db.flush()
+    wine = Product(name="Red wine", sku="WINE01", primary_category="wine", product_type_id=wine_type.id, base_unit_id=bottle.id)
+    db.add(wine)
+    db.flush()
+    glass_unit = ProductUnit(product_id=wine.id, unit_id=glass.id, ratio_to_base=Decimal("0.2"), discrete_step=Decimal("0.5"))
+    db.add_all([glass_unit, Stock(location_id=loc.id, product_id=wine.id, quantity=Decimal("10"), unit_id=bottle.id)])
+    db.commit()
+    return wine, bottle, glass, glass_unit, loc
+
+
+def _queries(db, fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return result, statements
+
+
+def test_batch_conversion_is_cached(db_session):
+    wine, bottle, glass, _, _ = seed_units(db_session)
+    items = [(wine.id, glass.id, Decimal("5")), (wine.id, bottle.id, Decimal("2"))]
+    assert UnitConverter(db_session).to_base_many(items) == [Decimal("1.0"), Decimal("2")]
+    converted, statements = _queries(db_session, lambda: UnitConverter(db_session).to_base_many(items))
+    assert converted == [Decimal("1.0"), Decimal("2")]
+    assert statements == []
+
+
+def test_ratio_edit_invalidates_cache(db_session):
+    wine, _, glass, glass_unit, _ = seed_units(db_session)
+    converter = UnitConverter(db_session)
+    assert converter.to_base(wine.id, glass.id, Decimal("5")) == Decimal("1.0")
+    glass_unit.ratio_to_base = Decimal("0.25")
+    db_session.commit()
+    assert converter.to_base(wine.id, glass.id, Decimal("4")) == Decimal("1.00")
+
+
+def test_unknown_unit_for_product_raises(db_session):
+    wine, bottle, glass, _, _ = seed_units(db_session)
+    other = Unit(code="box", description="Box", unit_type="package")
+    db_session.add(other)
+    db_session.commit()
+    with pytest.raises(ValidationError):
+        UnitConverter(db_session).to_base(wine.id, other.id, Decimal("1"))
+
+
+def test_normalize_uses_product_unit_step(db_session):
+    wine, _, glass, _, _ = seed_units(db_session)
+    assert UnitConverter(db_session).normalize(wine.id, glass.id, Decimal("1.3")) == Decimal("1.5")
+
+
+def test_adjust_stock_converts_glasses(db_session):
+    wine, _, _, _, loc = seed_units(db_session)
+    StockService(db_session).adjust_stock(loc.id, wine.id, Decimal("-5"), "glass")
+    db_session.commit()
+    assert db_session.query(Stock).one().quantity == Decimal("9")
@@ -0,0 +1,114 @@
+"""Load benchmark for the terminal-facing endpoints of a running server.
+
+Start the API once with DATABASE_ASYNC=false and once with DATABASE_ASYNC=true,
+run the same command against both and compare throughput and latency.
+Comparing --endpoint sales with --endpoint batch shows the gain of batched ingestion in events/s.
+
+Usage:
+    python scripts/bench_load.py --terminal-id t1 --secret secret --product-id 1
+    python scripts/bench_load.py --endpoint batch --batch-size 100 --requests 200
+    python scripts/bench_load.py --endpoint catalog --token <jwt> --location 1
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def _event(args) -> dict:
+    return {
+        "event_id": f"bench-{uuid.uuid4()}",
+        "lines": [{"product_id": args.product_id, "quantity": 1, "unit": args.unit, "price": 1}],
+    }
+
+
+def _signed(path: str, payload: dict, args) -> tuple:
+    body = json.dumps(payload).encode()
+    timestamp = str(int(time.time()))
+    message = f"POST|{path}|{timestamp}|{hashlib.sha256(body).hexdigest()}".encode()
+    headers = {
+        "Content-Type": "application/json",
+        "X-Terminal-ID": args.terminal_id,
+        "X-Timestamp": timestamp,
+        "X-Signature": hmac.new(args.secret.encode(), message, hashlib.sha256).hexdigest(),
+    }
+    return path, body, headers
+
+
+def _events_per_request(args) -> int:
+    return args.batch_size if args.endpoint == "batch" else 1
+
+
+async def _request(client: httpx.AsyncClient, args) -> httpx.Response:
+    if args.endpoint == "sales":
+        path, body, headers = _signed("/api/v1/sales", _event(args), args)
+        return await client.post(path, content=body, headers=headers)
+    if args.endpoint == "batch":
+        payload = {"events": [_event(args) for _ in range(args.batch_size)]}
+        path, body, headers = _signed("/api/v1/sales/batch", payload, args)
+        return await client.post(path, content=body, headers=headers)
+    return await client.get(
+        "/api/v1/catalog", params={"location": args.location}, headers={"Authorization": f"Bearer {args.token}"}
+    )
+
+
+async def run(args) -> None:
+    latencies = []
+    errors = 0
+    remaining = iter(range(args.requests))
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as client:
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await _request(client, args)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+    print(
+        f"{args.endpoint}: {len(latencies)} requests, concurrency {args.concurrency}, {errors} errors\n"
+        f"  throughput {len(latencies) / elapsed:8.1f} req/s"
+        f"  {len(latencies) * _events_per_request(args) / elapsed:8.1f} events/s\n"
+        f"  latency    p50 {statistics.median(latencies) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", choices=["sales", "batch", "catalog"], default="sales")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--terminal-id", default="t1")
+    parser.add_argument("--secret", default="secret")
+    parser.add_argument("--batch-size", type=int, default=100, help="events per request for the batch endpoint")
+    parser.add_argument("--product-id", type=int, default=1)
+    parser.add_argument("--unit", default="bottle")
+    parser.add_argument("--token", help="bearer token for the catalog endpoint")
+    parser.add_argument("--location", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark SalesService.reconcile_daily against an in-memory SQLite database.
+
+Usage:
+    python scripts/bench_reconcile.py                  # 10, 100 and 1000 events
+    python scripts/bench_reconcile.py --events 50 500  # custom event counts
+"""
+import argparse
+import os
+import time
+from decimal import Decimal
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.common.cache import clear_all_caches  # noqa: E402
+from app.models.models import Base, Location, Product, ProductType, ProductUnit, Stock, Terminal, Unit  # noqa: E402
+from app.services.sales_service import SalesService  # noqa: E402
+
+PRODUCTS = 20
+
+
+def seed(db):
+    bottle = Unit(code="bottle", description="Bottle", unit_type="base")
+    glass = Unit(code="glass", description="Glass", unit_type="portion", is_discrete=False)
+    wine_type = ProductType(name="wine", is_composite=False)
+    loc = Location(name="Bar", kind="bar")
+    db.add_all([bottle, glass, wine_type, loc])
+    db.flush()
+    terminal = Terminal(terminal_id="bench", location_id=loc.id, secret_hash="secret")
+    products = [
+        Product(name=f"Wine {i}", sku=f"W{i}", primary_category="wine", product_type_id=wine_type.id, base_unit_id=bottle.id)
+        for i in range(PRODUCTS)
+    ]
+    db.add_all([terminal, *products])
+    db.flush()
+    for product in products:
+        db.add(ProductUnit(product_id=product.id, unit_id=glass.id, ratio_to_base=Decimal("0.2")))
+        db.add(Stock(location_id=loc.id, product_id=product.id, quantity=Decimal("1000000"), unit_id=bottle.id))
+    db.commit()
+    return terminal, [p.id for p in products]
+
+
+def run(count: int) -> None:
+    # Every run seeds a fresh database with the same ids; start from cold caches
+    clear_all_caches()
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    terminal, product_ids = seed(db)
+    events = [
+        {
+            "event_id": f"e{i}",
+            "lines": [
+                {"product_id": product_ids[i % PRODUCTS], "quantity": 1, "unit": "glass", "price": 5},
+                {"product_id": product_ids[(i + 1) % PRODUCTS], "quantity": 1, "unit": "bottle", "price": 20},
+            ],
+        }
+        for i in range(count)
+    ]
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    started = time.perf_counter()
+    SalesService(db).reconcile_daily(terminal.id, terminal.location_id, events)
+    db.commit()
+    elapsed = time.perf_counter() - started
+    inserts = sum(1 for statement in statements if statement.startswith("INSERT"))
+    print(f"{count:>6} events  {elapsed * 1000:9.1f} ms  {len(statements) - inserts:>4} queries  {inserts:>5} inserts")
+    db.close()
+    engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+    for count in args.events:
+        run(count)
+
+
+if __name__ == "__main__":
+    main()
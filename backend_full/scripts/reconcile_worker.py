@@ -0,0 +1,47 @@
+"""Reconcile queued sale events into stock (SALES_INGEST_MODE=queue).
+
+Usage:
+    python scripts/reconcile_worker.py                              # all locations
+    python scripts/reconcile_worker.py --partition 0 --partitions 2 # locations with id % 2 == 0
+    python scripts/reconcile_worker.py --once                       # one pass, then exit
+"""
+import argparse
+import signal
+import threading
+
+from app.common.logging import setup_logging
+from app.config import get_settings
+from app.infrastructure.db.session import BackgroundSessionLocal
+from app.services import ingest_queue
+
+
+def main() -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--partition", type=int, default=0)
+    parser.add_argument("--partitions", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=settings.ingest_worker_batch_size)
+    parser.add_argument("--once", action="store_true", help="process everything pending once and exit")
+    args = parser.parse_args()
+    setup_logging(settings.log_level, settings.structlog_json)
+
+    if args.once:
+        while ingest_queue.run_once(BackgroundSessionLocal, args.batch_size, args.partition, args.partitions):
+            pass
+        return
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    ingest_queue.run_worker(
+        BackgroundSessionLocal,
+        batch_size=args.batch_size,
+        poll_interval_seconds=settings.ingest_worker_poll_interval_ms / 1000,
+        partition=args.partition,
+        partitions=args.partitions,
+        stop=stop,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Rebuild or verify materialized per-product stock totals.
+
+Usage:
+    python scripts/stock_totals.py            # rebuild from the stock table
+    python scripts/stock_totals.py --verify   # report drift, exit code 1 if any
+"""
+import argparse
+import sys
+
+from app.infrastructure.db.session import session_scope
+from app.services import stock_totals
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verify", action="store_true", help="only report drift, do not rewrite totals")
+    args = parser.parse_args()
+
+    with session_scope() as session:
+        drift = stock_totals.find_drift(session)
+        for product_id, stored, actual in drift:
+            print(f"product {product_id}: stored={stored} actual={actual}")
+        if args.verify:
+            print(f"{len(drift)} product(s) drifted")
+            return 1 if drift else 0
+        written = stock_totals.rebuild(session)
+        print(f"Rebuilt {written} stock total(s), fixed {len(drift)} drifted")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""Concurrency stress test for composite sales sharing components.
+
+Seeds composites whose recipes list the same components in opposite orders, then
+sells them from many threads. ``--locking sequential`` takes stock locks the way
+the sale endpoint used to (parent first, then each component in recipe order);
+``--locking ordered`` uses ``StockService.lock_stocks`` and ``--locking atomic``
+the conditional UPDATE of ``StockService.debit``. Run them against PostgreSQL:
+sequential locking deadlocks, the other two must report zero.
+
+Usage:
+    DATABASE_URL=postgresql+psycopg2://... python scripts/stress_composite_sales.py --locking sequential
+    DATABASE_URL=postgresql+psycopg2://... python scripts/stress_composite_sales.py --locking ordered
+    DATABASE_URL=postgresql+psycopg2://... python scripts/stress_composite_sales.py --locking atomic
+"""
+import argparse
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+
+from app.audit import listeners as audit_listeners
+from app.config import get_settings
+from app.models.models import Base, CompositeComponent, Location, Product, ProductType, Stock, Unit
+from app.services import stock_totals
+from app.services.bom import BomExpander
+from app.services.stock_service import StockService
+
+# Simulated network round trip after every locking query
+ROUND_TRIP_SECONDS = 0.001
+
+
+def seed(db, composites: int, components: int):
+    tag = uuid.uuid4().hex[:8]
+    unit = db.query(Unit).filter_by(code="pcs").first() or Unit(code="pcs", description="Piece", unit_type="base")
+    plain = ProductType(name=f"stress-plain-{tag}", is_composite=False)
+    composite = ProductType(name=f"stress-set-{tag}", is_composite=True)
+    loc = Location(name=f"stress-{tag}", kind="bar")
+    db.add_all([unit, plain, composite, loc])
+    db.flush()
+
+    def product(name, product_type):
+        return Product(name=name, sku=f"{name}-{tag}", primary_category="stress", product_type_id=product_type.id, base_unit_id=unit.id)
+
+    parts = [product(f"part{i}", plain) for i in range(components)]
+    sets = [product(f"set{i}", composite) for i in range(composites)]
+    db.add_all(parts + sets)
+    db.flush()
+    for index, item in enumerate(sets):
+        # Alternate recipe order so that sequential locking takes shared rows in opposite orders
+        recipe = parts if index % 2 else list(reversed(parts))
+        db.add_all(
+            CompositeComponent(parent_product_id=item.id, component_product_id=part.id, quantity=Decimal("1"), unit_id=unit.id)
+            for part in recipe
+        )
+    db.add_all(
+        Stock(location_id=loc.id, product_id=item.id, quantity=Decimal("1000000"), unit_id=unit.id) for item in parts + sets
+    )
+    db.commit()
+    return loc.id, [item.id for item in sets]
+
+
+def sell_sequential(db, location_id: int, product_id: int) -> None:
+    def lock(pid):
+        stock = db.query(Stock).filter_by(location_id=location_id, product_id=pid).with_for_update().one()
+        time.sleep(ROUND_TRIP_SECONDS)
+        return stock
+
+    lock(product_id).quantity -= 1
+    for comp in db.query(CompositeComponent).filter_by(parent_product_id=product_id).order_by(CompositeComponent.id):
+        lock(comp.component_product_id).quantity -= comp.quantity
+
+
+def sell_ordered(db, location_id: int, product_id: int) -> None:
+    required = BomExpander(db).flatten(product_id)
+    stocks = StockService(db).lock_stocks((location_id, pid) for pid in [product_id, *required])
+    time.sleep(ROUND_TRIP_SECONDS)
+    stocks[(location_id, product_id)].quantity -= 1
+    for component_id, per_unit in required.items():
+        stocks[(location_id, component_id)].quantity -= per_unit
+
+
+def sell_atomic(db, location_id: int, product_id: int) -> None:
+    required = BomExpander(db).flatten(product_id)
+    StockService(db).debit(location_id, {**required, product_id: Decimal("1")})
+    time.sleep(ROUND_TRIP_SECONDS)
+
+
+SELLERS = {"sequential": sell_sequential, "ordered": sell_ordered, "atomic": sell_atomic}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locking", choices=sorted(SELLERS), default="ordered")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--sales", type=int, default=200, help="sales per thread")
+    parser.add_argument("--composites", type=int, default=4)
+    parser.add_argument("--components", type=int, default=5)
+    args = parser.parse_args()
+
+    # Same bookkeeping as the API, so every locking mode pays for totals and audit
+    audit_listeners.register_listeners()
+    stock_totals.register_listeners()
+    engine = create_engine(get_settings().database_url, pool_size=args.threads, max_overflow=0)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, expire_on_commit=False)
+    with Session() as db:
+        location_id, composites = seed(db, args.composites, args.components)
+
+    sell = SELLERS[args.locking]
+    counts = {"sold": 0, "deadlocks": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def worker(seed_value: int) -> None:
+        rng = random.Random(seed_value)
+        for _ in range(args.sales):
+            with Session() as db:
+                try:
+                    sell(db, location_id, rng.choice(composites))
+                    db.commit()
+                    outcome = "sold"
+                except DBAPIError as exc:
+                    db.rollback()
+                    outcome = "deadlocks" if "deadlock" in str(exc.orig).lower() else "errors"
+            with lock:
+                counts[outcome] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    print(
+        f"{args.locking}: {counts['sold']} sold, {counts['deadlocks']} deadlocks, {counts['errors']} errors "
+        f"in {elapsed:.1f}s  ({counts['sold'] / elapsed:.1f} sales/s)"
+    )
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
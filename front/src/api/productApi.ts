@@ -132,6 +132,12 @@ export interface Product {
   components: Array<{ componentProductId: number; quantity: number }>
 }
 
+export interface ProductPage {
+  items: Product[]
+  nextCursor: string | null
+  total: number | null  // only returned for the first page
+}
+
 export interface Location {
   id: number
   name: string
@@ -185,6 +191,20 @@ export const productApi = {
     return res.data;
   },
 
+  async getProductsPage(params?: { locationId?: number; productTypeId?: number; cursor?: string | null; limit?: number }): Promise<ProductPage> {
+    const queryParams = new URLSearchParams();
+    if (params?.locationId) queryParams.append('location_id', params.locationId.toString());
+    if (params?.productTypeId) queryParams.append('product_type_id', params.productTypeId.toString());
+    if (params?.cursor) queryParams.append('cursor', params.cursor);
+    if (params?.limit !== undefined) queryParams.append('limit', params.limit.toString());
+
+    const queryString = queryParams.toString();
+    const url = queryString ? `/products/page/?${queryString}` : '/products/page/';
+
+    const res = await api.get<ProductPage>(url);
+    return res.data;
+  },
+
   async getProductsCount(params?: { locationId?: number; productTypeId?: number }): Promise<number> {
     const queryParams = new URLSearchParams();
     if (params?.locationId) queryParams.append('location_id', params.locationId.toString());